@@ -0,0 +1,200 @@
+"""
+Feed ingestion benchmark
+
+Serves synthetic RSS 2.0, Atom and torznab feeds of increasing size from
+localhost and runs `WatchRSS.check` with `RSSHandler.on_new_entries` end to
+end, so every entry is new. Reports wall time split into fetch, parse and
+ingest, peak Python memory and database operations per entry.
+
+mongomock checks unique indexes with a scan of the collection, so ingestion
+of more than a few thousand entries should be measured against a real
+`mongod` (`--mongo-url`), or skipped with `--no-ingest`.
+
+    python benchmarks/bench_feeds.py --sizes 100,1000,10000,50000 --no-ingest
+"""
+
+import argparse
+import json
+import logging
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import standins
+from feeds import DIALECTS, FeedServer, generate
+
+STAGES = ("feed_fetch", "feed_parse", "entry_filter", "ingest_batch")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="100,1000",
+        help="comma separated number of items per feed",
+    )
+    parser.add_argument(
+        "--dialects",
+        default=",".join(DIALECTS),
+        help=f"comma separated subset of {', '.join(DIALECTS)}",
+    )
+    parser.add_argument(
+        "--trackers", type=int, default=10, help="trackers per magnet link"
+    )
+    parser.add_argument(
+        "--no-ingest",
+        action="store_true",
+        help="reject every entry in the hook, measuring fetch and parse only",
+    )
+    parser.add_argument(
+        "--exclude-patterns",
+        type=int,
+        default=0,
+        help="exclude patterns of an entry filter applied to every feed",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="skip the second, traced run measuring peak memory",
+    )
+    parser.add_argument(
+        "--mongo-url",
+        help="use a real mongod or a sqlite:/// file instead of mongomock",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    counter = standins.setup(args.mongo_url)
+
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    from rssbox.database import get_database
+    from rssbox.handlers.rss_handler import RSSHandler
+    from rssbox.hooks.hook import Hook
+    from rssbox.modules.entry_filter import ALL_FEEDS, EntryFilters
+    from rssbox.modules.metrics import stage_seconds
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    database = get_database()
+    with counter.paused():
+        database.migrate()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    dialects = [dialect.strip() for dialect in args.dialects.split(",")]
+    documents = {
+        f"/{dialect}/{size}": generate(dialect, size, trackers=args.trackers)
+        for dialect in dialects
+        for size in sizes
+    }
+    scheduler = BackgroundScheduler(timezone="UTC")
+
+    class RejectingHook(Hook):
+        def on_new_entry(self, entry):
+            return False
+
+    hook = RejectingHook() if args.no_ingest else Hook()
+
+    entry_filters = None
+    if args.exclude_patterns:
+        with counter.paused():
+            database.entry_filters.replace_one(
+                {"_id": ALL_FEEDS},
+                {
+                    "exclude": [
+                        rf"\bnomatch{index}\b" for index in range(args.exclude_patterns)
+                    ]
+                },
+                upsert=True,
+            )
+        entry_filters = EntryFilters(
+            database.entry_filters,
+            database.downloads,
+            database.download_history,
+            reload_interval=3600,
+        )
+
+    def run_once(url: str, traced: bool):
+        with counter.paused():
+            database.downloads.delete_many({})
+            database.watchrss.delete_many({})
+            handler = RSSHandler(
+                rss_url=url,
+                scheduler=scheduler,
+                db=database.watchrss,
+                downloads_db=database.downloads,
+                hook=hook,
+                entry_filters=entry_filters,
+            )
+            handler.watch_rss.update_last_saved_on(
+                datetime(2000, 1, 1, tzinfo=timezone.utc)
+            )
+
+        counter.reset()
+        stages = {stage: stage_seconds.sum(stage=stage) for stage in STAGES}
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        handler.watch_rss.check()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if traced else None
+        if traced:
+            tracemalloc.stop()
+
+        for stage in STAGES:
+            stages[stage] = stage_seconds.sum(stage=stage) - stages[stage]
+        with counter.paused():
+            ingested = database.downloads.count_documents({})
+        return elapsed, stages, peak, ingested, counter.total
+
+    results = []
+    with FeedServer(documents) as server:
+        for path, body in documents.items():
+            _, dialect, size = path.split("/")
+            elapsed, stages, _, ingested, operations = run_once(
+                server.url(path), traced=False
+            )
+            peak = None
+            if not args.no_memory:
+                _, _, peak, _, _ = run_once(server.url(path), traced=True)
+
+            results.append(
+                {
+                    "dialect": dialect,
+                    "items": int(size),
+                    "bytes": len(body),
+                    "ingested": ingested,
+                    "seconds": round(elapsed, 3),
+                    "fetch_seconds": round(stages["feed_fetch"], 3),
+                    "parse_seconds": round(stages["feed_parse"], 3),
+                    "filter_seconds": round(stages["entry_filter"], 3),
+                    "ingest_seconds": round(stages["ingest_batch"], 3),
+                    "peak_memory_mib": (
+                        round(peak / 1024**2, 1) if peak is not None else None
+                    ),
+                    "mongo_operations_per_entry": round(operations / int(size), 2),
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    widths = {
+        column: max(len(str(result[column])) for result in results + [{column: column}])
+        + 2
+        for column in results[0]
+    }
+    print("".join(f"{column:>{width}}" for column, width in widths.items()))
+    for result in results:
+        print("".join(f"{str(result[c]):>{width}}" for c, width in widths.items()))
+
+
+if __name__ == "__main__":
+    main()
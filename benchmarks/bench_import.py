@@ -0,0 +1,148 @@
+"""
+Import and startup time benchmark
+
+Times fresh interpreters importing rssbox entry points, minus the time of an
+interpreter that imports nothing, and fails when the median of any target is
+over its budget. The database points at a closed port, so anything connecting
+at import time blows the budget by the server selection timeout.
+
+    python benchmarks/bench_import.py --runs 20 --top 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (interpreter arguments, budget in milliseconds)
+TARGETS = {
+    "import rssbox": (["-c", "import rssbox"], 50),
+    "import rssbox.hooks.hook": (["-c", "import rssbox.hooks.hook"], 400),
+    "rssbox --help": (["-m", "rssbox", "--help"], 250),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="runs per target")
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        metavar="TARGET=MS",
+        help="override the budget of a target, e.g. 'import rssbox=30'",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="also list the N slowest modules imported by each target",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def environment() -> dict:
+    scratch = tempfile.mkdtemp(prefix="rssbox-bench-")
+    env = dict(os.environ)
+    env.update(
+        RSS_URL="http://127.0.0.1:1/rss",
+        MONGO_URL="mongodb://127.0.0.1:1/rssbox-bench",
+        LOG_FILE=os.path.join(scratch, "rssbox.log"),
+        DOWNLOAD_PATH=os.path.join(scratch, "downloads"),
+        PYTHONPATH=os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")])),
+    )
+    return env
+
+
+def run(arguments: list, env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *arguments],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def import_times(arguments: list, env: dict) -> dict:
+    """Cumulative import time of every module in milliseconds, from `-X importtime`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules[name.strip()] = int(cumulative) / 1000
+    return modules
+
+
+def main():
+    args = parse_args()
+    env = environment()
+    budgets = {name: budget for name, (_, budget) in TARGETS.items()}
+    for override in args.budget:
+        name, _, budget = override.rpartition("=")
+        if name not in budgets:
+            raise SystemExit(f"Unknown target {name!r}, one of {', '.join(budgets)}")
+        budgets[name] = float(budget)
+
+    startup = import_times(["-c", "pass"], env) if args.top else {}
+    baseline = statistics.median(run(["-c", "pass"], env) for _ in range(args.runs))
+    results = []
+    for name, (arguments, _) in TARGETS.items():
+        timings = sorted(run(arguments, env) - baseline for _ in range(args.runs))
+        median = statistics.median(timings) * 1000
+        result = {
+            "target": name,
+            "median_ms": round(median, 1),
+            "max_ms": round(timings[-1] * 1000, 1),
+            "budget_ms": budgets[name],
+            "ok": median <= budgets[name],
+        }
+        if args.top:
+            # modules the bare interpreter imports too (site, encodings) are startup
+            modules = import_times(arguments, env)
+            slowest = sorted(
+                (ms, module) for module, ms in modules.items() if module not in startup
+            )[::-1][: args.top]
+            result["slowest_modules"] = [
+                (module, round(ms, 1)) for ms, module in slowest
+            ]
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"interpreter startup {baseline * 1000:.1f}ms (subtracted)")
+        for result in results:
+            status = "ok" if result["ok"] else "OVER BUDGET"
+            print(
+                f"{result['target']:<28}{result['median_ms']:>8}ms"
+                f"{result['max_ms']:>9}ms max{result['budget_ms']:>8}ms budget  {status}"
+            )
+            for module, ms in result.get("slowest_modules", []):
+                print(f"    {module:<40}{ms:>8}ms")
+
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
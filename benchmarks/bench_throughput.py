@@ -0,0 +1,316 @@
+"""
+End-to-end throughput benchmark
+
+Runs `--workers` SonicBitClient instances (one thread each) against a local fake
+SonicBit server until every seeded download is uploaded or `--duration` runs
+out, then reports dispatch and completion rates, how often each downloading
+account gets checked and database operations per completed download.
+
+    python benchmarks/bench_throughput.py --accounts 8 --downloads 100 --workers 2
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from threading import Event, Lock, Thread
+
+import standins
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=4)
+    parser.add_argument("--downloads", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=300, help="seconds")
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="seconds per API call"
+    )
+    parser.add_argument(
+        "--add-latency",
+        type=float,
+        default=0.5,
+        help="seconds before an added torrent is listed",
+    )
+    parser.add_argument(
+        "--download-seconds",
+        type=float,
+        default=10,
+        help="mean seconds for a torrent to complete",
+    )
+    parser.add_argument(
+        "--progress-curve",
+        default="linear",
+        choices=["linear", "slow-start", "front-loaded"],
+    )
+    parser.add_argument("--files", type=int, default=1, help="files per torrent")
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="fraction of failed API calls"
+    )
+    parser.add_argument(
+        "--too-large-rate",
+        type=float,
+        default=0.0,
+        help="fraction of torrents rejected as too large",
+    )
+    parser.add_argument(
+        "--upload-seconds", type=float, default=0.5, help="seconds per upload"
+    )
+    parser.add_argument(
+        "--early-upload",
+        action="store_true",
+        help="upload each file as it finishes, `--upload-seconds` split between files",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.1,
+        help="multiplier applied to rssbox's fixed sleeps (1s between verify polls)",
+    )
+    parser.add_argument(
+        "--check-timeout",
+        type=int,
+        default=10,
+        help="DOWNLOAD_CHECK_TIMEOUT for each check pass",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        help="seconds a worker waits after a pass with nothing to do",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="run each worker with SonicBitClient.run instead of one pass per loop",
+    )
+    parser.add_argument(
+        "--mongo-url",
+        help="use a real mongod or a sqlite:/// file instead of mongomock",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    counter = standins.setup(args.mongo_url)
+    os.environ["DOWNLOAD_CHECK_TIMEOUT"] = str(args.check_timeout)
+    os.environ["DOWNLOAD_START_TIMEOUT"] = str(args.check_timeout)
+    os.environ["DISPATCH_INTERVAL"] = str(max(round(args.poll_interval), 1))
+    os.environ["CHECK_INTERVAL"] = str(max(round(args.poll_interval), 1))
+    os.environ["SHUTDOWN_TIMEOUT"] = str(args.check_timeout * 2)
+    # checks are due when torrents are estimated to complete
+    os.environ["CHECK_MIN_DELAY"] = "1"
+    os.environ["CHECK_MAX_DELAY"] = str(max(round(args.download_seconds), 1))
+
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from fake_sonicbit import FakeSonicBit, FakeSonicBitServer
+
+    import rssbox.modules.sonicbit as sonicbit_module
+    from rssbox.database import get_database
+    from rssbox.enum import DownloadStatus
+    from rssbox.handlers.file_handler import FileHandler
+    from rssbox.hooks.hook import Hook
+    from rssbox.modules.download import Download
+    from rssbox.modules.metrics import stage_seconds
+    from rssbox.modules.sonicbit import SonicBit
+    from rssbox.modules.timeline import percentile
+    from rssbox.sonicbit_client import SonicBitClient
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    database = get_database()
+    with counter.paused():
+        database.migrate()
+
+    def scaled_sleep(seconds: float):
+        time.sleep(seconds * args.time_scale)
+
+    sonicbit_module.sleep = scaled_sleep
+
+    lock = Lock()
+    dispatched_at = []
+    last_checked = {}
+    revisit_intervals = []
+
+    mark_as_downloading = SonicBit.mark_as_downloading
+
+    def counted_mark_as_downloading(self, *a, **kw):
+        with lock:
+            dispatched_at.append(time.perf_counter())
+        return mark_as_downloading(self, *a, **kw)
+
+    SonicBit.mark_as_downloading = counted_mark_as_downloading
+
+    class BenchFileHandler(FileHandler):
+        def upload(self, download, torrent) -> int:
+            files = torrent.files
+            time.sleep(args.upload_seconds)
+            return len(files)
+
+    class EarlyBenchFileHandler(FileHandler):
+        def upload_file(self, download, torrent, file) -> bool:
+            time.sleep(args.upload_seconds / max(args.files, 1))
+            return True
+
+    file_handler_class = (
+        EarlyBenchFileHandler if args.early_upload else BenchFileHandler
+    )
+
+    class BenchClient(SonicBitClient):
+        def get_download_to_check(self):
+            sonicbit = super().get_download_to_check()
+            if sonicbit:
+                now = time.perf_counter()
+                with lock:
+                    if sonicbit.id in last_checked:
+                        revisit_intervals.append(now - last_checked[sonicbit.id])
+                    last_checked[sonicbit.id] = now
+            return sonicbit
+
+    rng = random.Random(args.seed)
+    for index in range(args.accounts):
+        email = f"bench{index}@example.com"
+        database.accounts.insert_one(
+            {"_id": email, "password": "bench", "token": email, "priority": 0}
+        )
+    for index in range(args.downloads):
+        hash = "%040x" % rng.getrandbits(160)
+        Download.create(
+            client=database.downloads,
+            name=f"bench-{index}",
+            url=f"magnet:?xt=urn:btih:{hash}&dn=bench-{index}",
+            feed="bench",
+        )
+
+    state = FakeSonicBit(
+        latency=args.latency,
+        add_latency=args.add_latency,
+        download_seconds=args.download_seconds,
+        progress_curve=args.progress_curve,
+        files_per_torrent=args.files,
+        failure_rate=args.failure_rate,
+        too_large_rate=args.too_large_rate,
+        seed=args.seed,
+    )
+    stop = Event()
+
+    def remaining() -> int:
+        with counter.paused():
+            return database.downloads.count_documents(
+                {
+                    "status": {
+                        "$in": [
+                            DownloadStatus.PENDING.value,
+                            DownloadStatus.PROCESSING.value,
+                        ]
+                    }
+                }
+            )
+
+    def run_worker(index: int):
+        scheduler = BackgroundScheduler(timezone="UTC")
+        scheduler.start()
+        client = BenchClient(
+            database.accounts,
+            database.slots,
+            database.downloads,
+            database.workers,
+            scheduler,
+            file_handler_class(),
+            Hook(),
+            f"bench-{index}",
+        )
+        if args.daemon:
+            client.run(stop)
+        else:
+            with client.heartbeat:
+                while not stop.is_set():
+                    checks = stage_seconds.count(stage="check_iteration")
+                    client.start_downloads()
+                    client.check_downloads()
+                    uploaded = client.upload_downloads()
+                    if (
+                        stage_seconds.count(stage="check_iteration") == checks
+                        and not uploaded
+                    ):
+                        stop.wait(args.poll_interval)
+        scheduler.shutdown(wait=False)
+
+    counter.reset()
+    with FakeSonicBitServer(state):
+        started = time.perf_counter()
+        threads = [
+            Thread(target=run_worker, args=(index,), daemon=True)
+            for index in range(args.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        while time.perf_counter() - started < args.duration:
+            if not remaining():
+                break
+            time.sleep(0.5)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=args.check_timeout * 2)
+
+    with counter.paused():
+        completed = database.download_history.count_documents({})
+        # seconds from the torrent being added to its last file uploaded
+        turnaround = sorted(
+            (
+                history["timeline"]["uploaded"] - history["timeline"]["added"]
+            ).total_seconds()
+            for history in database.download_history.find()
+            if {"added", "uploaded"} <= history.get("timeline", {}).keys()
+        )
+    revisit_intervals.sort()
+    results = {
+        "accounts": args.accounts,
+        "downloads": args.downloads,
+        "workers": args.workers,
+        "elapsed_seconds": round(elapsed, 2),
+        "dispatched": len(dispatched_at),
+        "dispatched_per_minute": round(len(dispatched_at) / elapsed * 60, 2),
+        "completed": completed,
+        "completed_per_minute": round(completed / elapsed * 60, 2),
+        "check_sweep_p50_seconds": (
+            round(percentile(revisit_intervals, 50), 3) if revisit_intervals else None
+        ),
+        "check_sweep_p95_seconds": (
+            round(percentile(revisit_intervals, 95), 3) if revisit_intervals else None
+        ),
+        "turnaround_p50_seconds": (
+            round(percentile(turnaround, 50), 3) if turnaround else None
+        ),
+        "turnaround_p95_seconds": (
+            round(percentile(turnaround, 95), 3) if turnaround else None
+        ),
+        "check_iterations": stage_seconds.count(stage="check_iteration"),
+        "mongo_operations": counter.total,
+        "mongo_operations_per_download": (
+            round(counter.total / completed, 1) if completed else None
+        ),
+        "mongo_operations_by_type": dict(sorted(counter.counts.items())),
+        "api_requests": dict(sorted(state.requests.items())),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:<32}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+State transition benchmark
+
+Runs `--threads` threads that each claim an idle account slot and a pending
+download, move them to downloading and back to idle and pending, the way the
+dispatch and check loops do. `--interference` threads meanwhile rewrite random
+processing downloads from stale copies, the way a worker that lost a race
+would. Reports transition latency and how many transitions failed with
+`StaleStateError`.
+
+The default compares ordered conditional writes with multi-document
+transactions (`USE_TRANSACTIONS`). mongomock has no transactions, so the
+transactional mode only costs anything against a replica set (`--mongo-url`).
+
+    python benchmarks/bench_transitions.py --threads 8 --duration 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from threading import Event, Lock, Thread
+
+import standins
+
+MODES = ("optimistic", "transactions")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=MODES, help="run a single mode")
+    parser.add_argument("--accounts", type=int, default=16)
+    parser.add_argument("--downloads", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--interference", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=5, help="seconds per mode")
+    parser.add_argument(
+        "--mongo-url",
+        help="use a real mongod or a sqlite:/// file instead of mongomock",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def run_mode(args) -> dict:
+    os.environ["USE_TRANSACTIONS"] = "true" if args.mode == "transactions" else ""
+    counter = standins.setup(args.mongo_url)
+
+    from pymongo import ReturnDocument
+
+    from rssbox.database import get_database
+    from rssbox.enum import DownloadStatus, SonicBitStatus
+    from rssbox.modules.download import Download
+    from rssbox.modules.errors import StaleStateError
+    from rssbox.modules.slots import sync_slots
+    from rssbox.modules.sonicbit import SonicBit
+    from rssbox.modules.timeline import percentile
+
+    logging.basicConfig(level=logging.WARNING)
+    database = get_database()
+    with counter.paused():
+        database.migrate()
+        database.accounts.delete_many({})
+        database.slots.delete_many({})
+        database.downloads.delete_many({})
+        database.accounts.insert_many(
+            [
+                {
+                    "_id": f"account-{index}@bench",
+                    "password": "bench",
+                    "token": "bench",
+                }
+                for index in range(args.accounts)
+            ]
+        )
+        sync_slots(database.accounts, database.slots)
+        accounts = {account["_id"]: account for account in database.accounts.find()}
+        for index in range(args.downloads):
+            Download.create(
+                database.downloads, f"download-{index}", f"magnet:?xt={index}"
+            )
+
+    lock = Lock()
+    latencies = []
+    outcomes = {"transitions": 0, "conflicts": 0, "interfered": 0}
+    stop = Event()
+
+    def record(name: str, seconds: float | None = None):
+        with lock:
+            outcomes[name] += 1
+            if seconds is not None:
+                latencies.append(seconds)
+
+    def transitions():
+        while not stop.is_set():
+            slot = database.slots.find_one_and_update(
+                {"status": SonicBitStatus.IDLE.value},
+                {
+                    "$set": {"status": SonicBitStatus.PROCESSING.value},
+                    "$inc": {"version": 1},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if not slot:
+                time.sleep(0.001)
+                continue
+            raw_download = database.downloads.find_one_and_update(
+                {"status": DownloadStatus.PENDING.value, "locked_by": None},
+                {"$set": {"locked_by": "bench"}, "$inc": {"version": 1}},
+                return_document=ReturnDocument.AFTER,
+            )
+            sonicbit = SonicBit(database.accounts, accounts[slot["account"]], slot)
+            if not raw_download:
+                sonicbit.mark_as_idle()
+                continue
+
+            download = Download(database.downloads, raw_download)
+            started = time.perf_counter()
+            try:
+                sonicbit.mark_as_downloading(download, hash=str(download.id))
+                sonicbit.reset()
+                record("transitions", time.perf_counter() - started)
+            except StaleStateError:
+                record("conflicts")
+                # put both back the way WorkerHandler would
+                database.slots.update_one(
+                    {"_id": sonicbit.id},
+                    {
+                        "$set": {"status": SonicBitStatus.IDLE.value},
+                        "$inc": {"version": 1},
+                    },
+                )
+                database.downloads.update_one(
+                    {"_id": download.id},
+                    {
+                        "$set": {
+                            "status": DownloadStatus.PENDING.value,
+                            "locked_by": None,
+                        },
+                        "$inc": {"version": 1},
+                    },
+                )
+
+    def interference():
+        while not stop.is_set():
+            raw_download = database.downloads.find_one(
+                {"status": DownloadStatus.PROCESSING.value}
+            )
+            if not raw_download:
+                time.sleep(0.001)
+                continue
+            try:
+                Download(database.downloads, raw_download).mark_as_pending()
+                record("interfered")
+            except StaleStateError:
+                pass
+
+    threads = [Thread(target=transitions) for _ in range(args.threads)]
+    threads += [Thread(target=interference) for _ in range(args.interference)]
+    counter.reset()
+    for thread in threads:
+        thread.start()
+    stop.wait(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    attempts = outcomes["transitions"] + outcomes["conflicts"]
+    return {
+        "mode": args.mode,
+        "transitions_per_second": round(outcomes["transitions"] / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "conflicts": outcomes["conflicts"],
+        "conflict_rate": round(outcomes["conflicts"] / attempts, 4) if attempts else 0,
+        "interfering_writes": outcomes["interfered"],
+        "mongo_operations_per_transition": (
+            round(counter.total / outcomes["transitions"], 1)
+            if outcomes["transitions"]
+            else None
+        ),
+    }
+
+
+def main():
+    args = parse_args()
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    # Config is read once per process, every mode runs in a fresh interpreter
+    results = []
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, *sys.argv[1:]],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(result["mode"])
+        for key, value in result.items():
+            if key != "mode":
+                print(f"    {key:<34}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Fake SonicBit API for benchmarks
+
+Implements the subset of the SonicBit HTTP API used by rssbox (login, torrent
+add/list/details/delete and storage clear) with configurable latency, torrent
+progress curves and failure injection. Accounts are identified by their bearer
+token, which benchmarks seed as the account email. `FakeSonicBitServer` serves
+it over HTTP, `FakeSonicBitTransport` answers the SDK's requests in process,
+so simulations on a virtual clock don't wait on sockets.
+"""
+
+import json
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from requests import Response
+from requests.adapters import BaseAdapter
+
+PROGRESS_CURVES: Dict[str, Callable[[float], float]] = {
+    "linear": lambda fraction: fraction,
+    "slow-start": lambda fraction: fraction**2,
+    "front-loaded": lambda fraction: fraction**0.5,
+}
+
+
+@dataclass
+class FakeTorrent:
+    hash: str
+    name: str
+    size: int
+    added_at: float
+    visible_at: float
+    duration: float
+    files: int
+    deleted_reason: str | None = None
+
+    def progress(self, now: float, curve: Callable[[float], float]) -> int:
+        if now < self.visible_at:
+            return 0
+        fraction = (now - self.visible_at) / self.duration if self.duration else 1
+        return int(min(100, curve(fraction) * 100)) if fraction < 1 else 100
+
+
+@dataclass
+class FakeSonicBit:
+    """In-memory SonicBit state, shared by every account's requests"""
+
+    latency: float = 0.0  # seconds added to every request
+    add_latency: float = 1.0  # seconds before an added torrent shows up in the list
+    download_seconds: float = 60.0  # mean seconds for a torrent to reach 100%
+    download_jitter: float = 0.2  # +/- fraction applied to `download_seconds`
+    progress_curve: str = "linear"
+    files_per_torrent: int = 1
+    failure_rate: float = 0.0  # fraction of requests answered with a HTTP 500
+    too_large_rate: float = 0.0  # fraction of added torrents rejected as too large
+    storage_limit: int = 2 * 1024**4
+    clock: Callable[[], float] = time.monotonic
+    sleep: Callable[[float], None] = time.sleep
+    seed: int | None = None
+    # torrent hash to overrides of size, add_latency, download_seconds and too_large
+    profiles: Dict[str, dict] = field(default_factory=dict)
+
+    torrents: Dict[str, Dict[str, FakeTorrent]] = field(default_factory=dict)
+    requests: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._lock = Lock()
+        self._random = random.Random(self.seed)
+        self._curve = PROGRESS_CURVES[self.progress_curve]
+
+    def handle(
+        self, path: str, query: Dict[str, List[str]], body: bytes, token: str | None
+    ) -> Tuple[int, dict | list | str]:
+        if self.latency:
+            self.sleep(self.latency)
+
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                return 500, "<html>Internal Server Error</html>"
+
+            if path == "/api/web/login":
+                email = json.loads(body or b"{}").get("email", "")
+                return 200, {
+                    "success": {
+                        "token": email,
+                        "session": email,
+                        "require_2fa_verification": False,
+                    }
+                }
+            if token is None:
+                return 401, {"message": "Unauthenticated."}
+
+            account = self.torrents.setdefault(token, {})
+            if path == "/api/app/seedbox/torrent/add":
+                return 200, self._add(account, query.get("url_list[]", []))
+            if path == "/api/app/seedbox/torrent/list":
+                return 200, self._list(token, account)
+            if path == "/api/app/seedbox/torrent/details":
+                return 200, self._details(account, query.get("hash", [""])[0])
+            if path == "/api/app/seedbox/torrent/delete":
+                return 200, self._delete(account, query.get("hash_list[]", []))
+            if path == "/api/user/drive/clear":
+                return 200, {"success": True}
+
+        return 404, {"message": f"Unknown path {path}"}
+
+    def _add(self, account: Dict[str, FakeTorrent], uris: List[str]) -> dict:
+        now = self.clock()
+        added = []
+        for index, uri in enumerate(uris):
+            match = re.search(r"xt=urn:btih:([a-zA-Z0-9]+)", uri)
+            if not match:
+                continue
+            hash = match.group(1).upper()
+            name = parse_qs(urlsplit(uri).query).get("dn", [hash])[0]
+            profile = self.profiles.get(hash, {})
+            jitter = 1 + self._random.uniform(-1, 1) * self.download_jitter
+            too_large = profile.get(
+                "too_large",
+                bool(self.too_large_rate)
+                and self._random.random() < self.too_large_rate,
+            )
+            account[hash] = FakeTorrent(
+                hash=hash,
+                name=name,
+                size=profile.get("size") or self._random.randint(200, 4000) * 1024**2,
+                added_at=now,
+                visible_at=now + profile.get("add_latency", self.add_latency),
+                duration=profile.get(
+                    "download_seconds", self.download_seconds * jitter
+                ),
+                files=self.files_per_torrent,
+                deleted_reason=(
+                    "torsize_large_than_torsize_allowed" if too_large else None
+                ),
+            )
+            added.append(index)
+        return {"success": bool(added), "added": added}
+
+    def _list(self, email: str, account: Dict[str, FakeTorrent]) -> dict:
+        now = self.clock()
+        torrents = {}
+        for hash, torrent in account.items():
+            if now < torrent.visible_at:
+                continue
+            torrents[hash] = {
+                "name": torrent.name,
+                "hash": hash,
+                "sizeBytes": str(torrent.size),
+                "percentComplete": str(torrent.progress(now, self._curve)),
+                "dlRateValue": round(
+                    torrent.size / (torrent.duration or 1) / 1024**2, 2
+                ),
+                "dlRateUnit": "MB/s",
+                "upRateValue": "N/A",
+                "peersStatus": "0 (0)",
+                "seedsStatus": "0 (0)",
+                "t_added": str(int(time.time())),
+                "isMultiFile": "1" if torrent.files > 1 else "0",
+                "status": ["downloading"],
+                "isPrivate": "Public",
+                "in_cache": False,
+                "deleted": torrent.deleted_reason is not None,
+                "deleted_reason": torrent.deleted_reason,
+            }
+        used = sum(torrent.size for torrent in account.values())
+        return {
+            "list": torrents,
+            "info": {
+                "downloadRate": "0",
+                "uploadRate": "0",
+                "sizeByteTotal": str(used),
+                "sizeByteLimit": str(self.storage_limit),
+                "percent": str(round(used / self.storage_limit * 100, 2)),
+                "max_prallel": "10",
+                "email": email,
+                "userftp": email,
+                "package": "fake",
+                "seedbox_status_up": True,
+                "hash_list": list(torrents),
+            },
+        }
+
+    def _details(self, account: Dict[str, FakeTorrent], hash: str) -> list | dict:
+        torrent = account.get(hash)
+        if not torrent:
+            return {"message": "Torrent not found"}
+
+        now = self.clock()
+        files = []
+        for index in range(torrent.files):
+            # files finish one after another over the torrent's duration
+            file_end = (
+                torrent.visible_at + torrent.duration * (index + 1) / torrent.files
+            )
+            file_start = file_end - torrent.duration / torrent.files
+            fraction = (now - file_start) / (file_end - file_start or 1)
+            name = f"{torrent.name}.E{index + 1:02d}.mkv"
+            files.append(
+                {
+                    "filename": name,
+                    "sizeBytes": torrent.size // torrent.files,
+                    "tor_path": f"/{torrent.name}/{name}",
+                    "name": torrent.name,
+                    "mydrive_path": f"/{torrent.name}/{name}",
+                    "percentComplete": int(max(0, min(1, fraction)) * 100),
+                    "ext": "mkv",
+                    "priority": 1,
+                    "index": index,
+                    "dl_url": f"https://fake.sonicbit/{hash}/{index}",
+                    "hash_code": f"{hash}-{index}",
+                }
+            )
+        return files
+
+    def _delete(self, account: Dict[str, FakeTorrent], hashes: List[str]) -> dict:
+        return {hash: account.pop(hash, None) is not None for hash in hashes}
+
+
+class _FakeSonicBitRequestHandler(BaseHTTPRequestHandler):
+    state: FakeSonicBit
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        parts = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        authorization = self.headers.get("Authorization", "")
+        token = authorization[7:] if authorization.startswith("Bearer ") else None
+
+        status, payload = self.state.handle(
+            parts.path, parse_qs(parts.query), body, token
+        )
+        data = (
+            payload.encode()
+            if isinstance(payload, str)
+            else json.dumps(payload).encode()
+        )
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSonicBitServer:
+    """Serves a `FakeSonicBit` on localhost and points the SonicBit SDK at it"""
+
+    def __init__(self, state: FakeSonicBit, host: str = "127.0.0.1", port: int = 0):
+        self.state = state
+        handler = type(
+            "FakeSonicBitRequestHandler",
+            (_FakeSonicBitRequestHandler,),
+            {"state": state},
+        )
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def __enter__(self):
+        from sonicbit.constants import Constants
+
+        self._original_base_url = Constants.API_BASE_URL
+        Constants.API_BASE_URL = self.base_url
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        from sonicbit.constants import Constants
+
+        Constants.API_BASE_URL = self._original_base_url
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+
+class _FakeSonicBitAdapter(BaseAdapter):
+    def __init__(self, state: FakeSonicBit):
+        super().__init__()
+        self.state = state
+
+    def send(self, request, **kwargs) -> Response:
+        parts = urlsplit(request.url)
+        body = request.body or b""
+        authorization = request.headers.get("Authorization", "")
+        token = authorization[7:] if authorization.startswith("Bearer ") else None
+
+        status, payload = self.state.handle(
+            parts.path,
+            parse_qs(parts.query),
+            body.encode() if isinstance(body, str) else body,
+            token,
+        )
+        response = Response()
+        response.status_code = status
+        response._content = (
+            payload.encode()
+            if isinstance(payload, str)
+            else json.dumps(payload).encode()
+        )
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeSonicBitTransport:
+    """Answers requests of every SonicBit SDK session from a `FakeSonicBit` in process"""
+
+    BASE_URL = "http://fake.sonicbit/api"
+
+    def __init__(self, state: FakeSonicBit):
+        self.state = state
+
+    def __enter__(self):
+        from sonicbit.base import SonicBitBase
+        from sonicbit.constants import Constants
+
+        self._original_base_url = Constants.API_BASE_URL
+        self._original_init = SonicBitBase.__init__
+        adapter = _FakeSonicBitAdapter(self.state)
+        original_init = self._original_init
+
+        def init(base, *args, **kwargs):
+            original_init(base, *args, **kwargs)
+            base.session.mount(self.BASE_URL, adapter)
+
+        Constants.API_BASE_URL = self.BASE_URL
+        SonicBitBase.__init__ = init
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        from sonicbit.base import SonicBitBase
+        from sonicbit.constants import Constants
+
+        Constants.API_BASE_URL = self._original_base_url
+        SonicBitBase.__init__ = self._original_init
+        return False
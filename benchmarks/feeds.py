@@ -0,0 +1,141 @@
+"""
+Synthetic feed documents for benchmarks
+
+Generates RSS 2.0, Atom and torznab feeds of any size, newest entry first like
+real indexers, and serves them from a local HTTP server.
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Dict
+from xml.sax.saxutils import escape
+
+DIALECTS = ("rss", "atom", "torznab")
+
+TRACKERS = [f"udp://tracker{index}.example.org:1337/announce" for index in range(50)]
+
+
+def magnet(rng: random.Random, name: str, trackers: int) -> str:
+    hash = "%040x" % rng.getrandbits(160)
+    uri = f"magnet:?xt=urn:btih:{hash}&dn={name}"
+    for tracker in rng.sample(TRACKERS, min(trackers, len(TRACKERS))):
+        uri += f"&tr={tracker}"
+    return uri
+
+
+def generate(
+    dialect: str,
+    items: int,
+    newest: datetime | None = None,
+    spacing: timedelta = timedelta(minutes=1),
+    trackers: int = 10,
+    seed: int = 1,
+) -> bytes:
+    rng = random.Random(seed)
+    newest = newest or datetime.now(timezone.utc).replace(microsecond=0)
+    parts = [_header(dialect)]
+    for index in range(items):
+        published = newest - spacing * index
+        name = f"Show.Name.S{index // 100 + 1:02d}E{index % 100 + 1:02d}.1080p.WEB.x264-GRP{index}"
+        link = escape(magnet(rng, name, trackers))
+        size = rng.randint(200, 8000) * 1024**2
+        parts.append(_item(dialect, index, name, link, published, size))
+    parts.append(_footer(dialect))
+    return "".join(parts).encode("utf-8")
+
+
+def _header(dialect: str) -> str:
+    if dialect == "atom":
+        return (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom">'
+            "<title>Synthetic</title><id>urn:synthetic</id>"
+            f"<updated>{datetime.now(timezone.utc).isoformat()}</updated>"
+        )
+    namespaces = ' xmlns:atom="http://www.w3.org/2005/Atom"'
+    if dialect == "torznab":
+        namespaces += ' xmlns:torznab="http://torznab.com/schemas/2015/feed"'
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<rss version="2.0"{namespaces}><channel>'
+        "<title>Synthetic</title><link>http://127.0.0.1/</link>"
+        "<description>Synthetic feed</description>"
+    )
+
+
+def _item(
+    dialect: str, index: int, name: str, link: str, published: datetime, size: int
+) -> str:
+    if dialect == "atom":
+        return (
+            f"<entry><title>{name}</title>"
+            f'<link href="{link}"/>'
+            f"<id>urn:synthetic:{index}</id>"
+            f"<published>{published.isoformat()}</published>"
+            f"<updated>{published.isoformat()}</updated>"
+            f"<summary>{name}</summary></entry>"
+        )
+    item = (
+        f"<item><title>{name}</title>"
+        f'<guid isPermaLink="false">synthetic-{index}</guid>'
+        f"<link>{link}</link>"
+        f"<pubDate>{format_datetime(published)}</pubDate>"
+        f"<description>{name}</description>"
+    )
+    if dialect == "torznab":
+        item += (
+            f'<enclosure url="{link}" length="{size}" type="application/x-bittorrent"/>'
+            f"<category>5040</category>"
+            f'<torznab:attr name="category" value="5040"/>'
+            f'<torznab:attr name="size" value="{size}"/>'
+            f'<torznab:attr name="seeders" value="{index % 97}"/>'
+            f'<torznab:attr name="peers" value="{index % 131}"/>'
+        )
+    return item + "</item>"
+
+
+def _footer(dialect: str) -> str:
+    return "</feed>" if dialect == "atom" else "</channel></rss>"
+
+
+class FeedServer:
+    """Serves `documents` (path -> body) on localhost"""
+
+    def __init__(self, documents: Dict[str, bytes], host: str = "127.0.0.1"):
+        self.documents = documents
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.documents.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/rss+xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
@@ -0,0 +1,416 @@
+"""
+Offline replay simulator
+
+Replays RSS entries and their SonicBit behaviour (add latency, download time,
+size, rejections) through the real `RSSHandler` and `SonicBitClient` daemon
+loops on a virtual clock, against the fake SonicBit API and an in-memory
+database. Each scenario of the `--accounts`, `--workers`, `--rss-interval` and
+`--set` grid runs in a fresh interpreter, so settings read at import time
+(`DOWNLOAD_TIMEOUT`, `CHECK_INTERVAL`, ...) apply, and reports throughput,
+queue growth and time to complete in virtual time.
+
+Entries come from a `--trace` of JSON lines, `{"at": seconds after the start,
+"title", "link", "size", "add_latency", "download_seconds", "upload_seconds",
+"too_large"}` with everything but `at` optional, or are generated at `--rate`
+per hour. `--export-history` writes such a trace from the `download_history`
+collection of a real database. Feeds are handed to `RSSHandler.on_new_entries`
+every `--rss-interval` seconds, fetching and parsing are measured by
+`bench_feeds.py` instead.
+
+    python benchmarks/simulate.py --hours 24 --rate 20 --accounts 4,8 \\
+        --set DOWNLOAD_TIMEOUT=3600,9000 --set CHECK_INTERVAL=10,60
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import standins
+
+# virtual start of every simulation
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+FEED_URL = "http://simulated.feed/rss"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--trace", help="JSON lines of entries to replay")
+    parser.add_argument(
+        "--export-history",
+        metavar="MONGO_URL",
+        help="print a trace of the download_history collection and exit",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=10, help="generated entries per hour"
+    )
+    parser.add_argument(
+        "--hours", type=float, default=24, help="hours of generated entries"
+    )
+    parser.add_argument(
+        "--max-hours",
+        type=float,
+        default=None,
+        help="virtual hours after which a scenario stops draining the queue, twice the trace by default",
+    )
+    parser.add_argument("--accounts", default="4", help="comma separated counts")
+    parser.add_argument("--workers", default="1", help="comma separated counts")
+    parser.add_argument(
+        "--rss-interval",
+        default="180",
+        help="comma separated seconds between feed checks",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=V1,V2",
+        help="environment setting to vary, e.g. DOWNLOAD_TIMEOUT=3600,9000",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.3, help="seconds per API call"
+    )
+    parser.add_argument(
+        "--add-latency",
+        type=float,
+        default=5,
+        help="seconds before an added torrent is listed",
+    )
+    parser.add_argument(
+        "--download-seconds",
+        type=float,
+        default=1800,
+        help="mean seconds for a torrent to complete",
+    )
+    parser.add_argument(
+        "--upload-bandwidth",
+        type=float,
+        default=50,
+        help="MiB/s uploaded when an entry has no upload_seconds",
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="fraction of failed API calls"
+    )
+    parser.add_argument(
+        "--too-large-rate",
+        type=float,
+        default=0.0,
+        help="fraction of generated torrents rejected as too large",
+    )
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def generate_trace(args) -> list:
+    rng = random.Random(args.seed)
+    entries = []
+    at = 0.0
+    while args.rate:
+        at += rng.expovariate(args.rate / 3600)
+        if at > args.hours * 3600:
+            break
+        hash = "%040x" % rng.getrandbits(160)
+        name = f"Simulated.S01E{len(entries) + 1:03d}.1080p"
+        entries.append(
+            {
+                "at": round(at, 1),
+                "title": name,
+                "link": f"magnet:?xt=urn:btih:{hash}&dn={name}",
+                "size": rng.randint(200, 8000) * 1024**2,
+                "download_seconds": round(
+                    rng.lognormvariate(0, 0.5) * args.download_seconds, 1
+                ),
+                "too_large": rng.random() < args.too_large_rate,
+            }
+        )
+    return entries
+
+
+def read_trace(path: str) -> list:
+    rng = random.Random(0)
+    entries = []
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "link" not in entry:
+                hash = "%040x" % rng.getrandbits(160)
+                entry["link"] = f"magnet:?xt=urn:btih:{hash}"
+            entry.setdefault("title", f"Replayed.{len(entries) + 1}")
+            entries.append(entry)
+    return sorted(entries, key=lambda entry: entry["at"])
+
+
+def export_history(mongo_url: str):
+    """Trace of completed downloads: arrival offsets and the time each stage took"""
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_url)
+    records = client.get_default_database()["download_history"].find(
+        {"timeline.ingested": {"$exists": True}}, sort=[("timeline.ingested", 1)]
+    )
+    first = None
+    for record in records:
+        timeline = record["timeline"]
+        first = first or timeline["ingested"]
+        entry = {"at": (timeline["ingested"] - first).total_seconds()}
+        for name, start, end in (
+            ("add_latency", "added", "verified"),
+            ("download_seconds", "verified", "completed"),
+            ("upload_seconds", "completed", "uploaded"),
+        ):
+            if timeline.get(start) and timeline.get(end):
+                entry[name] = (timeline[end] - timeline[start]).total_seconds()
+        print(json.dumps(entry))
+
+
+def scenarios(args) -> list:
+    axes = {
+        "accounts": [int(value) for value in args.accounts.split(",")],
+        "workers": [int(value) for value in args.workers.split(",")],
+        "rss_interval": [float(value) for value in args.rss_interval.split(",")],
+    }
+    for setting in args.set:
+        name, _, values = setting.partition("=")
+        axes[name.strip()] = [value.strip() for value in values.split(",")]
+    return [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+
+
+def simulate(args, scenario: dict) -> dict:
+    for name, value in scenario.items():
+        if name.isupper():
+            os.environ[name] = value
+    counter = standins.setup(rss_url=FEED_URL)
+
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from fake_sonicbit import FakeSonicBit, FakeSonicBitTransport
+    from feedparser import FeedParserDict
+    from virtual_clock import VirtualClock, VirtualEvent, run_actor
+
+    from rssbox.database import get_database
+    from rssbox.enum import DownloadStatus
+    from rssbox.handlers.file_handler import FileHandler
+    from rssbox.handlers.rss_handler import RSSHandler
+    from rssbox.hooks.hook import Hook
+    from rssbox.modules.timeline import percentile, summarize
+    from rssbox.sonicbit_client import SonicBitClient
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.ERROR,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    clock = VirtualClock(EPOCH)
+    clock.patch_modules()
+
+    database = get_database()
+    with counter.paused():
+        database.migrate()
+        for index in range(scenario["accounts"]):
+            email = f"sim{index}@example.com"
+            database.accounts.insert_one(
+                {"_id": email, "password": "sim", "token": email, "priority": 0}
+            )
+
+    entries = read_trace(args.trace) if args.trace else generate_trace(args)
+    profiles = {}
+    uploads = {}
+    for entry in entries:
+        hash = entry["link"].split("btih:")[1].split("&")[0].upper()
+        profiles[hash] = {
+            key: entry[key]
+            for key in ("size", "add_latency", "download_seconds", "too_large")
+            if key in entry
+        }
+        uploads[hash] = entry.get("upload_seconds")
+
+    state = FakeSonicBit(
+        latency=args.latency,
+        add_latency=args.add_latency,
+        download_seconds=args.download_seconds,
+        failure_rate=args.failure_rate,
+        too_large_rate=args.too_large_rate,
+        clock=clock.time,
+        sleep=clock.sleep,
+        seed=args.seed,
+        profiles=profiles,
+    )
+
+    class SimulatedFileHandler(FileHandler):
+        def upload(self, download, torrent) -> int:
+            seconds = uploads.get(download.hash)
+            if seconds is None:
+                seconds = torrent.size / (args.upload_bandwidth * 1024**2)
+            clock.sleep(seconds)
+            return 1
+
+    stop = VirtualEvent(clock)
+    scheduler = BackgroundScheduler(timezone="UTC")  # never started, jobs don't run
+    hook = Hook()
+
+    def in_queue() -> int:
+        with counter.paused():
+            return database.downloads.count_documents(
+                {
+                    "status": {
+                        "$in": [
+                            DownloadStatus.PENDING.value,
+                            DownloadStatus.PROCESSING.value,
+                        ]
+                    }
+                }
+            )
+
+    max_seconds = (args.max_hours or 2 * max(entries[-1]["at"] / 3600, 1)) * 3600
+    samples = []
+    started = time.perf_counter()
+    clock.enter()
+    with FakeSonicBitTransport(state):
+        handler = RSSHandler(
+            rss_url=FEED_URL,
+            scheduler=scheduler,
+            db=database.watchrss,
+            downloads_db=database.downloads,
+            hook=hook,
+        )
+        counter.reset()
+        workers = [
+            run_actor(
+                clock,
+                SonicBitClient(
+                    database.accounts,
+                    database.slots,
+                    database.downloads,
+                    database.workers,
+                    scheduler,
+                    SimulatedFileHandler(),
+                    hook,
+                    f"sim-{index}",
+                ).run,
+                stop,
+            )
+            for index in range(scenario["workers"])
+        ]
+
+        pending = iter(entries)
+        entry = next(pending, None)
+        while clock.now - EPOCH < max_seconds:
+            elapsed = clock.now - EPOCH
+            batch = []
+            while entry and entry["at"] <= elapsed:
+                batch.append(FeedParserDict(title=entry["title"], link=entry["link"]))
+                entry = next(pending, None)
+            if batch:
+                handler.on_new_entries(batch)
+
+            queue = in_queue()
+            samples.append((elapsed, queue))
+            if entry is None and not queue:
+                break
+            clock.sleep(scenario["rss_interval"])
+
+        stop.set()
+        for worker in workers:
+            worker.join()
+    clock.exit()
+    wall_seconds = time.perf_counter() - started
+
+    hours = (clock.now - EPOCH) / 3600
+    with counter.paused():
+        statuses = {
+            status.value: database.downloads.count_documents({"status": status.value})
+            for status in DownloadStatus
+        }
+        summary = summarize(database.download_history.find())[None]
+    completed = len(summary.get("total", []))
+    total = summary.get("total", [])
+    queued = summary.get("queued", [])
+    peak_at, peak = max(samples, key=lambda sample: sample[1])
+    # growth over the replayed arrivals, a positive rate means the queue never drains
+    arrivals = [sample for sample in samples if sample[0] <= entries[-1]["at"]]
+    growth = (
+        (arrivals[-1][1] - arrivals[0][1]) / (arrivals[-1][0] - arrivals[0][0]) * 3600
+        if len(arrivals) > 1 and arrivals[-1][0] > arrivals[0][0]
+        else 0
+    )
+
+    def hours_at(values: list, percent: float) -> float | None:
+        return round(percentile(values, percent) / 3600, 2) if values else None
+
+    return {
+        **scenario,
+        "entries": len(entries),
+        "virtual_hours": round(hours, 2),
+        "wall_seconds": round(wall_seconds, 1),
+        "speedup": round(hours * 3600 / wall_seconds) if wall_seconds else None,
+        "completed": completed,
+        "completed_per_hour": round(completed / hours, 2) if hours else None,
+        "timeouts": statuses.get(DownloadStatus.TIMEOUT.value, 0),
+        "failed": statuses.get(DownloadStatus.ERROR.value, 0)
+        + statuses.get(DownloadStatus.TOO_LARGE.value, 0),
+        "left_in_queue": samples[-1][1],
+        "peak_queue": peak,
+        "peak_queue_hour": round(peak_at / 3600, 2),
+        "queue_growth_per_hour": round(growth, 2),
+        "queued_p50_hours": hours_at(queued, 50),
+        "queued_p95_hours": hours_at(queued, 95),
+        "complete_p50_hours": hours_at(total, 50),
+        "complete_p95_hours": hours_at(total, 95),
+        "api_requests": sum(state.requests.values()),
+        "mongo_operations_per_download": (
+            round(counter.total / completed, 1) if completed else None
+        ),
+    }
+
+
+def main():
+    args = parse_args()
+    if args.export_history:
+        export_history(args.export_history)
+        return
+    if args.scenario:
+        print(json.dumps(simulate(args, json.loads(args.scenario))))
+        return
+
+    grid = scenarios(args)
+    results = []
+    for scenario in grid:
+        if not args.json:
+            print(", ".join(f"{name}={value}" for name, value in scenario.items()))
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                *sys.argv[1:],
+                "--scenario",
+                json.dumps(scenario),
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        if not args.json:
+            for key, value in result.items():
+                if key not in scenario:
+                    print(f"    {key:<30}{value}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Local stand-ins shared by the benchmarks
+
+`setup()` must run before anything from `rssbox` is imported: it points the
+configuration at a scratch directory and either a real `mongod` or SQLite file
+(`--mongo-url`) or an in-memory mongomock database, and returns an
+`OperationCounter` counting every database operation issued by rssbox.
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager, nullcontext
+from threading import Lock, local
+from typing import Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# collection methods that result in (at least) one round trip to the server
+COUNTED_METHODS = (
+    "aggregate",
+    "bulk_write",
+    "count_documents",
+    "delete_many",
+    "delete_one",
+    "distinct",
+    "find",
+    "find_one",
+    "find_one_and_delete",
+    "find_one_and_replace",
+    "find_one_and_update",
+    "insert_many",
+    "insert_one",
+    "replace_one",
+    "update_many",
+    "update_one",
+)
+
+
+class OperationCounter:
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self._lock = Lock()
+        self._paused = local()
+
+    def add(self, name: str):
+        if getattr(self._paused, "value", False):
+            return
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextmanager
+    def paused(self):
+        """Don't count operations issued by the benchmark itself on this thread"""
+        self._paused.value = True
+        try:
+            yield
+        finally:
+            self._paused.value = False
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+def setup(mongo_url: str | None = None, rss_url: str = "http://127.0.0.1:1/rss"):
+    scratch = tempfile.mkdtemp(prefix="rssbox-bench-")
+    os.environ["RSS_URL"] = rss_url
+    os.environ["LOG_FILE"] = os.path.join(scratch, "rssbox.log")
+    os.environ["DOWNLOAD_PATH"] = os.path.join(scratch, "downloads")
+
+    counter = OperationCounter()
+    if mongo_url and mongo_url.startswith("sqlite:"):
+        os.environ["MONGO_URL"] = mongo_url
+        _count_sqlite(counter)
+    elif mongo_url:
+        os.environ["MONGO_URL"] = mongo_url
+        _count_commands(counter)
+    else:
+        os.environ["MONGO_URL"] = "mongodb://localhost/rssbox-bench"
+        _use_mongomock(counter)
+    return counter
+
+
+def _count_commands(counter: OperationCounter):
+    from pymongo import monitoring
+
+    ignored = {"hello", "ismaster", "isMaster", "ping", "endSessions", "buildInfo"}
+
+    class Listener(monitoring.CommandListener):
+        def started(self, event):
+            if event.command_name not in ignored:
+                counter.add(event.command_name)
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(Listener())
+
+
+def _count_sqlite(counter: OperationCounter):
+    from rssbox.modules.sqlite_store import SQLiteCollection
+
+    for name in COUNTED_METHODS:
+        method = getattr(SQLiteCollection, name, None)
+        if method is None:
+            continue
+
+        def counted(self, *args, _method=method, _name=name, **kwargs):
+            counter.add(_name)
+            return _method(self, *args, **kwargs)
+
+        setattr(SQLiteCollection, name, counted)
+
+
+def _use_mongomock(counter: OperationCounter):
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit(
+            "mongomock is required without --mongo-url: pip install -r benchmarks/requirements.txt"
+        ) from None
+    import pymongo
+
+    class _Session:
+        """mongomock has no sessions, transactions run as plain writes"""
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            return False
+
+        def start_transaction(self, *args, **kwargs):
+            return nullcontext()
+
+    # every client, one per connection role, sees the same data
+    store = mongomock.store.ServerStore()
+
+    class InMemoryMongoClient(mongomock.MongoClient):
+        def __init__(self, *args, **kwargs):
+            kwargs.pop("event_listeners", None)
+            super().__init__(*args, _store=store, **kwargs)
+
+        def start_session(self, *args, **kwargs):
+            return _Session()
+
+    create_collection = mongomock.database.Database.create_collection
+
+    def create_capped_collection(self, name, **kwargs):
+        # capped collections are not supported, an unbounded one does for benchmarks
+        for option in ("capped", "size", "max"):
+            kwargs.pop(option, None)
+        return create_collection(self, name, **kwargs)
+
+    mongomock.database.Database.create_collection = create_capped_collection
+    # mongomock scans every TTL indexed document on each access, nothing expires
+    # during a benchmark anyway
+    mongomock.store.CollectionStore._expire_documents = lambda self, index: None
+
+    nesting = local()
+
+    for name in COUNTED_METHODS:
+        method = getattr(mongomock.collection.Collection, name)
+
+        def counted(self, *args, _method=method, _name=name, **kwargs):
+            # mongomock implements some methods on top of others, count the outer call only
+            depth = getattr(nesting, "depth", 0)
+            if not depth:
+                counter.add(_name)
+            nesting.depth = depth + 1
+            # writes inside a stand-in transaction carry its session
+            if isinstance(kwargs.get("session"), _Session):
+                del kwargs["session"]
+            try:
+                return _method(self, *args, **kwargs)
+            finally:
+                nesting.depth = depth
+
+        setattr(mongomock.collection.Collection, name, counted)
+
+    pymongo.MongoClient = InMemoryMongoClient
@@ -0,0 +1,176 @@
+"""
+Virtual clock for simulations
+
+Threads registered with the clock run real code, but every sleep and wait goes
+through the clock, which jumps straight to the earliest wake up once all of
+them are blocked. Code between two sleeps takes no virtual time, so a day of
+polling loops runs in seconds. `patch_modules` points the `sleep`, `time`,
+`monotonic`, `perf_counter`, `datetime` and `Thread` names rssbox modules
+imported at the clock.
+"""
+
+import heapq
+import sys
+import threading
+import time
+from datetime import datetime
+from itertools import count
+from typing import Callable, List
+
+
+class _Waiter:
+    __slots__ = ("wake", "event", "due")
+
+    def __init__(self, wake: float, event: "VirtualEvent | None"):
+        self.wake = wake
+        self.event = event
+        self.due = False
+
+
+class VirtualClock:
+    def __init__(self, start: float = 0.0):
+        """
+        :param start: virtual epoch seconds the clock starts at
+        """
+        self.now = start
+        self._condition = threading.Condition()
+        self._running = 0
+        self._sleepers: List[tuple] = []
+        self._sequence = count()
+
+    def time(self) -> float:
+        return self.now
+
+    monotonic = time
+    perf_counter = time
+
+    def enter(self):
+        """The calling thread takes part in the simulation until `exit`"""
+        with self._condition:
+            self._running += 1
+
+    def exit(self):
+        with self._condition:
+            self._running -= 1
+            self._advance()
+
+    def sleep(self, seconds: float, event: "VirtualEvent | None" = None) -> bool:
+        """Blocks for `seconds` of virtual time or until `event` is set, returns whether it is set"""
+        with self._condition:
+            if event and event.flag:
+                return True
+            waiter = _Waiter(self.now + max(seconds, 0), event)
+            heapq.heappush(self._sleepers, (waiter.wake, next(self._sequence), waiter))
+            if event:
+                event.waiters.append(waiter)
+
+            self._running -= 1
+            self._advance()
+            while not waiter.due:
+                self._condition.wait()
+            return bool(event and event.flag)
+
+    def _advance(self):
+        if self._running:
+            return
+        while self._sleepers and self._sleepers[0][2].due:
+            heapq.heappop(self._sleepers)  # already woken by their event
+        if not self._sleepers:
+            return
+        if self._sleepers[0][0] == float("inf"):
+            raise RuntimeError("Every simulated thread waits on an event nobody sets")
+
+        self.now = max(self.now, self._sleepers[0][0])
+        while self._sleepers and self._sleepers[0][0] <= self.now:
+            _, _, waiter = heapq.heappop(self._sleepers)
+            if not waiter.due:
+                waiter.due = True
+                self._running += 1
+        self._condition.notify_all()
+
+    def _set(self, event: "VirtualEvent"):
+        with self._condition:
+            event.flag = True
+            for waiter in event.waiters:
+                if not waiter.due:
+                    waiter.due = True
+                    self._running += 1
+            event.waiters.clear()
+            self._condition.notify_all()
+
+    def datetime(self) -> type:
+        """A `datetime` class whose `now()` reads the clock"""
+        clock = self
+
+        class VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.now, tz)
+
+        return VirtualDatetime
+
+    def thread(self) -> type:
+        """A `Thread` class whose threads take part in the simulation"""
+        clock = self
+
+        class VirtualThread(threading.Thread):
+            def start(self):
+                clock.enter()
+                super().start()
+
+            def run(self):
+                try:
+                    super().run()
+                finally:
+                    clock.exit()
+
+            def join(self, timeout: float | None = None):
+                deadline = None if timeout is None else clock.now + timeout
+                while self.is_alive() and (deadline is None or clock.now < deadline):
+                    clock.sleep(1)
+
+        return VirtualThread
+
+    def patch_modules(self, prefix: str = "rssbox"):
+        """Points the clock functions imported by already loaded `prefix` modules at the clock"""
+        replacements = {
+            "sleep": (time.sleep, self.sleep),
+            "time": (time.time, self.time),
+            "monotonic": (time.monotonic, self.monotonic),
+            "perf_counter": (time.perf_counter, self.perf_counter),
+            "datetime": (datetime, self.datetime()),
+            "Thread": (threading.Thread, self.thread()),
+        }
+        for name, module in list(sys.modules.items()):
+            if name != prefix and not name.startswith(f"{prefix}."):
+                continue
+            for attribute, (original, replacement) in replacements.items():
+                if getattr(module, attribute, None) is original:
+                    setattr(module, attribute, replacement)
+
+
+class VirtualEvent:
+    """`threading.Event` whose `wait` timeout is virtual time"""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.flag = False
+        self.waiters: List[_Waiter] = []
+
+    def is_set(self) -> bool:
+        return self.flag
+
+    def set(self):
+        self.clock._set(self)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.clock.sleep(
+            float("inf") if timeout is None else timeout, event=self
+        )
+
+
+def run_actor(clock: VirtualClock, target: Callable, *args) -> threading.Thread:
+    """Starts `target(*args)` in a thread taking part in the simulation"""
+    thread = clock.thread()(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
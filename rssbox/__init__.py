@@ -1,54 +1,54 @@
 import logging
 import os
 
-from bson.codec_options import CodecOptions
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
 from rssbox.config import Config
 
 load_dotenv()
 
-
-if not os.path.exists(Config.DOWNLOAD_PATH):
-    os.makedirs(Config.DOWNLOAD_PATH)
-
-
-if os.path.exists(Config.LOG_FILE):
-    with open(Config.LOG_FILE, "w") as f:
-        pass
-
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(Config.LOG_FILE),
-    ],
-)
-logging.getLogger("apscheduler").setLevel(logging.WARNING)
-logging.getLogger("deta").setLevel(logging.WARNING)
-logging.getLogger("pymongo").setLevel(logging.WARNING)
-logging.getLogger("urllib3").setLevel(logging.WARNING)
-
-
-mongo_client = MongoClient(Config.MONGO_URL)
-options = CodecOptions(tz_aware=True)
-
-if Config.MONGO_DATABASE:
-    mongo = mongo_client.get_database(Config.MONGO_DATABASE, codec_options=options)
-else:
-    mongo = mongo_client.get_default_database(codec_options=options)
-
-accounts = mongo.get_collection("accounts", codec_options=options)
-
-downloads = mongo.get_collection("downloads", codec_options=options)
-# download url should be unique
-downloads.create_index([("url", 1)], unique=True)
-# expire at "expire_at" field
-downloads.create_index([("expire_at", 1)], expireAfterSeconds=0)
-
-watchrss_database = mongo.get_collection("watchrss", codec_options=options)
-workers = mongo.get_collection("workers", codec_options=options)
+# names that used to be module level and now resolve through `get_database()`
+_DATABASE_ATTRIBUTES = {
+    "mongo_client": "client",
+    "mongo": "mongo",
+    "accounts": "accounts",
+    "slots": "slots",
+    "downloads": "downloads",
+    "download_history": "download_history",
+    "watchrss_database": "watchrss",
+    "entry_filters": "entry_filters",
+    "workers": "workers",
+    "counters": "counters",
+}
+
+
+def __getattr__(name: str):
+    if name in _DATABASE_ATTRIBUTES:
+        from rssbox.database import get_database
+
+        return getattr(get_database(), _DATABASE_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def setup():
+    """Creates the download directory, truncates the log file and configures logging"""
+    if not os.path.exists(Config.DOWNLOAD_PATH):
+        os.makedirs(Config.DOWNLOAD_PATH)
+
+    if os.path.exists(Config.LOG_FILE):
+        with open(Config.LOG_FILE, "w") as f:
+            pass
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler(Config.LOG_FILE),
+        ],
+    )
+    logging.getLogger("apscheduler").setLevel(logging.WARNING)
+    logging.getLogger("deta").setLevel(logging.WARNING)
+    logging.getLogger("pymongo").setLevel(logging.WARNING)
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
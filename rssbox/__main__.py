@@ -1,42 +1,90 @@
+import functools
+import json
 import logging
 import os
+import signal
+from threading import Event
 
 import click
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.schedulers.blocking import BlockingScheduler
 
-from rssbox import accounts, downloads, watchrss_database, workers
+from rssbox import setup
 from rssbox.config import Config
-from rssbox.handlers.file_handler import FileHandler
-from rssbox.handlers.rss_handler import RSSHandler
-from rssbox.hooks.hook import Hook
-from rssbox.sonicbit_client import SonicBitClient
-from rssbox.utils import clean_empty_dirs
 
 logger = logging.getLogger(__name__)
 rss_handlers = {}
 
 
+def stop_on_signals() -> Event:
+    """Returns an event set on SIGTERM or SIGINT"""
+    stop = Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, shutting down")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    return stop
+
+
 def main(
     rss_only: bool,
     download_only: bool,
     upload_only: bool,
     process_only: bool,
     client_id: str = None,
+    daemon: bool = False,
+    worker: int = 0,
+    worker_count: int = 1,
 ):
-    clean_empty_dirs(Config.DOWNLOAD_PATH)
+    # imported here so `--help`, `stats`, `status` and `migrate` don't load the
+    # schedulers, feed parsers and SonicBit SDK
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    from rssbox.database import get_database
+    from rssbox.handlers.file_handler import FileHandler
+    from rssbox.handlers.metrics_handler import MetricsHandler
+    from rssbox.handlers.rss_handler import RSSHandler
+    from rssbox.hooks.hook import Hook
+    from rssbox.modules.entry_filter import EntryFilters
+    from rssbox.sonicbit_client import SonicBitClient
+    from rssbox.utils import clean_empty_dirs
+
+    database = get_database()
+    accounts = database.accounts
+    slots = database.slots
+    downloads = database.downloads
+    workers = database.workers
+
+    # with several workers each watches every `worker_count`-th feed and serves
+    # metrics on its own port
+    rss_urls = Config.RSS_URLS[worker::worker_count]
+    metrics_port = Config.METRICS_PORT + worker if Config.METRICS_PORT else 0
+    if client_id and worker_count > 1:
+        client_id = f"{client_id}-{worker}"
+
+    if worker == 0:
+        clean_empty_dirs(Config.DOWNLOAD_PATH)
     hook = Hook()
     scheduler_class = BlockingScheduler if rss_only else BackgroundScheduler
     scheduler = scheduler_class(timezone="UTC")
 
     if not download_only or not upload_only or not process_only:
-        for rss_url in Config.RSS_URLS:
+        entry_filters = EntryFilters(
+            database.entry_filters,
+            downloads,
+            database.download_history,
+            Config.ENTRY_FILTER_RELOAD,
+        )
+        for rss_url in rss_urls:
             rss_handler = RSSHandler(
                 rss_url=rss_url,
                 scheduler=scheduler,
-                db=watchrss_database,
+                db=database.watchrss,
                 downloads_db=downloads,
                 hook=hook,
+                entry_filters=entry_filters,
             )
             rss_handler.start_rss()
             rss_handlers[rss_url] = rss_handler
@@ -44,6 +92,16 @@ def main(
         if rss_only:
             logger.info(f"RSS only mode, listening for {len(rss_handlers)} RSS feeds")
 
+    if metrics_port:
+        metrics_handler = MetricsHandler(
+            database.status_counters,
+            scheduler,
+            Config.METRICS_HOST,
+            metrics_port,
+            Config.METRICS_REFRESH_INTERVAL,
+        )
+        metrics_handler.start()
+
     scheduler.start()
 
     if not rss_only:
@@ -52,14 +110,26 @@ def main(
 
         file_handler = FileHandler()
         sonicbit_client = SonicBitClient(
-            accounts, downloads, workers, scheduler, file_handler, hook, client_id
+            accounts,
+            slots,
+            downloads,
+            workers,
+            scheduler,
+            file_handler,
+            hook,
+            client_id,
         )
-        sonicbit_client.start(download_only, upload_only, process_only)
+        if daemon:
+            sonicbit_client.run(
+                stop_on_signals(), download_only, upload_only, process_only
+            )
+        else:
+            sonicbit_client.start(download_only, upload_only, process_only)
 
     scheduler.shutdown(wait=True)
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option("--debug", "-d", is_flag=True, help="Enable debug mode")
 @click.option(
     "--rss-only",
@@ -83,18 +153,139 @@ def main(
     "--process-only", "-p", is_flag=True, help="Only process files, no rss checks"
 )
 @click.option("--id", "-i", help="ID to use for the client")
+@click.option(
+    "--daemon",
+    is_flag=True,
+    help="Keep dispatching and checking downloads until SIGTERM instead of one pass",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of worker processes, restarted when they crash",
+)
+@click.pass_context
 def cli(
+    ctx: click.Context,
     debug: bool,
     rss_only: bool,
     download_only: bool,
     upload_only: bool,
     process_only: bool,
     id: str,
+    daemon: bool,
+    workers: int,
 ):
+    setup()
     if debug or os.environ.get("LOG_LEVEL", "INFO").upper() == "DEBUG":
         logging.getLogger().setLevel(logging.DEBUG)
 
-    main(rss_only, download_only, upload_only, process_only, client_id=id)
+    if ctx.invoked_subcommand is not None:
+        return
+
+    run = functools.partial(
+        main,
+        rss_only,
+        download_only,
+        upload_only,
+        process_only,
+        client_id=id,
+        daemon=daemon,
+    )
+    if workers == 1:
+        run()
+        return
+
+    from rssbox.supervisor import Supervisor
+
+    supervisor = Supervisor(
+        lambda worker: run(worker=worker, worker_count=workers), workers
+    )
+    supervisor.run(stop_on_signals())
+
+
+@cli.command()
+@click.option(
+    "--limit",
+    "-n",
+    default=10000,
+    show_default=True,
+    help="Number of most recent completed downloads to analyse",
+)
+def stats(limit: int):
+    """Report stage latency percentiles of completed downloads"""
+    from rssbox.database import get_database
+    from rssbox.modules.timeline import (
+        INTERVALS,
+        PERCENTILES,
+        format_seconds,
+        percentile,
+        summarize,
+    )
+    from rssbox.utils import md5hash, redact_url
+
+    records = get_database().analytics.download_history.find(
+        {}, {"feed": 1, "timeline": 1}, sort=[("$natural", -1)], limit=limit
+    )
+    summary = summarize(records)
+    feed_names = {md5hash(url): redact_url(url) for url in Config.RSS_URLS}
+
+    header = f"{'stage':<10}{'count':>8}" + "".join(
+        f"{f'p{p}':>12}" for p in PERCENTILES
+    )
+    for feed, feed_summary in sorted(
+        summary.items(), key=lambda item: (item[0] is not None, item[0] or "")
+    ):
+        title = "all feeds" if feed is None else feed_names.get(feed, feed)
+        click.echo(f"\n{title}")
+        click.echo(header)
+        for name, _, _ in INTERVALS:
+            values = feed_summary.get(name)
+            if not values:
+                continue
+            click.echo(
+                f"{name:<10}{len(values):>8}"
+                + "".join(
+                    f"{format_seconds(percentile(values, p)):>12}" for p in PERCENTILES
+                )
+            )
+
+
+@cli.command()
+@click.option(
+    "--reconcile",
+    is_flag=True,
+    help="Recount the collections and correct the counters first",
+)
+@click.option("--json", "as_json", is_flag=True, help="Print the counts as JSON")
+def status(reconcile: bool, as_json: bool):
+    """Report how many downloads and account slots are in each status"""
+    from rssbox.database import get_database
+    from rssbox.modules.counters import COUNTED
+
+    status_counters = get_database().status_counters
+    if reconcile:
+        status_counters.reconcile()
+    counts = {name: status_counters.get(name) for name in COUNTED}
+
+    if as_json:
+        click.echo(json.dumps(counts, indent=2))
+        return
+    for name, statuses in counts.items():
+        click.echo(f"\n{name}")
+        for status, count in statuses.items():
+            click.echo(f"{status:<18}{count:>8}")
+
+
+@cli.command()
+def migrate():
+    """Create the collections and indexes rssbox needs, run once after upgrading"""
+    from rssbox.database import get_database
+
+    get_database().migrate()
+    click.echo("Database is up to date")
 
 
 if __name__ == "__main__":
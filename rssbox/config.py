@@ -8,9 +8,29 @@ load_dotenv()
 class Config:
     RSS_URL_RAW = os.environ["RSS_URL"]
     RSS_URLS = list(map(lambda x: x.strip(), RSS_URL_RAW.split("|")))
+    # Share of downloads claimed from each feed, in the same order as RSS_URL
+    FEED_WEIGHTS_RAW = os.environ.get("FEED_WEIGHTS", "")
+    FEED_WEIGHTS = [int(x) for x in FEED_WEIGHTS_RAW.split("|") if x.strip()]
+
+    # Seconds between checks of a feed, adapted to how often it publishes
+    RSS_DEFAULT_INTERVAL = int(
+        os.environ.get("RSS_DEFAULT_INTERVAL", 3 * 60)
+    )  # 3 minutes, until entries were seen
+    RSS_MIN_INTERVAL = int(os.environ.get("RSS_MIN_INTERVAL", 60))  # 1 minute
+    RSS_MAX_INTERVAL = int(os.environ.get("RSS_MAX_INTERVAL", 60 * 60))  # 1 hour
+    # Weight of the newest gap between entries in a feed's mean interval
+    RSS_EWMA_ALPHA = float(os.environ.get("RSS_EWMA_ALPHA", 0.3))
+    # Fraction of the interval added or removed at random, so feeds don't line up
+    RSS_JITTER = float(os.environ.get("RSS_JITTER", 0.1))
 
     MONGO_URL = os.environ["MONGO_URL"]
     MONGO_DATABASE = os.environ.get("MONGO_DATABASE")
+    # MongoClient options of each connection role in URI query string syntax (e.g.
+    # `maxPoolSize=20&readPreference=secondaryPreferred`), on top of the role's defaults
+    MONGO_OPTIONS = {
+        role: os.environ.get(f"MONGO_{role.upper()}_OPTIONS", "")
+        for role in ("default", "heartbeat", "analytics")
+    }
 
     DEFAULT_FILTER_EXTENSIONS = "mp4,flv,3gp,mov,asf,mpg,avi,mpeg,wmv,rm,dat,mkv,vob,m2v,f4v,m4v,m2t,mts,webm,ts"
 
@@ -55,4 +75,95 @@ class Config:
     )  # 7 days
     DOWNLOAD_TOO_LARGE_RECORD_EXPIRY = int(
         os.environ.get("DOWNLOAD_TOO_LARGE_EXPIRE_RECORD", 60 * 60 * 24 * 7)
-    )  # 7 days
\ No newline at end of file
+    )  # 7 days
+
+    # Daemon mode, seconds between dispatch passes when nothing was dispatched
+    DISPATCH_INTERVAL = int(os.environ.get("DISPATCH_INTERVAL", 30))  # 30 seconds
+    # Daemon mode, seconds between check passes when nothing is downloading
+    CHECK_INTERVAL = int(os.environ.get("CHECK_INTERVAL", 10))  # 10 seconds
+    # Daemon mode, seconds between upload passes when nothing is queued for upload
+    UPLOAD_INTERVAL = int(os.environ.get("UPLOAD_INTERVAL", 5))  # 5 seconds
+    # Bounds on the seconds until a downloading torrent is checked again, checks
+    # are due when the torrent is estimated to complete
+    CHECK_MIN_DELAY = int(os.environ.get("CHECK_MIN_DELAY", 5))  # 5 seconds
+    CHECK_MAX_DELAY = int(os.environ.get("CHECK_MAX_DELAY", 5 * 60))  # 5 minutes
+    # SonicBit API requests per second across every worker, 0 disables the limit
+    API_RATE = float(os.environ.get("API_RATE", 0))
+    API_BURST = int(os.environ.get("API_BURST", 10))
+    # SonicBit API requests per second per account, 0 disables the limit
+    API_ACCOUNT_RATE = float(os.environ.get("API_ACCOUNT_RATE", 0))
+    API_ACCOUNT_BURST = int(os.environ.get("API_ACCOUNT_BURST", 5))
+
+    # Torrents each SonicBit account downloads at the same time, accounts can
+    # override it with a `slots` field
+    ACCOUNT_SLOTS = int(os.environ.get("ACCOUNT_SLOTS", 1))
+    # Fraction of an account's storage quota above which no torrent is added
+    STORAGE_HIGH_WATER = float(os.environ.get("STORAGE_HIGH_WATER", 0.9))
+    # Seconds a full account's idle slots wait before adding again
+    STORAGE_FULL_DELAY = int(
+        os.environ.get("STORAGE_FULL_DELAY", 10 * 60)
+    )  # 10 minutes
+
+    # Upload each finished file of a multi-file torrent while the rest downloads,
+    # with file handlers that implement `upload_file`
+    EARLY_UPLOAD = os.environ.get("EARLY_UPLOAD", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Seconds between reloads of the `entry_filters` rules
+    ENTRY_FILTER_RELOAD = int(os.environ.get("ENTRY_FILTER_RELOAD", 30))  # 30 seconds
+
+    # Background threads for notification hooks, calls waiting beyond the queue size are dropped
+    HOOK_WORKERS = int(os.environ.get("HOOK_WORKERS", 2))
+    HOOK_QUEUE_SIZE = int(os.environ.get("HOOK_QUEUE_SIZE", 100))
+    # Seconds a notification hook may wait to run, and then run, before it is dropped or reported
+    HOOK_TIMEOUT = int(os.environ.get("HOOK_TIMEOUT", 60))  # 1 minute
+
+    # Update accounts and downloads together in multi-document transactions (needs a
+    # replica set) instead of ordered single document conditional updates
+    USE_TRANSACTIONS = os.environ.get("USE_TRANSACTIONS", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Seconds of waiting one priority point is worth when ordering pending downloads
+    PRIORITY_STEP = int(os.environ.get("PRIORITY_STEP", 60 * 60))  # 1 hour
+
+    # Downloads a worker adds at the same time, one dispatch loop each in daemon mode
+    MAX_CONCURRENT_ADDS = int(os.environ.get("MAX_CONCURRENT_ADDS", 1))
+    # Downloading accounts a worker checks and uploads at the same time, one check loop each in daemon mode
+    MAX_CONCURRENT_CHECKS = int(os.environ.get("MAX_CONCURRENT_CHECKS", 1))
+    # Finished downloads a worker uploads at the same time, one upload loop each in daemon mode
+    MAX_CONCURRENT_UPLOADS = int(os.environ.get("MAX_CONCURRENT_UPLOADS", 1))
+    # Daemon mode, seconds to let in-flight work finish after SIGTERM
+    SHUTDOWN_TIMEOUT = int(os.environ.get("SHUTDOWN_TIMEOUT", 60))  # 1 minute
+
+    # Parse RSS 2.0/torznab feeds with the streaming parser, other feeds always use feedparser
+    FAST_FEED_PARSER = os.environ.get("FAST_FEED_PARSER", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Capped collection keeping the stage timeline of completed downloads
+    DOWNLOAD_HISTORY_SIZE = int(
+        os.environ.get("DOWNLOAD_HISTORY_SIZE", 32 * 1024 * 1024)
+    )  # 32 MiB
+    DOWNLOAD_HISTORY_MAX = int(
+        os.environ.get("DOWNLOAD_HISTORY_MAX", 100000)
+    )  # 100k downloads
+
+    # Prometheus metrics endpoint, disabled when the port is 0
+    METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+    METRICS_REFRESH_INTERVAL = int(
+        os.environ.get("METRICS_REFRESH_INTERVAL", 30)
+    )  # 30 seconds
+
+    # Seconds between recounts of the download and slot status counters
+    COUNTERS_RECONCILE_INTERVAL = int(
+        os.environ.get("COUNTERS_RECONCILE_INTERVAL", 300)
+    )  # 5 minutes
@@ -0,0 +1,271 @@
+import logging
+import os
+from functools import cached_property
+from threading import Lock
+from typing import Dict
+
+from bson.codec_options import CodecOptions
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+from pymongo.collection import Collection
+from pymongo.database import Database as MongoDatabase
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+from rssbox.config import Config
+from rssbox.enum import DownloadStatus, SonicBitStatus
+from rssbox.modules.counters import StatusCounters
+from rssbox.modules.mongo_roles import (
+    ANALYTICS,
+    DEFAULT,
+    HEARTBEAT,
+    RoleMonitor,
+    role_options,
+)
+from rssbox.modules.rate_limiter import RateLimiter
+from rssbox.modules.slots import sync_slots
+from rssbox.modules.sqlite_store import SQLiteClient, is_sqlite_url
+from rssbox.utils import url_key
+
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """
+    MongoDB clients and rssbox collections, connected on first use
+
+    Each connection role of `rssbox.modules.mongo_roles` gets its own client,
+    the properties below use the default role. A `sqlite:///path.db` url keeps
+    the state in an embedded SQLite database instead, for single node
+    deployments, see `rssbox.modules.sqlite_store`.
+    """
+
+    def __init__(self, url: str, name: str | None = None):
+        self.url = url
+        self.name = name
+        self.options = CodecOptions(tz_aware=True)
+        self.clients: Dict[str, MongoClient | SQLiteClient] = {}
+        self.lock = Lock()
+
+    def client_for(self, role: str) -> MongoClient:
+        with self.lock:
+            if role not in self.clients and is_sqlite_url(self.url):
+                # one connection serves every role, there are no pools to keep apart
+                self.clients[role] = next(
+                    iter(self.clients.values()), None
+                ) or SQLiteClient.from_url(self.url)
+            elif role not in self.clients:
+                self.clients[role] = MongoClient(
+                    self.url, event_listeners=[RoleMonitor(role)], **role_options(role)
+                )
+            return self.clients[role]
+
+    def mongo_for(self, role: str) -> MongoDatabase:
+        client = self.client_for(role)
+        if self.name:
+            return client.get_database(self.name, codec_options=self.options)
+        return client.get_default_database(codec_options=self.options)
+
+    @cached_property
+    def client(self) -> MongoClient:
+        return self.client_for(DEFAULT)
+
+    @cached_property
+    def mongo(self) -> MongoDatabase:
+        return self.mongo_for(DEFAULT)
+
+    @cached_property
+    def heartbeat(self) -> MongoDatabase:
+        """Worker heartbeats and check timestamps"""
+        return self.mongo_for(HEARTBEAT)
+
+    @cached_property
+    def analytics(self) -> MongoDatabase:
+        """Read-only sweeps, which may be routed to secondaries"""
+        return self.mongo_for(ANALYTICS)
+
+    def collection(self, name: str) -> Collection:
+        return self.mongo.get_collection(name, codec_options=self.options)
+
+    @cached_property
+    def accounts(self) -> Collection:
+        return self.collection("accounts")
+
+    @cached_property
+    def slots(self) -> Collection:
+        return self.collection("slots")
+
+    @cached_property
+    def downloads(self) -> Collection:
+        return self.collection("downloads")
+
+    @cached_property
+    def download_history(self) -> Collection:
+        return self.collection("download_history")
+
+    @cached_property
+    def watchrss(self) -> Collection:
+        return self.collection("watchrss")
+
+    @cached_property
+    def entry_filters(self) -> Collection:
+        return self.collection("entry_filters")
+
+    @cached_property
+    def workers(self) -> Collection:
+        return self.collection("workers")
+
+    @cached_property
+    def counters(self) -> Collection:
+        return self.collection("counters")
+
+    @cached_property
+    def status_counters(self) -> StatusCounters:
+        return StatusCounters(
+            self.counters, {"downloads": self.downloads, "slots": self.slots}
+        )
+
+    @cached_property
+    def rate_limits(self) -> Collection:
+        return self.collection("rate_limits")
+
+    @cached_property
+    def rate_limiter(self) -> RateLimiter | None:
+        if not Config.API_RATE and not Config.API_ACCOUNT_RATE:
+            return None
+        return RateLimiter(
+            self.rate_limits,
+            Config.API_RATE,
+            Config.API_BURST,
+            Config.API_ACCOUNT_RATE,
+            Config.API_ACCOUNT_BURST,
+        )
+
+    def migrate(self):
+        """Creates the collections and indexes rssbox relies on, safe to run repeatedly"""
+        logger.info("Creating indexes")
+        # one download per torrent, keyed by a hash of its canonical url instead of
+        # the url, which for magnet links can run to several KB
+        self.downloads.create_index(
+            [("url_key", 1)],
+            unique=True,
+            partialFilterExpression={"url_key": {"$type": "string"}},
+        )
+        self.backfill_download_url_key()
+        if "url_1" in self.downloads.index_information():
+            self.downloads.drop_index("url_1")
+        # expire at "expire_at" field
+        self.downloads.create_index([("expire_at", 1)], expireAfterSeconds=0)
+        # claim order of pending downloads, per feed and across feeds
+        self.downloads.create_index([("status", 1), ("feed", 1), ("rank", 1)])
+        self.downloads.create_index([("status", 1), ("rank", 1)])
+        self.backfill_download_rank()
+        # titles already ingested from a feed, for entry filters that dedupe
+        self.downloads.create_index([("feed", 1), ("title_key", 1)])
+        # download slots of an account, and the claim orders of idle, downloading and finished slots
+        self.slots.create_index([("account", 1), ("index", 1)])
+        self.slots.create_index([("status", 1), ("priority", -1), ("last_used_at", 1)])
+        self.slots.create_index([("status", 1), ("next_check_at", 1)])
+        self.slots.create_index([("status", 1), ("queued_at", 1)])
+        sync_slots(self.accounts, self.slots, self.status_counters)
+        # slots without a status are idle, stored as such so claims count them right
+        self.slots.update_many(
+            {"status": {"$in": [None, ""]}},
+            {"$set": {"status": SonicBitStatus.IDLE.value}, "$inc": {"version": 1}},
+        )
+
+        # completed downloads' stage timelines, oldest are dropped first
+        if "download_history" not in self.mongo.list_collection_names():
+            try:
+                self.mongo.create_collection(
+                    "download_history",
+                    capped=True,
+                    size=Config.DOWNLOAD_HISTORY_SIZE,
+                    max=Config.DOWNLOAD_HISTORY_MAX,
+                )
+            except CollectionInvalid:
+                pass  # created by another worker
+        self.download_history.create_index([("feed", 1), ("title_key", 1)])
+
+        # status counts of downloads and slots, counted from scratch after an upgrade
+        self.status_counters.reconcile()
+
+    def backfill_download_rank(self):
+        """Ranks downloads created before priorities existed by their creation time"""
+        ranked = 0
+        for download in self.downloads.find(
+            {"rank": {"$exists": False}}, {"_id": 1, "feed": 1}
+        ):
+            if isinstance(download["_id"], ObjectId):
+                self.downloads.update_one(
+                    {"_id": download["_id"]},
+                    {
+                        "$set": {
+                            # an explicit null so `distinct("feed")` lists it
+                            "feed": download.get("feed"),
+                            "priority": 0,
+                            "rank": download["_id"].generation_time,
+                        }
+                    },
+                )
+                ranked += 1
+        if ranked:
+            logger.info(f"Ranked {ranked} existing downloads")
+
+    def backfill_download_url_key(self):
+        """Keys downloads created before `url_key` existed, removing pending duplicates of the same torrent"""
+        keyed = removed = 0
+        for download in self.downloads.find(
+            {"url_key": {"$exists": False}}, {"_id": 1, "url": 1}
+        ):
+            key = url_key(download["url"])
+            try:
+                self.downloads.update_one(
+                    {"_id": download["_id"]}, {"$set": {"url_key": key}}
+                )
+                keyed += 1
+                continue
+            except DuplicateKeyError:
+                pass
+
+            # in progress duplicates are left unkeyed until they complete
+            if self.downloads.delete_one(
+                {
+                    "_id": download["_id"],
+                    "status": DownloadStatus.PENDING.value,
+                    "locked_by": None,
+                }
+            ).deleted_count:
+                self.status_counters.move("downloads", DownloadStatus.PENDING, None)
+                removed += 1
+        if keyed or removed:
+            logger.info(
+                f"Keyed {keyed} existing downloads by url, removed {removed} duplicates"
+            )
+
+    def close(self):
+        with self.lock:
+            clients, self.clients = list(self.clients.values()), {}
+        for client in {id(client): client for client in clients}.values():
+            client.close()
+
+
+_database: Database | None = None
+_lock = Lock()
+
+
+def get_database() -> Database:
+    global _database
+    if _database is None:
+        with _lock:
+            if _database is None:
+                _database = Database(Config.MONGO_URL, Config.MONGO_DATABASE)
+    return _database
+
+
+def _forget_database():
+    # MongoClient is not fork safe, forked workers connect with their own pool
+    global _database
+    _database = None
+
+
+os.register_at_fork(after_in_child=_forget_database)
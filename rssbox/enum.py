@@ -19,3 +19,12 @@ class SonicBitStatus(Enum):
     UPLOADING = "UPLOADING"
     COMPLETED = "COMPLETED"
     ERROR = "ERROR"
+
+
+class DownloadStage(Enum):
+    INGESTED = "ingested"
+    CLAIMED = "claimed"
+    ADDED = "added"
+    VERIFIED = "verified"
+    COMPLETED = "completed"
+    UPLOADED = "uploaded"
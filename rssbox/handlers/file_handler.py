@@ -1,4 +1,5 @@
 from sonicbit.types import Torrent
+from sonicbit.types.torrent.torrent_file import TorrentFile
 
 from rssbox.config import Config
 from rssbox.modules.download import Download
@@ -13,6 +14,22 @@ class FileHandler:
     def upload(self, download: Download, torrent: Torrent) -> int:
         return 0
 
+    def upload_file(
+        self, download: Download, torrent: Torrent, file: TorrentFile
+    ) -> bool:
+        """
+        Uploads one finished file of `torrent`, returns whether it was uploaded
+
+        Handlers that implement it instead of `upload` get each file as soon as it
+        finishes, while the rest of the torrent is still downloading.
+        """
+        raise NotImplementedError
+
+    @property
+    def uploads_files(self) -> bool:
+        """Whether the handler uploads single files with `upload_file`"""
+        return type(self).upload_file is not FileHandler.upload_file
+
     def check_extension(self, ext: str):
         if ext.lower() in Config.FILTER_EXTENSIONS:
             return True
@@ -0,0 +1,53 @@
+import logging
+
+from apscheduler.schedulers.base import BaseScheduler
+
+from rssbox.modules.counters import StatusCounters
+from rssbox.modules.metrics import (
+    MetricsServer,
+    accounts_by_status,
+    downloads_by_status,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsHandler:
+    def __init__(
+        self,
+        status_counters: StatusCounters,
+        scheduler: BaseScheduler,
+        host: str,
+        port: int,
+        refresh_interval: int,
+    ):
+        self.status_counters = status_counters
+        self.scheduler = scheduler
+        self.server = MetricsServer(host, port)
+        self.REFRESH_INTERVAL = refresh_interval
+
+    def start(self):
+        self.refresh_status_gauges()
+        self.scheduler.add_job(
+            self.refresh_status_gauges,
+            "interval",
+            seconds=self.REFRESH_INTERVAL,
+            id="metrics-refresh",
+            max_instances=1,
+        )
+        self.server.start()
+
+    def stop(self):
+        self.server.stop()
+
+    def refresh_status_gauges(self):
+        # read from the status counters, instead of counting the collections per scrape
+        try:
+            for gauge, name in (
+                (downloads_by_status, "downloads"),
+                (accounts_by_status, "slots"),
+            ):
+                for status, count in self.status_counters.get(name).items():
+                    gauge.set(count, status=status)
+        except Exception as error:
+            logger.warning(f"Failed to refresh status gauges: {error}")
@@ -8,10 +8,14 @@ from apscheduler.schedulers.base import BaseScheduler
 from feedparser import FeedParserDict
 from pymongo.collection import Collection
 
+from rssbox.config import Config
+from rssbox.database import get_database
 from rssbox.hooks.hook import Hook
 from rssbox.modules.download import Download
+from rssbox.modules.entry_filter import EntryFilters
+from rssbox.modules.metrics import stage_seconds
 from rssbox.modules.watchrss import WatchRSS
-from rssbox.utils import md5hash
+from rssbox.utils import md5hash, redact_url
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +26,7 @@ class RSSHandler:
     db: Collection
     downloads_db: Collection
     hook: Hook
+    entry_filters: EntryFilters | None
     watch_rss: WatchRSS
 
     def __init__(
@@ -31,49 +36,84 @@ class RSSHandler:
         db: Collection,
         downloads_db: Collection,
         hook: Hook,
+        entry_filters: EntryFilters | None = None,
     ):
         self.rss_url = rss_url
         self.scheduler = scheduler
         self.db = db
         self.downloads_db = downloads_db
         self.hook = hook
+        self.entry_filters = entry_filters
         self.watch_rss = WatchRSS(
             self.rss_url,
             self.db,
             self.on_new_entries,
             check_confirmation=True,
+            fast_parser=Config.FAST_FEED_PARSER,
         )
 
     @property
     def id(self):
         return md5hash(self.rss_url)
 
+    @property
+    def job_id(self):
+        return f"watchrss-{self.id}"
+
     def start_rss(self):
         logger.debug(f"Starting RSS: {self.rss_url}")
         random_start_time = datetime.now() + timedelta(seconds=random.randint(0, 60))
+        interval = self.watch_rss.poll_interval
         self.scheduler.add_job(
-            self.watch_rss.check,
+            self.check,
             "interval",
-            minutes=3,
-            id=f"watchrss-{self.id}",
+            seconds=interval,
+            jitter=int(interval * Config.RSS_JITTER),
+            id=self.job_id,
             next_run_time=random_start_time,
         )
-        t = Thread(target=self.watch_rss.check)
+        t = Thread(target=self.check)
         t.start()
 
     def stop_rss(self):
-        self.scheduler.remove_job(f"watchrss={self.id}")
+        self.scheduler.remove_job(self.job_id)
+
+    def check(self):
+        """Checks the feed, then schedules the next check from its publish rate"""
+        try:
+            self.watch_rss.check()
+        except Exception as error:
+            logger.warning(
+                f"Failed to check {redact_url(self.rss_url)} ({self.watch_rss.errors} in a row): {error}"
+            )
+
+        interval = self.watch_rss.poll_interval
+        logger.debug(f"Checking {redact_url(self.rss_url)} again in {interval}s")
+        self.scheduler.reschedule_job(
+            self.job_id,
+            trigger="interval",
+            seconds=interval,
+            jitter=int(interval * Config.RSS_JITTER),
+        )
 
     def on_new_entries(self, entries: List[FeedParserDict]):
         logger.info(f"{len(entries)} new entries")
-        for entry in entries:
-            if entry_result := self.hook.on_new_entry(entry):
-                if isinstance(entry_result, FeedParserDict):
-                    entry = entry_result
-
+        # one status counter write for the batch, instead of one per download
+        with (
+            stage_seconds.time(stage="ingest_batch"),
+            get_database().status_counters.batched(),
+        ):
+            if self.entry_filters:
+                entries = self.entry_filters.apply(self.id, entries)
+            for entry in self.hook.on_new_entries(entries):
                 try:
                     Download.create(
-                        client=self.downloads_db, name=entry.title, url=entry.link
+                        client=self.downloads_db,
+                        name=entry.title,
+                        url=entry.link,
+                        feed=self.id,
+                        priority=int(entry.get("priority", 0)),
+                        title_key=entry.get("title_key"),
                     )
                 except Exception as error:
                     logging.exception(
@@ -2,25 +2,52 @@ import logging
 from datetime import datetime, timedelta, timezone
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from pymongo import ReadPreference
 from pymongo.collection import Collection
 
+from rssbox.config import Config
+from rssbox.database import get_database
 from rssbox.enum import DownloadStatus, SonicBitStatus
+from rssbox.modules.slots import sync_slots
 
 logger = logging.getLogger(__name__)
 
+# fields `SonicBit.mark_as_idle` clears, a slot released back to idle holds no
+# torrent so the account's purge may delete whatever it had added
+IDLE_SLOT_FIELDS = {
+    "added_at": None,
+    "download_id": None,
+    "hash": None,
+    "next_check_at": None,
+    "queued_at": None,
+}
+
 
 class WorkerHandler:
     def __init__(
         self,
         workers: Collection,
         accounts: Collection,
+        slots: Collection,
         downloads: Collection,
         scheduler: BackgroundScheduler,
         heartbeat_interval: int,
     ):
         self.workers = workers
         self.accounts = accounts
+        self.slots = slots
         self.downloads = downloads
+        # the stale lock sweeps read through the analytics role's pool, but from
+        # the primary: their $lookup of `workers.last_heartbeat` on a lagging
+        # secondary would find live workers stale and release their locks
+        analytics = get_database().analytics
+        self.slots_sweep = analytics.get_collection(
+            slots.name, read_preference=ReadPreference.PRIMARY
+        )
+        self.downloads_sweep = analytics.get_collection(
+            downloads.name, read_preference=ReadPreference.PRIMARY
+        )
+        self.status_counters = get_database().status_counters
         self.scheduler = scheduler
         self.HEARTBEAT_INTERVAL = heartbeat_interval
 
@@ -28,6 +55,67 @@ class WorkerHandler:
         self.scheduler.add_job(
             self.clean_stale_sonicbit_and_workers, "interval", seconds=40
         )
+        self.scheduler.add_job(
+            self.reconcile_counters,
+            "interval",
+            seconds=Config.COUNTERS_RECONCILE_INTERVAL,
+            id="counters-reconcile",
+            max_instances=1,
+            replace_existing=True,
+        )
+
+    def reconcile_counters(self):
+        try:
+            self.status_counters.reconcile()
+        except Exception as error:
+            logger.warning(f"Failed to reconcile status counters: {error}")
+
+    def release_locks(self, worker_id: str):
+        """Releases every account slot and download locked by `worker_id`, called by a worker shutting down"""
+        idle = self.slots.update_many(
+            {"locked_by": worker_id, "status": SonicBitStatus.PROCESSING.value},
+            {
+                "$set": {
+                    "status": SonicBitStatus.IDLE.value,
+                    "locked_by": None,
+                    **IDLE_SLOT_FIELDS,
+                },
+                "$inc": {"version": 1},
+            },
+        )
+        downloading = self.slots.update_many(
+            {"locked_by": worker_id, "status": SonicBitStatus.LOCKED.value},
+            {
+                "$set": {
+                    "status": SonicBitStatus.DOWNLOADING.value,
+                    "locked_by": None,
+                },
+                "$inc": {"version": 1},
+            },
+        )
+        # interrupted uploads go back to the upload queue
+        queued = self.slots.update_many(
+            {"locked_by": worker_id, "status": SonicBitStatus.UPLOADING.value},
+            {
+                "$set": {"status": SonicBitStatus.COMPLETED.value, "locked_by": None},
+                "$inc": {"version": 1},
+            },
+        )
+        for old, new, result in (
+            (SonicBitStatus.PROCESSING, SonicBitStatus.IDLE, idle),
+            (SonicBitStatus.LOCKED, SonicBitStatus.DOWNLOADING, downloading),
+            (SonicBitStatus.UPLOADING, SonicBitStatus.COMPLETED, queued),
+        ):
+            self.status_counters.move("slots", old, new, result.modified_count)
+        pending = self.revert_downloads({"locked_by": worker_id})
+
+        slots = idle.modified_count + downloading.modified_count + queued.modified_count
+        if slots or pending:
+            logger.info(
+                f"Released {slots} SonicBit slots and {pending} downloads locked by {worker_id}"
+            )
+        else:
+            logger.debug(f"No locks held by {worker_id}")
 
     def clean_stale_sonicbit_and_workers(self):
         logger.debug(
@@ -51,16 +139,19 @@ class WorkerHandler:
         else:
             logger.debug("No stale workers to remove")
 
-        # Process the accounts table
+        # slots of accounts added, removed or resized since the last run
+        sync_slots(self.accounts, self.slots, self.status_counters)
+
+        # Process the slots table
         self.process_stale_sonicbit(stale_worker_ids, timeout_threshold)
 
         # Process the downloads table
         self.process_stale_downloads(stale_worker_ids, timeout_threshold)
 
     def process_stale_sonicbit(self, stale_worker_ids, timeout_threshold):
-        logger.debug("Checking for stale or orphaned SonicBit accounts")
+        logger.debug("Checking for stale or orphaned SonicBit slots")
 
-        # Find accounts that are in PROCESSING, UPLOADING, or LOCKED status and are orphaned or idle
+        # Find slots that are in PROCESSING, UPLOADING, or LOCKED status and are orphaned or idle
         pipeline = [
             {
                 "$match": {
@@ -100,33 +191,37 @@ class WorkerHandler:
             {"$project": {"_id": 1, "status": 1}},
         ]
 
-        orphaned_or_idle_accounts = list(self.accounts.aggregate(pipeline))
+        orphaned_or_idle_accounts = list(self.slots_sweep.aggregate(pipeline))
 
         if orphaned_or_idle_accounts:
             for account in orphaned_or_idle_accounts:
-                new_status = (
-                    SonicBitStatus.DOWNLOADING.value
-                    if account["status"]
-                    in [SonicBitStatus.LOCKED.value, SonicBitStatus.UPLOADING.value]
-                    else SonicBitStatus.IDLE.value
-                )
+                new_status = {
+                    SonicBitStatus.LOCKED.value: SonicBitStatus.DOWNLOADING.value,
+                    # back to the upload queue
+                    SonicBitStatus.UPLOADING.value: SonicBitStatus.COMPLETED.value,
+                }.get(account["status"], SonicBitStatus.IDLE.value)
 
-                # Update each account individually based on the condition
-                self.accounts.update_one(
-                    {"_id": account["_id"]},
+                update = {"status": new_status, "locked_by": None}
+                if new_status == SonicBitStatus.IDLE.value:
+                    update.update(IDLE_SLOT_FIELDS)
+
+                # Update each slot individually based on the condition
+                result = self.slots.update_one(
+                    {"_id": account["_id"], "status": account["status"]},
                     {
-                        "$set": {
-                            "status": new_status,
-                            "locked_by": None,
-                        }
+                        "$set": update,
+                        "$inc": {"version": 1},
                     },
                 )
+                self.status_counters.move(
+                    "slots", account["status"], new_status, result.modified_count
+                )
 
             logger.info(
-                f"Updated {len(orphaned_or_idle_accounts)} orphaned or idle SonicBit accounts"
+                f"Updated {len(orphaned_or_idle_accounts)} orphaned or idle SonicBit slots"
             )
         else:
-            logger.debug("No orphaned or idle SonicBit accounts to update")
+            logger.debug("No orphaned or idle SonicBit slots to update")
 
     def process_stale_downloads(self, stale_worker_ids, timeout_threshold):
         logger.debug("Checking for stale or orphaned downloads")
@@ -172,19 +267,11 @@ class WorkerHandler:
         ]
 
         orphaned_or_idle_download_ids = [
-            download["_id"] for download in self.downloads.aggregate(pipeline)
+            download["_id"] for download in self.downloads_sweep.aggregate(pipeline)
         ]
 
         if orphaned_or_idle_download_ids:
-            self.downloads.update_many(
-                {"_id": {"$in": orphaned_or_idle_download_ids}},
-                {
-                    "$set": {
-                        "status": DownloadStatus.PENDING.value,  # Revert to pending for reprocessing
-                        "locked_by": None,
-                    }
-                },
-            )
+            self.revert_downloads({"_id": {"$in": orphaned_or_idle_download_ids}})
 
             logger.info(
                 f"Updated {len(orphaned_or_idle_download_ids)} orphaned or idle downloads"
@@ -192,19 +279,33 @@ class WorkerHandler:
         else:
             logger.debug("No orphaned or idle downloads to update")
 
-        # Find downloads in PROCESSING that don't have a corresponding entry in the accounts table
-        processing_downloads_without_account = self.downloads.aggregate(
+        # Find downloads in PROCESSING that don't have a corresponding entry in the slots table
+        processing_downloads_without_account = self.downloads_sweep.aggregate(
             [
                 {"$match": {"status": DownloadStatus.PROCESSING.value}},
                 {
                     "$lookup": {
-                        "from": "accounts",
+                        "from": "slots",
                         "localField": "_id",
                         "foreignField": "download_id",
-                        "as": "account",
+                        "as": "slot",
+                    }
+                },
+                {
+                    "$lookup": {
+                        "from": "slots",
+                        "localField": "account",
+                        "foreignField": "_id",
+                        "as": "owner",
+                    }
+                },
+                {
+                    "$match": {
+                        "slot": {"$size": 0},  # No corresponding slot found
+                        # the owner has not written its side of the transition yet
+                        "owner.status": {"$ne": SonicBitStatus.PROCESSING.value},
                     }
                 },
-                {"$match": {"account": {"$size": 0}}},  # No corresponding account found
                 {"$project": {"_id": 1}},
             ]
         )
@@ -214,17 +315,37 @@ class WorkerHandler:
         ]
 
         if processing_download_ids_without_account:
-            self.downloads.update_many(
+            self.revert_downloads(
                 {"_id": {"$in": processing_download_ids_without_account}},
-                {
-                    "$set": {
-                        "status": DownloadStatus.PENDING.value,  # Revert to pending for reprocessing
-                        "locked_by": None,
-                    }
-                },
+                statuses=(DownloadStatus.PROCESSING,),
             )
             logger.info(
                 f"Updated {len(processing_download_ids_without_account)} processing downloads without account references to pending"
             )
         else:
             logger.debug("No processing downloads without account references found")
+
+    def revert_downloads(
+        self,
+        filter: dict,
+        statuses=(DownloadStatus.PENDING, DownloadStatus.PROCESSING),
+    ) -> int:
+        """Puts the downloads matching `filter` in `statuses` back to pending for reprocessing, returns how many"""
+        reverted = 0
+        # one write per status, so the status counters know what moved
+        for status in statuses:
+            result = self.downloads.update_many(
+                {**filter, "status": status.value},
+                {
+                    "$set": {
+                        "status": DownloadStatus.PENDING.value,
+                        "locked_by": None,
+                    },
+                    "$inc": {"version": 1},
+                },
+            )
+            self.status_counters.move(
+                "downloads", status, DownloadStatus.PENDING, result.modified_count
+            )
+            reverted += result.modified_count
+        return reverted
@@ -0,0 +1,83 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from typing import Callable, Set
+
+from rssbox.modules.metrics import hook_calls, stage_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class HookDispatcher:
+    """
+    Runs notification hooks, whose return value nobody waits for, on a small
+    thread pool so a slow hook doesn't hold up the loop that triggered it
+
+    Hooks that raise are logged and don't affect other hooks. At most `workers`
+    hooks run and `queue_size` wait at once, further calls are dropped. A call
+    still waiting `timeout` seconds after it was dispatched is dropped too, and
+    one running longer than that is logged.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float):
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="hook")
+        self.slots = BoundedSemaphore(workers + queue_size)
+        self.futures: Set[Future] = set()
+        self.lock = Lock()
+
+    def dispatch(self, hook: Callable, *args):
+        name = hook.__name__
+        if not self.slots.acquire(blocking=False):
+            logger.warning(f"Hook queue is full, dropped {name}")
+            hook_calls.inc(hook=name, outcome="dropped")
+            return
+
+        dispatched = monotonic()
+        try:
+            future = self.executor.submit(self._run, hook, name, dispatched, args)
+        except RuntimeError:  # shut down
+            self.slots.release()
+            hook_calls.inc(hook=name, outcome="dropped")
+            return
+
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future: Future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def _run(self, hook: Callable, name: str, dispatched: float, args: tuple):
+        try:
+            started = monotonic()
+            if started - dispatched > self.timeout:
+                logger.warning(
+                    f"Dropped {name}, it waited {started - dispatched:.0f}s to run"
+                )
+                hook_calls.inc(hook=name, outcome="dropped")
+                return
+
+            try:
+                hook(*args)
+            except Exception as error:
+                logger.exception(f"Error in {name} hook: {error}")
+                hook_calls.inc(hook=name, outcome="error")
+                return
+
+            seconds = monotonic() - started
+            stage_seconds.observe(seconds, stage="hook")
+            if seconds > self.timeout:
+                logger.warning(f"Hook {name} took {seconds:.0f}s")
+            hook_calls.inc(hook=name, outcome="ok")
+        finally:
+            self.slots.release()
+
+    def shutdown(self, timeout: float | None = None):
+        """Waits up to `timeout` seconds for dispatched calls, those that didn't start by then are dropped"""
+        with self.lock:
+            futures = set(self.futures)
+        wait(futures, self.timeout if timeout is None else timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
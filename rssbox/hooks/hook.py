@@ -1,4 +1,5 @@
 import logging
+from typing import List
 
 from feedparser import FeedParserDict
 
@@ -12,15 +13,32 @@ logger = logging.getLogger(__name__)
 
 
 class Hook:
-    """Base class for hooks"""
+    """
+    Base class for hooks
+
+    `on_download_timeout`, `on_after_upload_error` and `on_upload_complete` are
+    notifications, they run in the background after the loop that triggered
+    them moved on (see `HOOK_WORKERS`). The other hooks run in the loop and
+    their return value decides what happens next.
+    """
 
     def __init__(self):
         pass
 
     def on_new_entry(self, entry: FeedParserDict) -> FeedParserDict | bool:
-        """Called when a new entry is added to the database, return `True` to continue processing, `False` to stop or make changes in entry and return `FeedParserDict`"""
+        """Called when a new entry is added to the database, return `True` to continue processing, `False` to stop or make changes in entry and return `FeedParserDict`, set `entry["priority"]` to have it claimed ahead of (positive) or behind (negative) other downloads"""
         return entry
 
+    def on_new_entries(self, entries: List[FeedParserDict]) -> List[FeedParserDict]:
+        """Called with every batch of new entries of a feed, returns the entries to add to the database, by default those `on_new_entry` keeps"""
+        kept = []
+        for entry in entries:
+            if entry_result := self.on_new_entry(entry):
+                kept.append(
+                    entry_result if isinstance(entry_result, FeedParserDict) else entry
+                )
+        return kept
+
     def on_sonicbit_download_not_found(
         self, sonicbit: SonicBit, download: Download
     ) -> bool:
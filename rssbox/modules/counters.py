@@ -0,0 +1,169 @@
+import logging
+from contextlib import contextmanager
+from enum import Enum
+from threading import local
+from typing import Dict
+
+from pymongo.client_session import ClientSession
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+from rssbox.enum import DownloadStatus, SonicBitStatus
+
+logger = logging.getLogger(__name__)
+
+# counted collections, by the `_id` of their counters document, with their
+# statuses and the status of documents that have none
+COUNTED = {
+    "downloads": (DownloadStatus, DownloadStatus.PENDING),
+    "slots": (SonicBitStatus, SonicBitStatus.IDLE),
+}
+
+
+class StatusCounters:
+    """
+    Number of downloads and account slots in each status, kept in the
+    `counters` collection so reading them is one document fetch
+
+    Every write that changes a status moves one count from the old status to the
+    new one, in the same session when `USE_TRANSACTIONS` is on. Writes that
+    change many documents move as many as they modified. Downloads removed by
+    their `expire_at` index aren't seen, `reconcile` recounts the collections
+    and corrects the counts.
+    """
+
+    def __init__(self, counters: Collection, collections: Dict[str, Collection]):
+        self.counters = counters
+        self.collections = collections
+        self.local = local()
+
+    def move(
+        self,
+        name: str,
+        old: Enum | str | None,
+        new: Enum | str | None,
+        amount: int = 1,
+        session: ClientSession | None = None,
+    ):
+        """Moves `amount` documents of collection `name` from status `old` to `new`, `None` when created or deleted"""
+        old, new = _value(old), _value(new)
+        if old == new or not amount:
+            return
+
+        inc = {}
+        if old:
+            inc[old] = -amount
+        if new:
+            inc[new] = inc.get(new, 0) + amount
+
+        batch = getattr(self.local, "batch", None)
+        if batch is not None and session is None:
+            counts = batch.setdefault(name, {})
+            for status, n in inc.items():
+                counts[status] = counts.get(status, 0) + n
+            return
+        self._inc(name, inc, session)
+
+    @contextmanager
+    def batched(self):
+        """Collects the moves this thread makes inside the `with` block into one write per collection"""
+        if getattr(self.local, "batch", None) is not None:
+            yield  # already batched by an outer block
+            return
+
+        self.local.batch = {}
+        try:
+            yield
+        finally:
+            batch, self.local.batch = self.local.batch, None
+            for name, inc in batch.items():
+                self._inc(name, {status: n for status, n in inc.items() if n})
+
+    def _inc(
+        self, name: str, inc: Dict[str, int], session: ClientSession | None = None
+    ):
+        if not inc:
+            return
+        try:
+            self.counters.update_one(
+                {"_id": name},
+                {
+                    "$inc": {
+                        "version": 1,
+                        **{f"counts.{status}": n for status, n in inc.items()},
+                    }
+                },
+                upsert=True,
+                session=session,
+            )
+        except Exception as error:
+            if session:
+                raise
+            # `reconcile` corrects it, the state change itself already happened
+            logger.warning(f"Failed to count {name} by {inc}: {error}")
+
+    def get(self, name: str) -> Dict[str, int]:
+        statuses, _ = COUNTED[name]
+        document = self.counters.find_one({"_id": name}) or {}
+        counts = {status.value: 0 for status in statuses}
+        counts.update(document.get("counts") or {})
+        return counts
+
+    def count(self, name: str) -> Dict[str, int]:
+        """Counts the statuses of collection `name` with one grouped aggregation"""
+        statuses, default = COUNTED[name]
+        counts = {status.value: 0 for status in statuses}
+        for group in self.collections[name].aggregate(
+            [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        ):
+            status = group["_id"] or default.value
+            counts[status] = counts.get(status, 0) + group["count"]
+        return counts
+
+    def reconcile(self, retries: int = 3) -> Dict[str, Dict[str, int]]:
+        """
+        Sets the counters to a fresh count of each collection, returns the
+        corrections made
+
+        A count is only stored if no status changed while it ran, otherwise it
+        is tried again up to `retries` times and left for the next run.
+        """
+        corrections = {}
+        for name in COUNTED:
+            for _ in range(retries):
+                document = self.counters.find_one({"_id": name}) or {}
+                version = document.get("version")
+                counts = self.count(name)
+                stored = document.get("counts") or {}
+                if version is None:
+                    try:
+                        self.counters.insert_one(
+                            {"_id": name, "counts": counts, "version": 1}
+                        )
+                        break
+                    except DuplicateKeyError:
+                        continue  # created by a status change meanwhile
+
+                result = self.counters.update_one(
+                    {"_id": name, "version": version},
+                    {"$set": {"counts": counts}, "$inc": {"version": 1}},
+                )
+                if result.matched_count:
+                    break
+            else:
+                logger.debug(f"Statuses of {name} kept changing, not reconciled")
+                continue
+
+            changed = {
+                status: count - stored.get(status, 0)
+                for status, count in counts.items()
+                if count != stored.get(status, 0)
+            }
+            if changed:
+                corrections[name] = changed
+                logger.info(f"Corrected {name} status counters by {changed}")
+        return corrections
+
+
+def _value(status: Enum | str | None) -> str | None:
+    return status.value if isinstance(status, Enum) else status
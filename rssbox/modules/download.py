@@ -1,12 +1,19 @@
 import logging
 from datetime import datetime, timedelta, timezone
+from typing import List
 
 from bson.objectid import ObjectId
+from pymongo.client_session import ClientSession
 from pymongo.collection import Collection
 from pymongo.errors import DuplicateKeyError
 
 from rssbox.config import Config
-from rssbox.enum import DownloadStatus
+from rssbox.database import get_database
+from rssbox.enum import DownloadStage, DownloadStatus
+from rssbox.modules.errors import StaleStateError
+from rssbox.modules.progress import estimate_rate
+from rssbox.modules.scheduling import rank
+from rssbox.utils import url_key
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +25,18 @@ class Download:
     status: DownloadStatus
     hash: str | None
     locked_by: str | None
+    account: str | None
     retries: int
     expire_at: datetime | None
+    feed: str | None
+    priority: int
+    rank: datetime | None
+    timeline: dict[str, datetime]
+    progress: int | None
+    progress_at: datetime | None
+    progress_rate: float | None
+    uploaded_files: List[str]
+    version: int | None
 
     def __init__(self, client: Collection, dict: dict):
         self.client = client
@@ -27,11 +44,25 @@ class Download:
         self.name = dict["name"]
         self.id = dict["_id"]
         self.status = DownloadStatus(dict["status"])
+        # status the database has, counted out of when it changes
+        self._saved_status = self.status
 
         self.hash = dict.get("hash")
         self.locked_by = dict.get("locked_by")
+        self.account = dict.get("account")
         self.retries = dict.get("retries", 0)
         self.expire_at = dict.get("expire_at")
+        self.feed = dict.get("feed")
+        self.priority = dict.get("priority", 0)
+        self.rank = dict.get("rank")
+        self.timeline = dict.get("timeline") or {}
+        self.progress = dict.get("progress")
+        self.progress_at = dict.get("progress_at")
+        self.progress_rate = dict.get("progress_rate")
+        # paths within the torrent of the files uploaded so far
+        self.uploaded_files = dict.get("uploaded_files") or []
+        self.title_key = dict.get("title_key")
+        self.version = dict.get("version")
 
     @property
     def dict(self):
@@ -41,63 +72,140 @@ class Download:
             "status": self.status.value,
             "hash": self.hash,
             "locked_by": self.locked_by,
+            "account": self.account,
             "retries": self.retries,
             "expire_at": self.expire_at,
+            "feed": self.feed,
+            "priority": self.priority,
+            "rank": self.rank,
+            "timeline": self.timeline,
+            "progress": self.progress,
+            "progress_at": self.progress_at,
+            "progress_rate": self.progress_rate,
+            "uploaded_files": self.uploaded_files,
+            "title_key": self.title_key,
         }
 
-    def save(self):
-        self.client.update_one({"_id": self.id}, {"$set": self.dict}, upsert=True)
+    @property
+    def history(self) -> dict:
+        """Compact record of the download's stage timestamps, kept after it is deleted"""
+        return {
+            "_id": self.id,
+            "feed": self.feed,
+            "title_key": self.title_key,
+            "retries": self.retries,
+            "timeline": self.timeline,
+        }
+
+    def stage(self, stage: DownloadStage):
+        """Stamps `stage` in memory, it is persisted with the next state change"""
+        self.timeline[stage.value] = datetime.now(timezone.utc)
 
-    def mark_as_processing(self, hash: str):
+    def save(self, session: ClientSession | None = None):
+        """Writes the download if nobody changed it since it was read, raises `StaleStateError` otherwise"""
+        result = self.client.update_one(
+            {"_id": self.id, "version": self.version},
+            {"$set": self.dict, "$inc": {"version": 1}},
+            session=session,
+        )
+        if not result.matched_count:
+            raise StaleStateError(f"Download {self.name} was changed by another worker")
+        self.version = (self.version or 0) + 1
+        get_database().status_counters.move(
+            "downloads", self._saved_status, self.status, session=session
+        )
+        self._saved_status = self.status
+
+    def record_progress(self, progress: int, reported_rate: float | None = None):
+        """Stores the torrent's progress and its estimated rate in percent per second"""
+        now = datetime.now(timezone.utc)
+        previous_at = self.progress_at
+        if previous_at and previous_at.tzinfo is None:
+            previous_at = previous_at.replace(tzinfo=timezone.utc)
+        self.progress_rate = estimate_rate(
+            progress,
+            now,
+            self.progress,
+            previous_at,
+            self.progress_rate,
+            reported_rate,
+        )
+        self.progress = progress
+        self.progress_at = now
+        self.save()
+
+    def mark_file_uploaded(self, path: str):
+        self.uploaded_files.append(path)
+        self.save()
+
+    def mark_as_processing(
+        self, hash: str, account: str, session: ClientSession | None = None
+    ):
         self.status = DownloadStatus.PROCESSING
         self.hash = hash
+        self.account = account
         self.locked_by = None
-        self.save()
+        self.save(session=session)
 
-    def mark_as_pending(self):
+    def mark_as_pending(self, session: ClientSession | None = None):
         self.status = DownloadStatus.PENDING
         self.hash = None
+        self.account = None
+        self.progress = self.progress_at = self.progress_rate = None
         self.locked_by = None
-        self.save()
+        self.save(session=session)
 
-    def mark_as_failed(self, soft=False):
+    def mark_as_failed(self, soft=False, session: ClientSession | None = None):
         if not soft:
             self.retries += 1
 
         if self.retries >= Config.DOWNLOAD_RETRIES:
             logger.warning(f"Retry limit reached for {self.name}")
             self._stop_with_status(
-                DownloadStatus.ERROR, Config.DOWNLOAD_ERROR_RECORD_EXPIRY
+                DownloadStatus.ERROR, Config.DOWNLOAD_ERROR_RECORD_EXPIRY, session
             )
         else:
-            self.mark_as_pending()
+            self.mark_as_pending(session=session)
 
-    def mark_as_timeout(self):
+    def mark_as_timeout(self, session: ClientSession | None = None):
         self._stop_with_status(
-            DownloadStatus.TIMEOUT, Config.DOWNLOAD_TIMEOUT_RECORD_EXPIRY
+            DownloadStatus.TIMEOUT, Config.DOWNLOAD_TIMEOUT_RECORD_EXPIRY, session
         )
 
-    def mark_as_too_large(self):
+    def mark_as_too_large(self, session: ClientSession | None = None):
         self._stop_with_status(
-            DownloadStatus.TOO_LARGE, Config.DOWNLOAD_TOO_LARGE_RECORD_EXPIRY
+            DownloadStatus.TOO_LARGE, Config.DOWNLOAD_TOO_LARGE_RECORD_EXPIRY, session
         )
 
-    def _stop_with_status(self, status: DownloadStatus, expire_in_seconds: int = None):
+    def _stop_with_status(
+        self,
+        status: DownloadStatus,
+        expire_in_seconds: int = None,
+        session: ClientSession | None = None,
+    ):
         self.status = status
         self.hash = None
+        self.account = None
         self.locked_by = None
         if expire_in_seconds:
             self.expire_at = datetime.now(timezone.utc) + timedelta(
                 seconds=expire_in_seconds
             )
-        self.save()
+        self.save(session=session)
 
     def unlock(self):
         self.locked_by = None
         self.save()
 
-    def delete(self):
-        self.client.delete_one({"_id": self.id})
+    def delete(self, session: ClientSession | None = None):
+        result = self.client.delete_one(
+            {"_id": self.id, "version": self.version}, session=session
+        )
+        if not result.deleted_count:
+            raise StaleStateError(f"Download {self.name} was changed by another worker")
+        get_database().status_counters.move(
+            "downloads", self._saved_status, None, session=session
+        )
 
     @staticmethod
     def create(
@@ -105,19 +213,32 @@ class Download:
         name: str,
         url: str,
         status: DownloadStatus = DownloadStatus.PENDING,
+        feed: str | None = None,
+        priority: int = 0,
+        title_key: str | None = None,
     ) -> ObjectId:
         document_id = ObjectId()
+        now = datetime.now(timezone.utc)
         document = {
             "url": url,
+            "url_key": url_key(url),
             "name": name,
             "status": status.value,
             "_id": document_id,
+            "feed": feed,
+            "priority": priority,
+            "rank": rank(now, priority),
+            "version": 0,
+            "timeline": {DownloadStage.INGESTED.value: now},
         }
+        if title_key:
+            document["title_key"] = title_key
 
         try:
             client.insert_one(document)
+            get_database().status_counters.move("downloads", None, status)
             return document_id
         except DuplicateKeyError:
             logger.debug(f"Duplicate key for download: {name}")
-            result = client.find_one({"url": url})
+            result = client.find_one({"url_key": document["url_key"]}, {"_id": 1})
             return result["_id"]
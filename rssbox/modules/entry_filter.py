@@ -0,0 +1,228 @@
+import logging
+import re
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, List, Set, Tuple
+
+from feedparser import FeedParserDict
+from pymongo.collection import Collection
+
+from rssbox.modules.metrics import filtered_entries, stage_seconds
+
+logger = logging.getLogger(__name__)
+
+# rules of this `_id` apply to every feed, before the feed's own rules
+ALL_FEEDS = "*"
+
+_BRACKETED = re.compile(r"\[[^\]]*\]|\([^)]*\)|\{[^}]*\}")
+_SEPARATORS = re.compile(r"[\W_]+")
+_GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+
+def normalize_title(title: str) -> str:
+    """Key two releases of the same title share, bracketed tags and punctuation dropped"""
+    title = _BRACKETED.sub(" ", title.lower())
+    return _SEPARATORS.sub(" ", title).strip()
+
+
+def entry_size(entry: FeedParserDict) -> int | None:
+    """Size in bytes a torznab attribute or the first enclosure announces"""
+    # `FeedParserDict` derives enclosures from links, the streaming parser stores them
+    enclosures = entry.get("enclosures") or dict.get(entry, "enclosures") or []
+    for value in (
+        (entry.get("torznab_attrs") or {}).get("size"),
+        *(enclosure.get("length") for enclosure in enclosures),
+    ):
+        try:
+            if size := int(value):
+                return size
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def entry_categories(entry: FeedParserDict) -> Set[str]:
+    categories = {
+        str(tag.get("term")).lower()
+        for tag in entry.get("tags") or []
+        if tag.get("term")
+    }
+    if category := (entry.get("torznab_attrs") or {}).get("category"):
+        categories.update(value.strip().lower() for value in category.split(","))
+    return categories
+
+
+def _group(pattern: str) -> str:
+    """`pattern` as a group of an alternation, leading global flags like `(?i)` scoped to it"""
+    if flags := _GLOBAL_FLAGS.match(pattern):
+        return f"(?{flags[1]}:{pattern[flags.end():]})"
+    return f"(?:{pattern})"
+
+
+def _combine(patterns: Iterable[str] | None, feed: str) -> re.Pattern | None:
+    """
+    One case insensitive alternation of the valid `patterns`, raises `re.error`
+    when they are only invalid together, e.g. reuse a group name
+    """
+    valid = []
+    for pattern in patterns or []:
+        group = _group(pattern)
+        try:
+            re.compile(group)
+        except re.error as error:
+            logger.warning(
+                f"Skipping invalid filter pattern {pattern!r} of {feed}: {error}"
+            )
+            continue
+        valid.append(group)
+    return re.compile("|".join(valid), re.IGNORECASE) if valid else None
+
+
+class EntryFilter:
+    """
+    Compiled rules of one `entry_filters` document
+
+    :param rules: `include` and `exclude` title patterns, `min_size` and
+        `max_size` in bytes, `categories` an entry needs one of and `dedupe` to
+        drop entries whose normalized title was already ingested
+    """
+
+    def __init__(self, rules: dict):
+        feed = rules.get("_id")
+        self.include = _combine(rules.get("include"), feed)
+        self.exclude = _combine(rules.get("exclude"), feed)
+        self.min_size = rules.get("min_size")
+        self.max_size = rules.get("max_size")
+        self.categories = {
+            str(value).lower() for value in rules.get("categories") or []
+        }
+        self.dedupe = bool(rules.get("dedupe"))
+
+    def rejects(self, entry: FeedParserDict) -> str | None:
+        """Name of the rule `entry` fails, `None` when it passes"""
+        title = entry.get("title", "")
+        if self.include and not self.include.search(title):
+            return "include"
+        if self.exclude and self.exclude.search(title):
+            return "exclude"
+        if self.min_size or self.max_size:
+            size = entry_size(entry)
+            if size is not None and (
+                (self.min_size and size < self.min_size)
+                or (self.max_size and size > self.max_size)
+            ):
+                return "size"
+        if self.categories and not self.categories & entry_categories(entry):
+            return "category"
+        return None
+
+
+class EntryFilters:
+    """
+    Per feed filter rules from the `entry_filters` collection, applied to
+    batches of new entries before they are ingested
+
+    The rules are read again at most every `reload_interval` seconds, and only
+    documents that changed are compiled again.
+    """
+
+    def __init__(
+        self,
+        rules: Collection,
+        downloads: Collection,
+        download_history: Collection,
+        reload_interval: int,
+    ):
+        self.rules = rules
+        self.downloads = downloads
+        self.download_history = download_history
+        self.reload_interval = reload_interval
+        self.compiled: Dict[str, Tuple[str, EntryFilter]] = {}
+        self.loaded_at: float | None = None
+        self.lock = Lock()
+
+    def reload(self, force: bool = False):
+        with self.lock:
+            now = monotonic()
+            if (
+                not force
+                and self.loaded_at is not None
+                and now - self.loaded_at < self.reload_interval
+            ):
+                return
+            self.loaded_at = now
+
+            try:
+                documents = list(self.rules.find())
+            except Exception as error:
+                logger.warning(
+                    f"Failed to load entry filters, keeping the last: {error}"
+                )
+                return
+
+            compiled = {}
+            for document in documents:
+                key = repr(sorted(document.items()))
+                previous = self.compiled.get(document["_id"])
+                if previous and previous[0] == key:
+                    compiled[document["_id"]] = previous
+                    continue
+                try:
+                    compiled[document["_id"]] = (key, EntryFilter(document))
+                    logger.info(f"Compiled entry filter of {document['_id']}")
+                except re.error as error:
+                    logger.warning(
+                        f"Failed to compile entry filter of {document['_id']}, keeping the last: {error}"
+                    )
+                    if previous:
+                        compiled[document["_id"]] = previous
+            self.compiled = compiled
+
+    def filters(self, feed: str) -> List[EntryFilter]:
+        self.reload()
+        return [self.compiled[id][1] for id in (ALL_FEEDS, feed) if id in self.compiled]
+
+    def apply(self, feed: str, entries: List[FeedParserDict]) -> List[FeedParserDict]:
+        """Entries of `feed` that pass its rules, with `title_key` set when they are deduplicated"""
+        filters = self.filters(feed)
+        if not filters:
+            return entries
+
+        with stage_seconds.time(stage="entry_filter"):
+            kept = []
+            for entry in entries:
+                for entry_filter in filters:
+                    if reason := entry_filter.rejects(entry):
+                        filtered_entries.inc(reason=reason)
+                        break
+                else:
+                    kept.append(entry)
+
+            if any(entry_filter.dedupe for entry_filter in filters):
+                kept = self.dedupe(feed, kept)
+
+        if len(kept) < len(entries):
+            logger.info(
+                f"Filtered out {len(entries) - len(kept)} of {len(entries)} entries"
+            )
+        return kept
+
+    def dedupe(self, feed: str, entries: List[FeedParserDict]) -> List[FeedParserDict]:
+        """Drops entries whose normalized title is repeated in the batch or was ingested before"""
+        if not entries:
+            return entries
+        for entry in entries:
+            entry["title_key"] = normalize_title(entry.get("title", ""))
+        keys = list({entry["title_key"] for entry in entries})
+        query = {"feed": feed, "title_key": {"$in": keys}}
+        seen = set(self.downloads.distinct("title_key", query))
+        seen.update(self.download_history.distinct("title_key", query))
+
+        kept = []
+        for entry in entries:
+            if entry["title_key"] in seen:
+                filtered_entries.inc(reason="duplicate")
+                continue
+            seen.add(entry["title_key"])
+            kept.append(entry)
+        return kept
@@ -11,4 +11,16 @@ class TooLargeTorrentError(Exception):
 
 
 class VerifyDownloadTimeoutError(Exception):
-    """Raised when the verify download times out"""
\ No newline at end of file
+    """Raised when the verify download times out"""
+
+
+class UnsupportedFeedError(Exception):
+    """Raised when the streaming feed parser can't handle a feed"""
+
+
+class StaleStateError(Exception):
+    """Raised when a document changed since it was read, another worker took it over"""
+
+
+class StorageFullError(Exception):
+    """Raised when an account's storage is too full to add another torrent"""
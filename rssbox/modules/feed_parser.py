@@ -0,0 +1,144 @@
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from time import struct_time
+from typing import Callable, Iterable, List
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+from feedparser import FeedParserDict
+
+from rssbox.modules.errors import UnsupportedFeedError
+
+ATTRIBUTE_TAGS = (
+    "{http://torznab.com/schemas/2015/feed}attr",
+    "{http://www.newznab.com/DTD/2010/feeds/attributes/}attr",
+)
+
+
+class StreamingFeedParser:
+    """
+    Incremental parser for plain RSS 2.0 and torznab/newznab feeds
+
+    Only the fields rssbox uses are extracted (title, link, guid, publish date,
+    enclosures, categories and torznab attributes) and parsing stops at the first
+    entry published at or before `stop_at`, as long as the feed was sorted newest
+    first up to that point. Anything else (Atom, RDF, malformed XML, missing or
+    unparsable dates) raises `UnsupportedFeedError`, the bytes read so far are
+    kept in `body` so the caller can hand the whole document to feedparser.
+    """
+
+    def __init__(self, to_datetime: Callable[[struct_time], datetime]):
+        """
+        :param to_datetime: converts a `published_parsed` struct to the datetime compared with `stop_at`
+        """
+        self.to_datetime = to_datetime
+        self.body = b""
+        self.newest: datetime | None = None
+
+    def parse(
+        self, chunks: Iterable[bytes], stop_at: datetime | None = None
+    ) -> List[FeedParserDict]:
+        """
+        Parses entries newer than `stop_at`, newest first
+
+        :param chunks: the feed document, as an iterable of byte chunks
+        :param stop_at: stop at the first entry published at or before this
+        """
+        parser = XMLPullParser(events=("start", "end"))
+        buffered = []
+        entries = []
+        stack = []
+        previous = None
+        sorted_so_far = True
+        try:
+            for chunk in chunks:
+                buffered.append(chunk)
+                parser.feed(chunk)
+                for event, element in parser.read_events():
+                    if event == "start":
+                        if not stack and element.tag != "rss":
+                            raise UnsupportedFeedError(
+                                f"Unsupported feed root <{element.tag}>"
+                            )
+                        stack.append(element)
+                        continue
+
+                    stack.pop()
+                    if element.tag != "item" or len(stack) != 2:
+                        continue
+
+                    entry = self._entry(element)
+                    stack[-1].remove(element)  # keep memory flat on large feeds
+                    published = self.to_datetime(entry.published_parsed)
+                    if previous is not None and published > previous:
+                        sorted_so_far = False
+                    previous = published
+                    if self.newest is None or published > self.newest:
+                        self.newest = published
+
+                    if stop_at is None or published > stop_at:
+                        entries.append(entry)
+                    elif sorted_so_far:
+                        return entries
+            parser.close()
+        except ParseError as error:
+            raise UnsupportedFeedError(f"Malformed feed: {error}") from None
+        finally:
+            self.body = b"".join(buffered)
+
+        return entries
+
+    @staticmethod
+    def _entry(item) -> FeedParserDict:
+        entry = FeedParserDict()
+        enclosures = []
+        tags = []
+        attributes = {}
+        for child in item:
+            tag = child.tag
+            text = (child.text or "").strip()
+            if tag == "title":
+                entry["title"] = text
+            elif tag == "link":
+                entry["link"] = text
+            elif tag == "guid":
+                entry["id"] = text
+            elif tag == "pubDate":
+                entry["published"] = text
+            elif tag == "category":
+                tags.append(FeedParserDict(term=text, scheme=None, label=None))
+            elif tag == "enclosure":
+                enclosures.append(
+                    FeedParserDict(
+                        href=child.get("url", ""),
+                        length=child.get("length", ""),
+                        type=child.get("type", ""),
+                    )
+                )
+            elif tag in ATTRIBUTE_TAGS:
+                name, value = child.get("name"), child.get("value")
+                if name in attributes:
+                    attributes[name] += f",{value}"
+                else:
+                    attributes[name] = value
+
+        if not entry.get("title"):
+            raise UnsupportedFeedError("Feed entry without a title")
+        if not entry.get("link"):
+            if not enclosures:
+                raise UnsupportedFeedError(f"Feed entry without a link: {entry.title}")
+            entry["link"] = enclosures[0].href
+
+        try:
+            published = parsedate_to_datetime(entry["published"])
+        except (KeyError, TypeError, ValueError):
+            raise UnsupportedFeedError(
+                f"Feed entry without a valid pubDate: {entry.title}"
+            ) from None
+        # same UTC struct_time feedparser produces
+        entry["published_parsed"] = published.utctimetuple()
+
+        entry["enclosures"] = enclosures
+        entry["tags"] = tags
+        if attributes:
+            entry["torznab_attrs"] = attributes
+        return entry
@@ -1,5 +1,6 @@
 import logging
 from datetime import datetime, timezone
+from typing import Callable
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from pymongo.collection import Collection
@@ -14,11 +15,13 @@ class Heartbeat:
         client: Collection,
         scheduler: BackgroundScheduler,
         interval: int = 30,
+        load: Callable[[], dict] | None = None,
     ):
         self.id = id
         self.client = client
         self.scheduler = scheduler
         self.HEARTBEAT_INTERVAL = interval
+        self.load = load
 
     def start_heartbeat(self):
         logger.debug(f"Starting heartbeat for {self.id}")
@@ -39,11 +42,10 @@ class Heartbeat:
 
     def heartbeat(self):
         logger.debug(f"Updating heartbeat for {self.id}")
-        self.client.update_one(
-            {"_id": self.id},
-            {"$set": {"last_heartbeat": datetime.now(tz=timezone.utc)}},
-            upsert=True,
-        )
+        update = {"last_heartbeat": datetime.now(tz=timezone.utc)}
+        if self.load:
+            update["load"] = self.load()
+        self.client.update_one({"_id": self.id}, {"$set": update}, upsert=True)
 
     @property
     def heartbeat_id(self):
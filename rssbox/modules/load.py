@@ -0,0 +1,168 @@
+import logging
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Dict
+
+from pymongo.collection import Collection
+
+from rssbox.modules.timeline import percentile
+
+logger = logging.getLogger(__name__)
+
+
+class PeerLoads:
+    """
+    Most free capacity of each kind of work other live workers reported in
+    their heartbeats, read again at most every `refresh_interval` seconds
+    """
+
+    def __init__(
+        self,
+        workers: Collection,
+        worker_id: str,
+        stale_after: int,
+        refresh_interval: float = 5,
+    ):
+        """
+        :param stale_after: seconds after its last heartbeat a worker is ignored
+        """
+        self.workers = workers
+        self.worker_id = worker_id
+        self.stale_after = stale_after
+        self.refresh_interval = refresh_interval
+        self.free: Dict[str, int] = {}
+        self.read_at: float | None = None
+        self.lock = Lock()
+
+    def most_free(self, kind: str) -> int:
+        with self.lock:
+            now = monotonic()
+            if self.read_at is None or now - self.read_at >= self.refresh_interval:
+                self.read_at = now
+                try:
+                    self.free = self.read()
+                except Exception as error:
+                    logger.warning(f"Failed to read the load of other workers: {error}")
+                    self.free = {}
+            return self.free.get(kind, 0)
+
+    def read(self) -> Dict[str, int]:
+        threshold = datetime.now(tz=timezone.utc) - timedelta(seconds=self.stale_after)
+        free = {}
+        for worker in self.workers.find(
+            {"_id": {"$ne": self.worker_id}, "last_heartbeat": {"$gte": threshold}},
+            {"load.free": 1},
+        ):
+            for kind, count in ((worker.get("load") or {}).get("free") or {}).items():
+                free[kind] = max(free.get(kind, 0), count)
+        return free
+
+
+class Reservation:
+    """A slot of `WorkerLoad.slot`, false when none was free"""
+
+    def __init__(self, reserved: bool):
+        self.reserved = reserved
+        self.started: float | None = None
+
+    def __bool__(self) -> bool:
+        return self.reserved
+
+    def claimed(self):
+        """Marks that work was claimed for the slot, its latency counts from here"""
+        self.started = perf_counter()
+
+
+class WorkerLoad:
+    """
+    In-flight work and recent latencies of one worker, reported in its heartbeat
+
+    With `peers`, a worker that already runs work of a kind leaves the next
+    item to a live peer that reported more free capacity of that kind. It
+    leaves it for at most `max_defer` seconds, after which the peer's report
+    is as old as a heartbeat or the peer doesn't run that kind of work, and
+    the worker claims again until it runs out of work or the peer has less
+    free capacity.
+    """
+
+    # latencies kept per kind of work
+    WINDOW = 50
+
+    def __init__(
+        self,
+        capacity: Dict[str, int],
+        peers: PeerLoads | None = None,
+        max_defer: float = 30,
+    ):
+        """
+        :param capacity: how many of each kind of work (add, check, upload) may run at once
+        """
+        self.capacity = capacity
+        self.peers = peers
+        self.max_defer = max_defer
+        self.in_flight = {kind: 0 for kind in capacity}
+        self.latencies = {kind: deque(maxlen=self.WINDOW) for kind in capacity}
+        self.deferred_since: Dict[str, float] = {}
+        self.overridden: Dict[str, bool] = {}
+        self.lock = Lock()
+
+    def defers(self, kind: str, free: int, peer_free: int) -> bool:
+        """Whether the next `kind` item is left to a peer, called with the lock held"""
+        if free == self.capacity[kind] or peer_free <= free:
+            # idle or the least loaded, it claims and defers again next time
+            self.deferred_since.pop(kind, None)
+            self.overridden.pop(kind, None)
+            return False
+        if self.overridden.get(kind):
+            return False
+
+        since = self.deferred_since.setdefault(kind, monotonic())
+        if monotonic() - since >= self.max_defer:
+            self.overridden[kind] = True
+            logger.debug(f"Other workers didn't take {kind} work, claiming it")
+            return False
+        return True
+
+    @contextmanager
+    def slot(self, kind: str):
+        """Reserves a `kind` slot for the block, yields a false `Reservation` when all are busy"""
+        peer_free = self.peers.most_free(kind) if self.peers else 0
+        with self.lock:
+            free = self.capacity[kind] - self.in_flight[kind]
+            reserved = free > 0 and not self.defers(kind, free, peer_free)
+            if reserved:
+                self.in_flight[kind] += 1
+
+        reservation = Reservation(reserved)
+        if not reserved:
+            yield reservation
+            return
+
+        try:
+            yield reservation
+        finally:
+            with self.lock:
+                self.in_flight[kind] -= 1
+                # polls that found no work would drag the latencies towards zero
+                if reservation.started is not None:
+                    self.latencies[kind].append(perf_counter() - reservation.started)
+
+    @property
+    def dict(self) -> dict:
+        with self.lock:
+            return {
+                "in_flight": dict(self.in_flight),
+                "capacity": dict(self.capacity),
+                "free": {
+                    kind: max(self.capacity[kind] - self.in_flight[kind], 0)
+                    for kind in self.capacity
+                },
+                "latency_p50": {
+                    kind: round(percentile(sorted(values), 50), 3)
+                    for kind, values in self.latencies.items()
+                    if values
+                },
+            }
@@ -0,0 +1,335 @@
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+    1800,
+    3600,
+)
+THROUGHPUT_BUCKETS = tuple(
+    2**i * 1024 * 1024 for i in range(0, 11)
+)  # 1 MiB/s to 1 GiB/s
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], **extra):
+    pairs = list(zip(labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type: str = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[list, list]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent inside the `with` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        """Decorator observing the wall time of every call"""
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], [0.0]))
+        return sum(counts)
+
+    def sum(self, **labels) -> float:
+        _, total = self._values.get(self._key(labels), ([0], [0.0]))
+        return total[0]
+
+    def samples(self):
+        with self._lock:
+            items = [
+                (key, list(counts), total[0])
+                for key, (counts, total) in self._values.items()
+            ]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    _format_labels(self.labelnames, key, le=_format_value(bound)),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+stage_seconds: Histogram = registry.register(
+    Histogram(
+        "rssbox_stage_seconds",
+        "Time spent in each pipeline stage",
+        labelnames=("stage",),
+    )
+)
+upload_bytes: Counter = registry.register(
+    Counter("rssbox_upload_bytes_total", "Bytes of completed torrents uploaded")
+)
+upload_throughput: Histogram = registry.register(
+    Histogram(
+        "rssbox_upload_throughput_bytes_per_second",
+        "Upload throughput per completed torrent",
+        buckets=THROUGHPUT_BUCKETS,
+    )
+)
+api_wait_seconds: Histogram = registry.register(
+    Histogram(
+        "rssbox_api_rate_limit_wait_seconds",
+        "Time SonicBit API calls waited for the rate limiter",
+        labelnames=("call_class",),
+    )
+)
+hook_calls: Counter = registry.register(
+    Counter(
+        "rssbox_hook_calls_total",
+        "Notification hooks run in the background by outcome",
+        labelnames=("hook", "outcome"),
+    )
+)
+filtered_entries: Counter = registry.register(
+    Counter(
+        "rssbox_filtered_entries_total",
+        "New feed entries dropped by entry filters by rule",
+        labelnames=("reason",),
+    )
+)
+mongo_command_seconds: Histogram = registry.register(
+    Histogram(
+        "rssbox_mongo_command_seconds",
+        "MongoDB command round trips by connection role",
+        labelnames=("role",),
+    )
+)
+mongo_checkout_seconds: Histogram = registry.register(
+    Histogram(
+        "rssbox_mongo_checkout_seconds",
+        "Time MongoDB commands waited for a pooled connection by connection role",
+        labelnames=("role",),
+    )
+)
+mongo_connections: Gauge = registry.register(
+    Gauge(
+        "rssbox_mongo_connections",
+        "Pooled MongoDB connections by connection role, open and in use",
+        labelnames=("role", "state"),
+    )
+)
+downloads_by_status: Gauge = registry.register(
+    Gauge("rssbox_downloads", "Downloads by status", labelnames=("status",))
+)
+accounts_by_status: Gauge = registry.register(
+    Gauge("rssbox_accounts", "SonicBit account slots by status", labelnames=("status",))
+)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: Registry = registry
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics request from {self.address_string()}: {format % args}")
+
+
+class MetricsServer:
+    def __init__(self, host: str, port: int, registry: Registry = registry):
+        handler = type(
+            "MetricsRequestHandler", (_MetricsRequestHandler,), {"registry": registry}
+        )
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = Thread(
+            target=self.server.serve_forever, name="metrics-server", daemon=True
+        )
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def start(self):
+        host, port = self.address
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,100 @@
+import logging
+from threading import local
+from time import perf_counter
+from typing import Dict
+from urllib.parse import parse_qsl
+
+from pymongo import monitoring
+
+from rssbox.config import Config
+from rssbox.modules.metrics import (
+    mongo_checkout_seconds,
+    mongo_command_seconds,
+    mongo_connections,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT = "default"
+HEARTBEAT = "heartbeat"
+ANALYTICS = "analytics"
+
+# MongoClient options each role starts from, every role has its own connection
+# pool so one can't queue behind another
+ROLES: Dict[str, dict] = {
+    # claims, state transitions and everything else, with the url's settings
+    DEFAULT: {},
+    # worker heartbeats and check timestamps, acknowledged by the primary alone
+    # and failing fast, a late heartbeat makes a healthy worker look stale
+    HEARTBEAT: {
+        "maxPoolSize": 4,
+        "w": 1,
+        "journal": False,
+        "serverSelectionTimeoutMS": 5000,
+        "socketTimeoutMS": 10000,
+    },
+    # read-only sweeps over whole collections, `readPreference=secondaryPreferred`
+    # moves `stats` off the primary, the stale lock sweeps always read the primary
+    ANALYTICS: {"maxPoolSize": 4, "socketTimeoutMS": 120000},
+}
+
+
+def role_options(role: str) -> dict:
+    """MongoClient options of `role`, its defaults updated with `MONGO_<ROLE>_OPTIONS`"""
+    options = dict(ROLES[role])
+    options.update(parse_qsl(Config.MONGO_OPTIONS.get(role, "")))
+    return options
+
+
+class RoleMonitor(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """Records command latency and connection pool use of one role's client"""
+
+    def __init__(self, role: str):
+        self.role = role
+        self.checkouts = local()
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, role=self.role)
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, role=self.role)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_connections.inc(role=self.role, state="open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_connections.dec(role=self.role, state="open")
+
+    def connection_check_out_started(self, event):
+        self.checkouts.started = perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self.checkouts.started = None
+
+    def connection_checked_out(self, event):
+        started = getattr(self.checkouts, "started", None)
+        if started is not None:
+            mongo_checkout_seconds.observe(perf_counter() - started, role=self.role)
+            self.checkouts.started = None
+        mongo_connections.inc(role=self.role, state="in_use")
+
+    def connection_checked_in(self, event):
+        mongo_connections.dec(role=self.role, state="in_use")
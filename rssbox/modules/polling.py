@@ -0,0 +1,55 @@
+from datetime import datetime
+from typing import List
+
+from rssbox.config import Config
+
+
+def update_mean_interval(
+    mean_interval: float | None, previous: datetime, published: List[datetime]
+) -> float | None:
+    """
+    Folds the gaps between `previous` and the sorted `published` times of new
+    entries into the exponentially weighted mean seconds between entries
+
+    Gaps are capped at `Config.RSS_MAX_INTERVAL`, longer ones (a feed added
+    long after its last entry, downtime) poll no less often anyway.
+    """
+    for published_at in published:
+        gap = (published_at - previous).total_seconds()
+        previous = published_at
+        if gap < 0:
+            continue
+        gap = min(gap, Config.RSS_MAX_INTERVAL)
+        mean_interval = (
+            gap
+            if mean_interval is None
+            else Config.RSS_EWMA_ALPHA * gap
+            + (1 - Config.RSS_EWMA_ALPHA) * mean_interval
+        )
+    return mean_interval
+
+
+def poll_interval(
+    mean_interval: float | None,
+    quiet_for: float,
+    errors: int = 0,
+) -> int:
+    """
+    Seconds until a feed is fetched again
+
+    A feed is polled about once per expected entry. A feed that stayed quiet for
+    longer than its mean interval is polled as rarely as it has been quiet, so
+    feeds that stopped posting back off gradually. Every consecutive error
+    doubles the interval right away.
+
+    :param mean_interval: mean seconds between entries, `None` before any were seen
+    :param quiet_for: seconds since the newest entry
+    :param errors: consecutive failed checks
+    """
+    if mean_interval is None:
+        interval = Config.RSS_DEFAULT_INTERVAL
+    else:
+        interval = max(mean_interval, quiet_for)
+    if errors:
+        interval = max(interval, Config.RSS_MIN_INTERVAL) * 2 ** min(errors, 16)
+    return int(min(max(interval, Config.RSS_MIN_INTERVAL), Config.RSS_MAX_INTERVAL))
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from sonicbit.types import Torrent
+
+from rssbox.config import Config
+
+RATE_UNITS = {
+    "b/s": 1,
+    "kb/s": 1024,
+    "mb/s": 1024**2,
+    "gb/s": 1024**3,
+}
+
+
+def reported_rate(torrent: Torrent) -> float | None:
+    """Download rate SonicBit reports for `torrent`, in percent per second"""
+    multiplier = RATE_UNITS.get(str(torrent.download_rate_unit).lower())
+    try:
+        rate = float(torrent.download_rate_value) * multiplier
+    except (TypeError, ValueError):
+        return None
+    return rate / torrent.size * 100 if torrent.size else None
+
+
+def estimate_rate(
+    progress: int,
+    now: datetime,
+    previous_progress: int | None,
+    previous_at: datetime | None,
+    previous_rate: float | None,
+    reported: float | None,
+) -> float | None:
+    """
+    Percent per second a torrent progresses at
+
+    Progress observed between two checks is averaged with the previous estimate,
+    the rate SonicBit reports is only used until there are two checks.
+    """
+    if previous_progress is None or previous_at is None:
+        return reported
+
+    seconds = (now - previous_at).total_seconds()
+    if seconds <= 0:
+        return previous_rate
+    observed = max(progress - previous_progress, 0) / seconds
+    return observed if previous_rate is None else (observed + previous_rate) / 2
+
+
+def next_check_delay(progress: int, rate: float | None, parts: int = 1) -> int:
+    """
+    Seconds until a torrent at `progress` percent is expected to complete, within the check delay bounds
+
+    :param parts: files left to finish, the next one is expected after an even share of the rest
+    """
+    if not rate:
+        return Config.CHECK_MAX_DELAY
+    eta = (100 - progress) / rate / max(parts, 1)
+    return int(min(max(eta, Config.CHECK_MIN_DELAY), Config.CHECK_MAX_DELAY))
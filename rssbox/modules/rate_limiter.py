@@ -0,0 +1,160 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import sleep, time
+from typing import Dict
+
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+from rssbox.modules.metrics import api_wait_seconds
+
+logger = logging.getLogger(__name__)
+
+# share of a bucket kept for the classes above, when tokens run low checks of
+# running downloads go first and purges of idle accounts last
+CALL_CLASS_RESERVES = {
+    "check": 0.0,
+    "upload": 0.0,
+    "add": 0.25,
+    "purge": 0.5,
+}
+
+_call_class: ContextVar[str] = ContextVar("call_class", default="check")
+
+
+@contextmanager
+def call_class(name: str):
+    """API calls made in the block are rate limited as `name`"""
+    token = _call_class.set(name)
+    try:
+        yield
+    finally:
+        _call_class.reset(token)
+
+
+class TokenBucket:
+    """Token bucket stored in a document so every worker process shares it"""
+
+    def __init__(self, collection: Collection, key: str, rate: float, capacity: int):
+        """
+        :param rate: tokens added per second
+        :param capacity: most tokens the bucket holds, the allowed burst
+        """
+        self.collection = collection
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.state: dict | None = None
+        self.lock = Lock()
+
+    def take(self, reserve: float = 0) -> float:
+        """
+        Takes one token if more than `reserve` tokens would be left
+
+        Returns 0 when the token was taken, otherwise the seconds to wait before
+        trying again. The document is updated with a compare-and-set on the
+        state this worker saw last, so an uncontended take is a single update
+        and the document is only read again after another worker changed it.
+        """
+        with self.lock:
+            if self.state is None:
+                self.state = self.collection.find_one({"_id": self.key})
+            if self.state is None:
+                self.state = {
+                    "_id": self.key,
+                    "tokens": self.capacity - 1,
+                    "updated_at": time(),
+                }
+                try:
+                    self.collection.insert_one(dict(self.state))
+                    return 0
+                except DuplicateKeyError:
+                    self.state = None
+                    return 0.01
+
+            now = time()
+            tokens = min(
+                self.capacity,
+                self.state["tokens"]
+                + max(now - self.state["updated_at"], 0) * self.rate,
+            )
+            # other workers only ever take tokens, the bucket has at most this many
+            if tokens - 1 < reserve:
+                return (reserve + 1 - tokens) / self.rate
+
+            result = self.collection.update_one(
+                {
+                    "_id": self.key,
+                    "tokens": self.state["tokens"],
+                    "updated_at": self.state["updated_at"],
+                },
+                {"$set": {"tokens": tokens - 1, "updated_at": now}},
+            )
+            if result.modified_count:
+                self.state = {"_id": self.key, "tokens": tokens - 1, "updated_at": now}
+                return 0
+
+            self.state = None  # changed by another worker, read it again
+            return 0.01
+
+
+class RateLimiter:
+    """Global and per-account API budgets"""
+
+    # longest single sleep, so waits follow tokens freed by other workers
+    MAX_SLEEP = 1
+
+    def __init__(
+        self,
+        collection: Collection,
+        rate: float,
+        burst: int,
+        account_rate: float,
+        account_burst: int,
+    ):
+        """
+        :param rate: requests per second across all accounts, 0 for no global limit
+        :param account_rate: requests per second per account, 0 for no account limit
+        """
+        self.collection = collection
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.global_bucket = (
+            TokenBucket(collection, "global", rate, burst) if rate else None
+        )
+        self.account_buckets: Dict[str, TokenBucket] = {}
+        self.lock = Lock()
+
+    def account_bucket(self, account: str) -> TokenBucket | None:
+        if not self.account_rate:
+            return None
+        with self.lock:
+            if account not in self.account_buckets:
+                self.account_buckets[account] = TokenBucket(
+                    self.collection,
+                    f"account:{account}",
+                    self.account_rate,
+                    self.account_burst,
+                )
+            return self.account_buckets[account]
+
+    def acquire(self, account: str):
+        """Blocks until `account` may make one API call of the current call class"""
+        name = _call_class.get()
+        reserve = CALL_CLASS_RESERVES.get(name, 0.0)
+        waited = 0.0
+        for bucket in (self.account_bucket(account), self.global_bucket):
+            if not bucket:
+                continue
+            # a bucket too small for the reserve keeps one token for the class
+            class_reserve = min(reserve * bucket.capacity, bucket.capacity - 1)
+            while wait := bucket.take(class_reserve):
+                wait = min(wait, self.MAX_SLEEP)
+                sleep(wait)
+                waited += wait
+
+        if waited:
+            logger.debug(f"Waited {waited:.2f}s for a {name} call on {account}")
+        api_wait_seconds.observe(waited, call_class=name)
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Iterable, List
+
+from rssbox.config import Config
+
+
+def rank(ingested_at: datetime, priority: int = 0) -> datetime:
+    """
+    Claim order of a pending download, lowest first
+
+    Every priority point moves a download ahead of downloads ingested up to
+    `Config.PRIORITY_STEP` seconds before it, so a low priority download is
+    still claimed once it waited long enough (aging).
+    """
+    return ingested_at - timedelta(seconds=priority * Config.PRIORITY_STEP)
+
+
+class FeedScheduler:
+    """Smooth weighted round-robin over the feeds with pending downloads"""
+
+    def __init__(self, weights: Dict[str | None, int], refresh_interval: int = 30):
+        """
+        :param weights: feed id to weight, feeds not listed have a weight of 1
+        :param refresh_interval: seconds the list of feeds with pending downloads is cached
+        """
+        self.weights = weights
+        self.refresh_interval = refresh_interval
+        self.current: Dict[str | None, int] = {}
+        self.feeds: List[str | None] = []
+        self.refreshed_at: float | None = None
+        self.lock = Lock()
+
+    def order(
+        self, fetch_feeds: Callable[[], Iterable[str | None]]
+    ) -> List[str | None]:
+        """
+        Feeds to claim the next download from, in order
+
+        :param fetch_feeds: returns the feeds with pending downloads, called when the cache expired
+        """
+        with self.lock:
+            if (
+                self.refreshed_at is None
+                or monotonic() - self.refreshed_at > self.refresh_interval
+            ):
+                self.feeds = list(fetch_feeds())
+                self.refreshed_at = monotonic()
+            if not self.feeds:
+                return []
+
+            for feed in self.feeds:
+                self.current[feed] = self.current.get(feed, 0) + self.weight(feed)
+            return sorted(self.feeds, key=lambda feed: self.current[feed], reverse=True)
+
+    def weight(self, feed: str | None) -> int:
+        return self.weights.get(feed, 1)
+
+    def claimed(self, feed: str | None):
+        """A download was claimed from `feed`, it goes to the back of the round"""
+        with self.lock:
+            if feed in self.current:
+                self.current[feed] -= sum(self.weight(feed) for feed in self.feeds)
+
+    def exhausted(self, feed: str | None):
+        """`feed` has no pending downloads left, skip it until the next refresh"""
+        with self.lock:
+            if feed in self.feeds:
+                self.feeds.remove(feed)
+            self.current.pop(feed, None)
@@ -0,0 +1,110 @@
+import logging
+
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+from rssbox.config import Config
+from rssbox.enum import SonicBitStatus
+from rssbox.modules.counters import StatusCounters
+
+logger = logging.getLogger(__name__)
+
+# state that lived on the account document before accounts had slots
+LEGACY_FIELDS = (
+    "status",
+    "added_at",
+    "download_id",
+    "locked_by",
+    "last_checked_at",
+    "next_check_at",
+    "last_used_at",
+)
+
+
+def slot_id(email: str, index: int) -> str:
+    """Slot 0 keeps the account's id, so downloads added before slots existed still point at it"""
+    return email if index == 0 else f"{email}#{index}"
+
+
+def sync_slots(
+    accounts: Collection,
+    slots: Collection,
+    status_counters: StatusCounters | None = None,
+) -> int:
+    """
+    Creates the download slots of every account and removes idle slots above
+    its slot count, returns how many slots were created
+
+    Slot 0 of an account that had no slots takes over the account's download
+    state. Busy slots above the count, or of removed accounts, are removed once
+    they are idle again.
+    """
+    existing = {
+        slot["_id"]: slot
+        for slot in slots.find({}, {"_id": 1, "account": 1, "index": 1, "priority": 1})
+    }
+
+    created = removed = 0
+    emails = []
+    for account in accounts.find():
+        email = account["_id"]
+        emails.append(email)
+        count = max(int(account.get("slots") or Config.ACCOUNT_SLOTS), 1)
+        priority = account.get("priority", 0)
+        for index in range(count):
+            id = slot_id(email, index)
+            if id in existing:
+                continue
+
+            slot = {
+                "_id": id,
+                "account": email,
+                "index": index,
+                "status": SonicBitStatus.IDLE.value,
+                "priority": priority,
+                "version": 0,
+            }
+            if index == 0:
+                slot.update(
+                    {
+                        field: account[field]
+                        for field in LEGACY_FIELDS
+                        if field in account
+                    }
+                )
+                slot["status"] = slot.get("status") or SonicBitStatus.IDLE.value
+            try:
+                slots.insert_one(slot)
+                created += 1
+                if status_counters:
+                    status_counters.move("slots", None, slot["status"])
+            except DuplicateKeyError:
+                pass  # created by another worker
+
+        own = [slot for slot in existing.values() if slot.get("account") == email]
+        if any(slot.get("index", 0) >= count for slot in own):
+            removed += slots.delete_many(
+                {
+                    "account": email,
+                    "index": {"$gte": count},
+                    "status": SonicBitStatus.IDLE.value,
+                }
+            ).deleted_count
+        if any(slot.get("priority", 0) != priority for slot in own):
+            slots.update_many(
+                {"account": email, "priority": {"$ne": priority}},
+                {"$set": {"priority": priority}, "$inc": {"version": 1}},
+            )
+
+    # slots of removed accounts
+    if any(slot.get("account") not in emails for slot in existing.values()):
+        removed += slots.delete_many(
+            {"account": {"$nin": emails}, "status": SonicBitStatus.IDLE.value}
+        ).deleted_count
+
+    if status_counters:
+        status_counters.move("slots", SonicBitStatus.IDLE, None, removed)
+
+    if created:
+        logger.info(f"Created {created} SonicBit account slots")
+    return created
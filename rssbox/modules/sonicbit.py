@@ -1,24 +1,30 @@
+import copy
 import logging
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from time import sleep
 
 from humanize import naturalsize
+from pymongo.client_session import ClientSession
 from pymongo.collection import Collection
 from requests.exceptions import ConnectionError
 from sonicbit import SonicBit as SonicBitClient
 from sonicbit.types import TorrentList
-from requests.exceptions import ConnectionError
 
-from rssbox import downloads, mongo_client
 from rssbox.config import Config
-from rssbox.enum import SonicBitStatus
+from rssbox.database import get_database
+from rssbox.enum import DownloadStage, SonicBitStatus
 from rssbox.modules.download import Download
 from rssbox.modules.errors import (
     SeedboxDownError,
+    StaleStateError,
+    StorageFullError,
     TooLargeTorrentError,
     TorrentHashCalculationError,
     VerifyDownloadTimeoutError,
 )
+from rssbox.modules.metrics import stage_seconds
+from rssbox.modules.rate_limiter import call_class
 from rssbox.modules.token_handler import TokenHandler
 from rssbox.utils import calulate_torrent_hash
 
@@ -26,35 +32,91 @@ logger = logging.getLogger(__name__)
 
 
 class SonicBit(SonicBitClient):
+    """
+    One download slot of a SonicBit account
+
+    An account downloads up to its slot count of torrents at the same time, each
+    slot holds one and moves through the states on its own. The account document
+    keeps the credentials, the slot documents the download state.
+    """
+
     client: Collection
+    slots: Collection
     id: str
+    email: str
+    slot_count: int
     status: SonicBitStatus
     added_at: datetime | None
     download_id: str | None
+    hash: str | None
     locked_by: str | None
     last_checked_at: datetime | None
+    next_check_at: datetime | None
+    queued_at: datetime | None
     last_used_at: datetime | None
-
-    def __init__(self, client: Collection, account: dict):
+    version: int | None
+
+    def __init__(self, client: Collection, account: dict, slot: dict):
+        """
+        :param client: accounts collection
+        :param account: account document, with the credentials
+        :param slot: slot document of the account
+        """
         self.client = client
-        self.id = account["_id"]
-        self.status = SonicBitStatus(account.get("status", SonicBitStatus.IDLE.value))
-        self.added_at = account.get("added_at")
-        self.download_id = account.get("download_id")
-        self.locked_by = account.get("locked_by")
-        self.priority = account.get("priority", 0)
-        self.last_checked_at = account.get("last_checked_at")
-        self.last_used_at = account.get("last_used_at")
-
-        self.__download = None
+        self.slots = get_database().slots
+        self.email = account["_id"]
+        self.slot_count = max(int(account.get("slots") or Config.ACCOUNT_SLOTS), 1)
+        self.load(slot)
 
         super().__init__(
-            email=self.id,
+            email=self.email,
             password=account["password"],
             token=account.get("token", None),
             token_handler=TokenHandler(self.client),
         )
 
+        if rate_limiter := get_database().rate_limiter:
+            request = self.session.request
+
+            def rate_limited_request(*args, **kwargs):
+                rate_limiter.acquire(self.email)
+                return request(*args, **kwargs)
+
+            self.session.request = rate_limited_request
+
+    def load(self, slot: dict, token: str | None = None):
+        """
+        Refreshes the slot state from `slot`, keeping the API session
+
+        :param token: the account's current token, when another worker refreshed it
+        """
+        self.id = slot["_id"]
+        self.status = SonicBitStatus(slot.get("status") or SonicBitStatus.IDLE.value)
+        self._saved_status = self.status
+        self.added_at = slot.get("added_at")
+        self.download_id = slot.get("download_id")
+        self.hash = slot.get("hash")
+        self.locked_by = slot.get("locked_by")
+        self.priority = slot.get("priority", 0)
+        self.last_checked_at = slot.get("last_checked_at")
+        self.next_check_at = slot.get("next_check_at")
+        self.queued_at = slot.get("queued_at")
+        self.last_used_at = slot.get("last_used_at")
+        self.version = slot.get("version")
+
+        self.__download = None
+
+        if token and "session" in self.__dict__:
+            self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+    def snapshot(self) -> "SonicBit":
+        """
+        Copy of the slot state as it is now, for hooks that run after the slot
+        may have been claimed and loaded again, the API session is shared
+        """
+        return copy.copy(self)
+
+    @call_class("upload")
     def get_download_link(self, file: dict | str):
         if isinstance(file, dict):
             file = file["folder_file_id"]
@@ -62,62 +124,176 @@ class SonicBit(SonicBitClient):
         response = self.fetchFile(file)
         return response["url"]
 
+    @stage_seconds.timed(stage="purge")
+    @call_class("purge")
     def purge(self):
-        torrent_list = self.list_torrents()
-        for torrent in torrent_list.torrents.values():
-            torrent.delete(with_file=True)
-        # clear storage
-        self.clear_storage()
+        """
+        Deletes the torrent this slot finished and torrents no slot of the
+        account holds, raises `StorageFullError` when the account's storage stays
+        above `Config.STORAGE_HIGH_WATER`
 
+        An account with a single slot clears its whole storage instead.
+        """
+        torrent_list = self.list_torrents()
+        if self.slot_count == 1:
+            for torrent in torrent_list.torrents.values():
+                torrent.delete(with_file=True)
+            self.clear_storage()
+            return
+
+        # read after listing, a slot records its hash before adding the torrent
+        held = {
+            slot["hash"]
+            for slot in self.slots.find(
+                {"account": self.email, "_id": {"$ne": self.id}}, {"hash": 1}
+            )
+            if slot.get("hash")
+        }
+        used = torrent_list.info.size_byte_total
+        for hash, torrent in torrent_list.torrents.items():
+            if hash not in held:
+                torrent.delete(with_file=True)
+                used -= torrent.size or 0
+
+        limit = torrent_list.info.size_byte_limit
+        if limit and used >= limit * Config.STORAGE_HIGH_WATER:
+            raise StorageFullError(
+                f"Storage of {self.email} is full ({naturalsize(used)} of {naturalsize(limit)})"
+            )
+
+    @stage_seconds.timed(stage="add_download")
+    @call_class("add")
     def add_download(self, download: Download):
         self.purge()
 
+        hash = self.get_torrent_hash(download.url)
+        if self.slot_count > 1:
+            # other slots' purges keep the torrent
+            self.hash = hash
+            self.save()
         [download_url] = self.add_torrent(uri=download.url)
 
         if download_url == download.url:
-            hash = self.get_torrent_hash(download.url)
+            download.stage(DownloadStage.ADDED)
             self.verify_download(hash)
+            download.stage(DownloadStage.VERIFIED)
             self.mark_as_downloading(download, hash=hash)
         else:
             raise Exception("Download URL does not match")
 
-    def save(self):
-        self.client.update_one(
-            {"_id": self.id},
+    def save(self, session: ClientSession | None = None):
+        """Writes the account if nobody changed it since it was read, raises `StaleStateError` otherwise"""
+        result = self.slots.update_one(
+            {"_id": self.id, "version": self.version},
             {
                 "$set": {
                     "status": self.status.value,
                     "added_at": self.added_at,
                     "download_id": self.download_id,
+                    "hash": self.hash,
                     "locked_by": self.locked_by,
                     "priority": self.priority,
                     "last_checked_at": self.last_checked_at,
-                }
+                    "next_check_at": self.next_check_at,
+                    "queued_at": self.queued_at,
+                },
+                "$inc": {"version": 1},
             },
+            session=session,
         )
+        if not result.matched_count:
+            raise StaleStateError(
+                f"SonicBit slot {self.id} was changed by another worker"
+            )
+        self.version = (self.version or 0) + 1
+        get_database().status_counters.move(
+            "slots", self._saved_status, self.status, session=session
+        )
+        self._saved_status = self.status
+
+    @contextmanager
+    def transition(self):
+        """
+        Yields the session for the account and download writes of one state change
+
+        With `Config.USE_TRANSACTIONS` the writes commit together. Otherwise the
+        session is `None` and every write is a single document update that fails
+        with `StaleStateError` when the document changed since it was read. The
+        writes are ordered so that a crash between them leaves a state the check
+        loop or `WorkerHandler` reconciles: the download is always written first.
+        """
+        if not Config.USE_TRANSACTIONS:
+            yield None
+            return
+
+        with get_database().client.start_session() as session:
+            with session.start_transaction():
+                yield session
 
-    def unlock(self, status: SonicBitStatus = SonicBitStatus.IDLE):
+    def unlock(
+        self, status: SonicBitStatus = SonicBitStatus.IDLE, check_in: int | None = None
+    ):
+        """:param check_in: seconds until the account's download is due for its next check"""
         self.status = status
         self.locked_by = None
+        if check_in is not None:
+            self.next_check_at = datetime.now(tz=timezone.utc) + timedelta(
+                seconds=check_in
+            )
         self.save()
 
     def mark_as_downloading(self, download: Download, hash: str):
+        self.__download = download
         self.download_id = download.id
+        self.hash = hash
         self.added_at = datetime.now(tz=timezone.utc)
+        self.next_check_at = self.added_at + timedelta(seconds=Config.CHECK_MIN_DELAY)
         self.status = SonicBitStatus.DOWNLOADING
         self.locked_by = None
 
-        with mongo_client.start_session() as session:
-            with session.start_transaction():
-                self.download.mark_as_processing(hash=hash)
-                self.save()
+        with self.transition() as session:
+            # a processing download no account points at is put back to pending
+            download.mark_as_processing(hash=hash, account=self.id, session=session)
+            self.save(session=session)
 
-    def mark_as_idle(self):
+    def mark_as_idle(self, session: ClientSession | None = None):
         self.status = SonicBitStatus.IDLE
         self.added_at = None
+        self.next_check_at = None
+        self.queued_at = None
         self.download_id = None
+        self.hash = None
         self.locked_by = None
-        self.save()
+        self.save(session=session)
+
+    def mark_as_full(self):
+        """Releases the slot, the account's idle slots add nothing for `Config.STORAGE_FULL_DELAY`"""
+        self.mark_as_idle()
+        self.slots.update_many(
+            {"account": self.email, "status": SonicBitStatus.IDLE.value},
+            {
+                "$set": {
+                    "available_at": datetime.now(tz=timezone.utc)
+                    + timedelta(seconds=Config.STORAGE_FULL_DELAY)
+                },
+                "$inc": {"version": 1},
+            },
+        )
+
+    def mark_as_queued(self):
+        """
+        Hands the slot's finished files to the upload stage, with the download's
+        timeline stamps: the upload loops read the download again
+        """
+        download = self.download
+        self.status = SonicBitStatus.COMPLETED
+        self.locked_by = None
+        self.queued_at = datetime.now(tz=timezone.utc)
+
+        with self.transition() as session:
+            if download:
+                download.save(session=session)
+            self.save(session=session)
 
     def mark_as_uploading(self, locked_by: str):
         self.locked_by = locked_by
@@ -125,32 +301,43 @@ class SonicBit(SonicBitClient):
         self.save()
 
     def mark_as_failed(self, soft=False):
-        with mongo_client.start_session() as session:
-            with session.start_transaction():
-                self.mark_as_idle()
-                self.download.mark_as_failed(soft=soft)
+        download = self.download
+        with self.transition() as session:
+            download.mark_as_failed(soft=soft, session=session)
+            self.mark_as_idle(session=session)
 
     def mark_as_completed(self):
-        with mongo_client.start_session() as session:
-            with session.start_transaction():
-                self.mark_as_idle()
-                self.download.delete()
+        download = self.download
+        download.stage(DownloadStage.UPLOADED)
+        with self.transition() as session:
+            download.delete(session=session)
+            self.mark_as_idle(session=session)
+
+        # capped collections can't be written inside a transaction
+        try:
+            get_database().download_history.insert_one(download.history)
+        except Exception as error:
+            logger.warning(f"Failed to record history for {download.name}: {error}")
 
     def mark_as_timeout(self):
-        with mongo_client.start_session() as session:
-            with session.start_transaction():
-                self.mark_as_idle()
-                self.download.mark_as_timeout()
+        download = self.download
+        with self.transition() as session:
+            download.mark_as_timeout(session=session)
+            self.mark_as_idle(session=session)
 
     def checked(self):
+        """Stamps the check time with a cheap write that doesn't take part in the versioning"""
         self.last_checked_at = datetime.now(tz=timezone.utc)
-        self.save()
+        get_database().heartbeat.get_collection(self.slots.name).update_one(
+            {"_id": self.id, "locked_by": self.locked_by},
+            {"$set": {"last_checked_at": self.last_checked_at}},
+        )
 
     def reset(self):
-        with mongo_client.start_session() as session:
-            with session.start_transaction():
-                self.mark_as_idle()
-                self.download.mark_as_pending()
+        download = self.download
+        with self.transition() as session:
+            download.mark_as_pending(session=session)
+            self.mark_as_idle(session=session)
 
     def download_timeout(self, timeout: int = Config.DOWNLOAD_TIMEOUT) -> bool:
         if self.added_at and self.added_at + timedelta(seconds=timeout) < datetime.now(
@@ -163,6 +350,7 @@ class SonicBit(SonicBitClient):
 
     def get_download(self) -> Download | None:
         if self.download_id:
+            downloads = get_database().downloads
             if raw_download := downloads.find_one({"_id": self.download_id}):
                 self.__download = Download(downloads, raw_download)
                 return self.__download
@@ -178,6 +366,7 @@ class SonicBit(SonicBitClient):
 
             raise error from None
 
+    @stage_seconds.timed(stage="verify_download")
     def verify_download(
         self, hash: str, timeout: int = Config.DOWNLOAD_ADD_VERIFY_TIMEOUT
     ) -> bool:
@@ -186,7 +375,9 @@ class SonicBit(SonicBitClient):
         now = datetime.now(tz=timezone.utc)
         while True:
             if datetime.now(tz=timezone.utc) - now > timedelta(seconds=timeout):
-                raise VerifyDownloadTimeoutError(f"Verify download timed out for download hash: {hash}") from None
+                raise VerifyDownloadTimeoutError(
+                    f"Verify download timed out for download hash: {hash}"
+                ) from None
 
             torrents = self.list_torrents()
             if not torrents.info.seedbox_status_up:
@@ -214,6 +405,8 @@ class SonicBit(SonicBitClient):
             self.add_download(download)
         except (
             SeedboxDownError,
+            StaleStateError,
+            StorageFullError,
             TorrentHashCalculationError,
             TooLargeTorrentError,
         ) as error:
@@ -0,0 +1,1036 @@
+import json
+import logging
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from threading import RLock
+from time import monotonic
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# seconds between purges of documents past their TTL index, like mongod's monitor
+TTL_INTERVAL = 60
+
+# datetimes and ObjectIds are stored as tagged strings that sort like the values
+_TAG = "\ufdd0"
+_DATE = _TAG + "d:"
+_OBJECT_ID = _TAG + "o:"
+
+_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+_FIELD = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$")
+_COMPARISONS = {"$lt": "<", "$lte": "<=", "$gt": ">", "$gte": ">="}
+_TYPES = {
+    "string": str,
+    "int": int,
+    "long": int,
+    "double": float,
+    "number": (int, float),
+    "bool": bool,
+    "date": datetime,
+    "objectId": ObjectId,
+    "object": dict,
+    "array": list,
+    "null": type(None),
+}
+_MISSING = object()
+
+
+def is_sqlite_url(url: str) -> bool:
+    return url.startswith("sqlite:")
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return _DATE + value.isoformat(timespec="microseconds")
+    if isinstance(value, ObjectId):
+        return _OBJECT_ID + str(value)
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, str) and value.startswith(_TAG):
+        if value.startswith(_DATE):
+            return datetime.fromisoformat(value[len(_DATE) :]).replace(
+                tzinfo=timezone.utc
+            )
+        if value.startswith(_OBJECT_ID):
+            return ObjectId(value[len(_OBJECT_ID) :])
+    if isinstance(value, dict):
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _dumps(document: dict) -> str:
+    return json.dumps(_encode(document), separators=(",", ":"))
+
+
+def _id_key(value: Any) -> str:
+    """Text of an `_id` in the primary key column"""
+    return json.dumps(_encode(value), separators=(",", ":"), sort_keys=True)
+
+
+def _field_sql(field: str) -> str:
+    if field == "_id":
+        return "id"
+    if not _FIELD.match(field):
+        raise ValueError(f"Unsupported field name {field!r}")
+    path = ".".join(f'"{part}"' for part in field.split("."))
+    return f"json_extract(doc, '$.{path}')"
+
+
+def _type_sql(field: str) -> str:
+    return _field_sql(field).replace("json_extract", "json_type", 1)
+
+
+def _array_paths(document: dict, prefix: str = "") -> Set[str]:
+    """Dotted paths of the arrays in `document`, not looking into them"""
+    paths = set()
+    for key, value in document.items():
+        if isinstance(value, list):
+            paths.add(prefix + key)
+        elif isinstance(value, dict):
+            paths |= _array_paths(value, f"{prefix}{key}.")
+    return paths
+
+
+def _is_operators(condition: Any) -> bool:
+    return (
+        isinstance(condition, dict)
+        and bool(condition)
+        and all(key.startswith("$") for key in condition)
+    )
+
+
+def _where(
+    query: dict | None, arrays: Set[str] = frozenset()
+) -> Tuple[str, list, bool]:
+    """
+    SQL condition, its parameters and whether it matches exactly the
+    documents `query` does, otherwise it matches more and they are filtered
+    again in Python
+
+    :param arrays: fields that may hold arrays, `json_extract` can't match their elements
+    """
+    clauses, params, exact = [], [], True
+    for key, condition in (query or {}).items():
+        if key in ("$and", "$or"):
+            parts = [_where(part, arrays) for part in condition]
+            if not parts:
+                clauses.append("1" if key == "$and" else "0")
+                continue
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _, _ in parts) + ")")
+            for _, part_params, part_exact in parts:
+                params.extend(part_params)
+                exact = exact and part_exact
+        elif key.startswith("$"):
+            exact = False
+        else:
+            conditions = condition if _is_operators(condition) else {"$eq": condition}
+            if any(key == path or key.startswith(f"{path}.") for path in arrays):
+                exact = False
+                continue
+            for operator, operand in conditions.items():
+                sql, operator_params, operator_exact = _condition(
+                    key, operator, operand
+                )
+                clauses.append(sql)
+                params.extend(operator_params)
+                exact = exact and operator_exact
+    return " AND ".join(clauses) or "1", params, exact
+
+
+def _condition(field: str, operator: str, operand: Any) -> Tuple[str, list, bool]:
+    column = _field_sql(field)
+    value = _id_key if field == "_id" else _encode
+    if isinstance(operand, (dict, list, tuple)) and operator not in ("$in", "$nin"):
+        return "1", [], False
+
+    if operator == "$eq":
+        if operand is None:
+            return f"{column} IS NULL", [], True
+        return f"{column} = ?", [value(operand)], True
+    if operator == "$ne":
+        if operand is None:
+            return f"{column} IS NOT NULL", [], True
+        return f"({column} IS NULL OR {column} != ?)", [value(operand)], True
+    if operator in ("$in", "$nin"):
+        operands = list(operand)
+        if any(isinstance(item, (dict, list, tuple)) for item in operands):
+            return "1", [], False
+        values = [value(item) for item in operands if item is not None]
+        has_null = len(values) < len(operands)
+        listed = f"{column} IN ({', '.join('?' * len(values))})" if values else "0"
+        if operator == "$in":
+            sql = f"({column} IS NULL OR {listed})" if has_null else listed
+        elif has_null:
+            sql = f"({column} IS NOT NULL AND NOT {listed})"
+        else:
+            sql = f"({column} IS NULL OR NOT {listed})"
+        return sql, values, True
+    if operator == "$exists":
+        if field == "_id":
+            return ("1" if operand else "0"), [], True
+        return f"{_type_sql(field)} IS {'NOT ' if operand else ''}NULL", [], True
+    if operator in _COMPARISONS and field != "_id":
+        return f"{column} {_COMPARISONS[operator]} ?", [value(operand)], True
+    if operator == "$type" and operand == "string" and field != "_id":
+        return f"{_type_sql(field)} = 'text'", [], True
+    return "1", [], False
+
+
+def _values(document: Any, field: str) -> List[Any]:
+    """Values at the dotted `field` of `document`, through arrays of documents"""
+    values = [document]
+    for part in field.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                found.extend(
+                    item[part]
+                    for item in value
+                    if isinstance(item, dict) and part in item
+                )
+        values = found
+    return values
+
+
+def _elements(values: List[Any]) -> List[Any]:
+    """`values` followed by the elements of those that are arrays, what MongoDB matches against"""
+    return values + [
+        item for value in values if isinstance(value, list) for item in value
+    ]
+
+
+def _equals(values: List[Any], operand: Any) -> bool:
+    if operand is None:
+        return not values or any(value is None for value in _elements(values))
+    return any(value == operand for value in _elements(values))
+
+
+def _compare(values: List[Any], operator: str, operand: Any) -> bool:
+    for value in _elements(values):
+        try:
+            if (
+                (operator == "$lt" and value < operand)
+                or (operator == "$lte" and value <= operand)
+                or (operator == "$gt" and value > operand)
+                or (operator == "$gte" and value >= operand)
+            ):
+                return True
+        except TypeError:
+            continue  # values of different types don't compare
+    return False
+
+
+def matches(document: dict, query: dict | None) -> bool:
+    """Whether `document` matches the MongoDB `query`"""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, part) for part in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, part) for part in condition):
+                return False
+        else:
+            values = _values(document, key)
+            conditions = condition if _is_operators(condition) else {"$eq": condition}
+            for operator, operand in conditions.items():
+                if not _operator_matches(values, operator, _decode(_encode(operand))):
+                    return False
+    return True
+
+
+def _operator_matches(values: List[Any], operator: str, operand: Any) -> bool:
+    if operator == "$eq":
+        return _equals(values, operand)
+    if operator == "$ne":
+        return not _equals(values, operand)
+    if operator == "$in":
+        return any(_equals(values, item) for item in operand)
+    if operator == "$nin":
+        return not any(_equals(values, item) for item in operand)
+    if operator == "$exists":
+        return bool(values) == bool(operand)
+    if operator in _COMPARISONS:
+        return _compare(values, operator, operand)
+    if operator == "$size":
+        return any(
+            isinstance(value, list) and len(value) == operand for value in values
+        )
+    if operator == "$type":
+        kind = _TYPES[operand]
+        return any(
+            isinstance(value, kind) and not (kind is int and isinstance(value, bool))
+            for value in values
+        )
+    raise NotImplementedError(f"Unsupported query operator {operator}")
+
+
+def _set_path(document: dict, field: str, value: Any):
+    *parents, last = field.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def _unset_path(document: dict, field: str):
+    *parents, last = field.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(last, None)
+
+
+def _get_path(document: dict, field: str, default: Any = None) -> Any:
+    for part in field.split("."):
+        if not isinstance(document, dict) or part not in document:
+            return default
+        document = document[part]
+    return document
+
+
+def _update(document: dict, update: dict, inserting: bool = False) -> dict:
+    """Applies the update operators of `update` to `document` in place"""
+    for operator, fields in update.items():
+        if operator == "$set" or (operator == "$setOnInsert" and inserting):
+            for field, value in fields.items():
+                _set_path(document, field, _decode(_encode(value)))
+        elif operator == "$unset":
+            for field in fields:
+                _unset_path(document, field)
+        elif operator == "$inc":
+            for field, amount in fields.items():
+                _set_path(document, field, _get_path(document, field, 0) + amount)
+        elif operator != "$setOnInsert":
+            raise NotImplementedError(f"Unsupported update operator {operator}")
+    return document
+
+
+def _upserted(query: dict) -> dict:
+    """Document an upsert of `query` starts from, its equality conditions"""
+    document = {}
+    for key, condition in query.items():
+        if key.startswith("$") or _is_operators(condition):
+            continue
+        _set_path(document, key, _decode(_encode(condition)))
+    return document
+
+
+def _project(document: dict, projection: dict | list | None) -> dict:
+    if not projection:
+        return document
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    fields = {field: value for field, value in projection.items() if field != "_id"}
+    if any(fields.values()) or (not fields and projection.get("_id")):
+        projected = {}
+        if projection.get("_id", 1) and "_id" in document:
+            projected["_id"] = document["_id"]
+        for field in fields:
+            value = _get_path(document, field, _MISSING)
+            if value is not _MISSING:
+                _set_path(projected, field, value)
+        return projected
+    for field in projection:
+        _unset_path(document, field)
+    return document
+
+
+def _order_sql(sort: Iterable[Tuple[str, int]] | None, query: dict | None) -> str:
+    # fields `query` fixes to one value are left out, SQLite doesn't use an index
+    # to order by them
+    fixed = {
+        field
+        for field, condition in (query or {}).items()
+        if not field.startswith("$") and not isinstance(condition, (dict, list))
+    }
+    terms = []
+    for field, direction in sort or []:
+        if field in fixed:
+            continue
+        column = "rowid" if field == "$natural" else _field_sql(field)
+        terms.append(f"{column} {'DESC' if direction < 0 else 'ASC'}")
+    return " ORDER BY " + ", ".join(terms) if terms else ""
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+class SQLiteSession:
+    """Stands in for a `ClientSession`, a transaction holds the database's write lock"""
+
+    def __init__(self, client: "SQLiteClient"):
+        self.client = client
+        self.in_transaction = False
+
+    def __enter__(self) -> "SQLiteSession":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    @contextmanager
+    def start_transaction(self, *args, **kwargs):
+        with self.client.transaction():
+            self.in_transaction = True
+            try:
+                yield self
+            finally:
+                self.in_transaction = False
+
+    def end_session(self):
+        pass
+
+
+class SQLiteClient:
+    """
+    Stands in for `MongoClient` over one SQLite database file in WAL mode, for
+    single node deployments without a MongoDB server
+
+    Writes of every thread go through one connection, each in its own
+    `BEGIN IMMEDIATE` transaction, so a `find_one_and_update` claim is atomic
+    across threads and across processes sharing the file. Readers don't block
+    the writer.
+    """
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        self.lock = RLock()
+        self.connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS _collections (name TEXT PRIMARY KEY, options TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS _indexes (collection TEXT NOT NULL, name TEXT NOT NULL,"
+            " spec TEXT NOT NULL, PRIMARY KEY (collection, name));"
+            "CREATE TABLE IF NOT EXISTS _array_fields (collection TEXT NOT NULL, field TEXT NOT NULL,"
+            " PRIMARY KEY (collection, field));"
+        )
+        self.databases: Dict[str, SQLiteDatabase] = {}
+        self.expired_at = 0.0
+        self.array_fields: Dict[str, Set[str]] = {}
+        self.data_version: int | None = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "SQLiteClient":
+        """Client of `sqlite:///relative/path.db` or `sqlite:////absolute/path.db`"""
+        path = url.split(":", 1)[1].removeprefix("///").split("?", 1)[0]
+        return cls(path or ":memory:")
+
+    def get_database(self, name: str | None = None, **kwargs) -> "SQLiteDatabase":
+        # one file is one database, names only tell the handles apart
+        name = name or "rssbox"
+        if name not in self.databases:
+            self.databases[name] = SQLiteDatabase(self, name)
+        return self.databases[name]
+
+    def get_default_database(self, default=None, **kwargs) -> "SQLiteDatabase":
+        return self.get_database(default)
+
+    def start_session(self, *args, **kwargs) -> SQLiteSession:
+        return SQLiteSession(self)
+
+    @contextmanager
+    def transaction(self, session: SQLiteSession | None = None):
+        """Runs the block in one write transaction, or in the session's when it has one"""
+        with self.lock:
+            if self.connection.in_transaction:
+                yield  # the lock holder's transaction, e.g. a session's
+                return
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                self.forget()
+                raise
+            self.connection.execute("COMMIT")
+            self.expire()
+
+    def forget(self):
+        """Drops what was cached from a rolled back transaction, tables and array fields"""
+        self.data_version = None
+        for database in self.databases.values():
+            for collection in database.collections.values():
+                collection.exists = False
+
+    def arrays(self, collection: str) -> Set[str]:
+        """Fields that held an array in any document of `collection`, read again after another process wrote"""
+        with self.lock:
+            # changes whenever another connection commits
+            version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if version != self.data_version:
+                self.data_version = version
+                fields = {}
+                for name, field in self.connection.execute(
+                    "SELECT collection, field FROM _array_fields"
+                ):
+                    fields.setdefault(name, set()).add(field)
+                self.array_fields = fields
+            return self.array_fields.get(collection, set())
+
+    def add_arrays(self, collection: str, document: dict):
+        """Records the fields `document` holds arrays in, queries on them are matched in Python"""
+        with self.lock:
+            known = self.array_fields.setdefault(collection, set())
+            if new := _array_paths(document) - known:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO _array_fields VALUES (?, ?)",
+                    [(collection, field) for field in new],
+                )
+                known.update(new)
+
+    def execute(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.connection.execute(sql, tuple(params))
+
+    def query(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        with self.lock:
+            return self.connection.execute(sql, tuple(params)).fetchall()
+
+    def expire(self):
+        """Deletes documents past their TTL index, at most every `TTL_INTERVAL` seconds"""
+        now = monotonic()
+        if now - self.expired_at < TTL_INTERVAL:
+            return
+        self.expired_at = now
+        try:
+            indexes = self.query("SELECT collection, spec FROM _indexes")
+            for collection, spec in indexes:
+                spec = json.loads(spec)
+                if spec.get("expireAfterSeconds") is None:
+                    continue
+                field = _field_sql(spec["key"][0][0])
+                cutoff = datetime.now(timezone.utc) - timedelta(
+                    seconds=spec["expireAfterSeconds"]
+                )
+                # only dates expire, tagged strings sort after every number
+                deleted = self.execute(
+                    f'DELETE FROM "{collection}" WHERE {field} >= ? AND {field} <= ?',
+                    (_DATE, _encode(cutoff)),
+                ).rowcount
+                if deleted:
+                    logger.debug(f"Expired {deleted} documents of {collection}")
+        except sqlite3.Error as error:
+            logger.warning(f"Failed to expire documents: {error}")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SQLiteDatabase:
+    def __init__(self, client: SQLiteClient, name: str):
+        self.client = client
+        self.name = name
+        self.collections: Dict[str, SQLiteCollection] = {}
+
+    def get_collection(self, name: str, **kwargs) -> "SQLiteCollection":
+        if name not in self.collections:
+            self.collections[name] = SQLiteCollection(self, name)
+        return self.collections[name]
+
+    def __getitem__(self, name: str) -> "SQLiteCollection":
+        return self.get_collection(name)
+
+    def list_collection_names(self, **kwargs) -> List[str]:
+        return [
+            name
+            for name, in self.client.query(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE '\\_%' ESCAPE '\\'"
+            )
+        ]
+
+    def create_collection(
+        self, name: str, capped: bool = False, size: int | None = None, **kwargs
+    ) -> "SQLiteCollection":
+        """Creates collection `name`, a capped one keeps its last `max` documents"""
+        collection = self.get_collection(name)
+        with self.client.transaction():
+            if name in self.list_collection_names():
+                raise CollectionInvalid(f"collection {name} already exists")
+            options = {"capped": capped, "max": kwargs.get("max")} if capped else {}
+            self.client.execute(
+                "INSERT OR REPLACE INTO _collections VALUES (?, ?)",
+                (name, json.dumps(options)),
+            )
+            collection.create_table()
+        return collection
+
+
+class SQLiteCollection:
+    """
+    Stands in for a pymongo `Collection`, with the subset of queries, updates,
+    indexes and aggregation stages rssbox uses
+
+    Each document is a row of JSON. Queries become SQL over `json_extract`,
+    which uses the expression indexes `create_index` makes. Conditions SQL
+    can't express, and any condition on a field that held an array in one of
+    the collection's documents, are checked on the fetched documents.
+    """
+
+    def __init__(self, database: SQLiteDatabase, name: str):
+        if not _NAME.match(name):
+            raise ValueError(f"Unsupported collection name {name!r}")
+        self.database = database
+        self.client = database.client
+        self.name = name
+        self.table = f'"{name}"'
+        self.exists = False
+        self.max: int | None = None
+
+    def create_table(self):
+        self.client.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} (id TEXT PRIMARY KEY, doc TEXT NOT NULL)"
+        )
+        self.exists = False  # capped options are read again
+        self.table_exists()
+
+    def table_exists(self) -> bool:
+        # only created tables are remembered, another process may create it later
+        if not self.exists:
+            self.exists = bool(
+                self.client.query(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                    (self.name,),
+                )
+            )
+            if self.exists:
+                rows = self.client.query(
+                    "SELECT options FROM _collections WHERE name = ?", (self.name,)
+                )
+                self.max = json.loads(rows[0][0]).get("max") if rows else None
+        return self.exists
+
+    def get_collection(self, name: str, **kwargs) -> "SQLiteCollection":
+        return self.database.get_collection(name)
+
+    def _rows(
+        self,
+        query: dict | None,
+        sort: Iterable[Tuple[str, int]] | None = None,
+        limit: int = 0,
+    ) -> Iterator[Tuple[str, str, dict]]:
+        """Primary key, stored text and document of each match, in `sort` order"""
+        if not self.table_exists():
+            return
+        where, params, exact = _where(query, self.client.arrays(self.name))
+        sql = f"SELECT id, doc FROM {self.table} WHERE {where}{_order_sql(sort, query)}"
+        if limit and exact:
+            sql += f" LIMIT {int(limit)}"
+        found = 0
+        for id, text in self.client.query(sql, params):
+            document = _decode(json.loads(text))
+            if exact or matches(document, query):
+                yield id, text, document
+                found += 1
+                if limit and found >= limit:
+                    return
+
+    def find(
+        self,
+        filter: dict | None = None,
+        projection: dict | list | None = None,
+        skip: int = 0,
+        limit: int = 0,
+        sort: Iterable[Tuple[str, int]] | None = None,
+        session: SQLiteSession | None = None,
+        **kwargs,
+    ) -> Iterator[dict]:
+        rows = list(self._rows(filter, sort, skip + limit if limit else 0))[skip:]
+        return iter([_project(document, projection) for _, _, document in rows])
+
+    def find_one(
+        self, filter: dict | None = None, projection=None, *args, **kwargs
+    ) -> dict | None:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        return next(self.find(filter, projection, *args, limit=1, **kwargs), None)
+
+    def count_documents(self, filter: dict, **kwargs) -> int:
+        if not self.table_exists():
+            return 0
+        where, params, exact = _where(filter, self.client.arrays(self.name))
+        if exact:
+            return self.client.query(
+                f"SELECT COUNT(*) FROM {self.table} WHERE {where}", params
+            )[0][0]
+        return sum(1 for _ in self._rows(filter))
+
+    def distinct(self, key: str, filter: dict | None = None, **kwargs) -> List[Any]:
+        values = []
+        for _, _, document in self._rows(filter):
+            for value in _values(document, key):
+                for item in value if isinstance(value, list) else [value]:
+                    if item not in values:
+                        values.append(item)
+        return values
+
+    def _insert(self, document: dict) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        self.client.add_arrays(self.name, document)
+        try:
+            self.client.execute(
+                f"INSERT INTO {self.table} (id, doc) VALUES (?, ?)",
+                (_id_key(document["_id"]), _dumps(document)),
+            )
+        except sqlite3.IntegrityError as error:
+            raise DuplicateKeyError(f"E11000 duplicate key error: {error}") from None
+        if self.max:
+            self.client.execute(
+                f"DELETE FROM {self.table} WHERE rowid <= (SELECT MAX(rowid) FROM {self.table}) - ?",
+                (self.max,),
+            )
+        return document["_id"]
+
+    def _replace(self, id: str, text: str, document: dict) -> bool:
+        """Writes `document` over row `id`, whether it changed"""
+        new_text = _dumps(document)
+        if new_text == text:
+            return False
+        self.client.add_arrays(self.name, document)
+        try:
+            self.client.execute(
+                f"UPDATE {self.table} SET doc = ? WHERE id = ?", (new_text, id)
+            )
+        except sqlite3.IntegrityError as error:
+            raise DuplicateKeyError(f"E11000 duplicate key error: {error}") from None
+        return True
+
+    def insert_one(
+        self, document: dict, session: SQLiteSession | None = None, **kwargs
+    ) -> InsertOneResult:
+        with self.client.transaction(session):
+            if not self.exists:
+                self.create_table()
+            return InsertOneResult(self._insert(document))
+
+    def insert_many(
+        self,
+        documents: Iterable[dict],
+        session: SQLiteSession | None = None,
+        **kwargs,
+    ) -> InsertManyResult:
+        with self.client.transaction(session):
+            if not self.exists:
+                self.create_table()
+            return InsertManyResult([self._insert(document) for document in documents])
+
+    def _update_rows(
+        self,
+        filter: dict,
+        update: dict,
+        limit: int,
+        upsert: bool,
+        sort=None,
+        replace: bool = False,
+    ) -> Tuple[UpdateResult, dict | None, dict | None]:
+        """Updates the matches of `filter`, returns the result and the last document before and after"""
+        if not self.exists:
+            self.create_table()
+        matched = modified = 0
+        before = after = None
+        for id, text, document in self._rows(filter, sort, limit):
+            matched += 1
+            before = _decode(json.loads(text))
+            if replace:
+                after = {"_id": document["_id"], **update}
+            else:
+                after = _update(document, update)
+            modified += self._replace(id, text, after)
+        if matched or not upsert:
+            return UpdateResult(matched, modified), before, after
+
+        after = _upserted(filter)
+        if replace:
+            after = {**({"_id": after["_id"]} if "_id" in after else {}), **update}
+        else:
+            _update(after, update, inserting=True)
+        upserted_id = self._insert(after)
+        return UpdateResult(0, 0, upserted_id), None, after
+
+    def update_one(
+        self,
+        filter: dict,
+        update: dict,
+        upsert: bool = False,
+        session: SQLiteSession | None = None,
+        **kwargs,
+    ) -> UpdateResult:
+        with self.client.transaction(session):
+            return self._update_rows(filter, update, 1, upsert)[0]
+
+    def update_many(
+        self,
+        filter: dict,
+        update: dict,
+        upsert: bool = False,
+        session: SQLiteSession | None = None,
+        **kwargs,
+    ) -> UpdateResult:
+        with self.client.transaction(session):
+            return self._update_rows(filter, update, 0, upsert)[0]
+
+    def replace_one(
+        self,
+        filter: dict,
+        replacement: dict,
+        upsert: bool = False,
+        session: SQLiteSession | None = None,
+        **kwargs,
+    ) -> UpdateResult:
+        with self.client.transaction(session):
+            return self._update_rows(filter, replacement, 1, upsert, replace=True)[0]
+
+    def find_one_and_update(
+        self,
+        filter: dict,
+        update: dict,
+        projection: dict | list | None = None,
+        sort: Iterable[Tuple[str, int]] | None = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        session: SQLiteSession | None = None,
+        **kwargs,
+    ) -> dict | None:
+        """Atomically updates the first match of `filter` in `sort` order"""
+        with self.client.transaction(session):
+            _, before, after = self._update_rows(filter, update, 1, upsert, sort)
+        document = after if return_document == ReturnDocument.AFTER else before
+        return None if document is None else _project(document, projection)
+
+    def _delete(self, filter: dict, limit: int) -> DeleteResult:
+        ids = [id for id, _, _ in self._rows(filter, limit=limit)]
+        for id in ids:
+            self.client.execute(f"DELETE FROM {self.table} WHERE id = ?", (id,))
+        return DeleteResult(len(ids))
+
+    def delete_one(
+        self, filter: dict, session: SQLiteSession | None = None, **kwargs
+    ) -> DeleteResult:
+        with self.client.transaction(session):
+            return self._delete(filter, 1)
+
+    def delete_many(
+        self, filter: dict, session: SQLiteSession | None = None, **kwargs
+    ) -> DeleteResult:
+        with self.client.transaction(session):
+            return self._delete(filter, 0)
+
+    def create_index(
+        self,
+        keys: str | List[Tuple[str, int]],
+        unique: bool = False,
+        name: str | None = None,
+        expireAfterSeconds: int | None = None,
+        partialFilterExpression: dict | None = None,
+        **kwargs,
+    ) -> str:
+        """Creates an index over the `json_extract` of each key, as unique and partial as asked"""
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        keys = [(field, direction) for field, direction in keys]
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        columns = ", ".join(
+            f"{_field_sql(field)}{' DESC' if direction == -1 else ''}"
+            for field, direction in keys
+        )
+        sql = (
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS "
+            f'"{self.name}.{name}" ON {self.table} ({columns})'
+        )
+        if partialFilterExpression:
+            sql += f" WHERE {self._partial_sql(partialFilterExpression)}"
+        spec = {
+            "key": keys,
+            "unique": unique,
+            "expireAfterSeconds": expireAfterSeconds,
+            "partialFilterExpression": partialFilterExpression,
+        }
+        with self.client.transaction():
+            self.create_table()
+            try:
+                self.client.execute(sql)
+            except sqlite3.IntegrityError as error:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error: {error}"
+                ) from None
+            self.client.execute(
+                "INSERT OR REPLACE INTO _indexes VALUES (?, ?, ?)",
+                (self.name, name, json.dumps(spec)),
+            )
+        return name
+
+    @staticmethod
+    def _partial_sql(partial: dict) -> str:
+        clauses = []
+        for field, condition in partial.items():
+            if _is_operators(condition) and set(condition) <= {"$type", "$exists"}:
+                # what queries on the field imply, so SQLite uses the index for them
+                clauses.append(f"{_field_sql(field)} IS NOT NULL")
+                continue
+            sql, params, exact = _where({field: condition})
+            if params or not exact:
+                raise NotImplementedError(
+                    f"Unsupported partial filter expression {partial}"
+                )
+            clauses.append(sql)
+        return " AND ".join(clauses)
+
+    def drop_index(self, name: str, **kwargs):
+        with self.client.transaction():
+            self.client.execute(f'DROP INDEX IF EXISTS "{self.name}.{name}"')
+            self.client.execute(
+                "DELETE FROM _indexes WHERE collection = ? AND name = ?",
+                (self.name, name),
+            )
+
+    def index_information(self, **kwargs) -> Dict[str, dict]:
+        indexes = {"_id_": {"key": [("_id", 1)]}}
+        for name, spec in self.client.query(
+            "SELECT name, spec FROM _indexes WHERE collection = ?", (self.name,)
+        ):
+            spec = json.loads(spec)
+            spec["key"] = [tuple(key) for key in spec["key"]]
+            indexes[name] = {key: value for key, value in spec.items() if value}
+        return indexes
+
+    def aggregate(self, pipeline: List[dict], **kwargs) -> Iterator[dict]:
+        """Runs `pipeline` in Python, a leading `$match` is queried in SQL"""
+        stages = list(pipeline)
+        query = stages.pop(0)["$match"] if stages and "$match" in stages[0] else {}
+        documents = list(self.find(query))
+        for stage in stages:
+            ((name, spec),) = stage.items()
+            handler = getattr(self, f"_stage_{name[1:]}", None)
+            if handler is None:
+                raise NotImplementedError(f"Unsupported aggregation stage {name}")
+            documents = handler(documents, spec)
+        return iter(documents)
+
+    def _stage_match(self, documents: List[dict], spec: dict) -> List[dict]:
+        return [document for document in documents if matches(document, spec)]
+
+    def _stage_project(self, documents: List[dict], spec: dict) -> List[dict]:
+        return [_project(document, spec) for document in documents]
+
+    def _stage_sort(self, documents: List[dict], spec: dict) -> List[dict]:
+        for field, direction in reversed(list(spec.items())):
+            documents = sorted(
+                documents,
+                key=lambda document: _values(document, field)[:1],
+                reverse=direction < 0,
+            )
+        return documents
+
+    def _stage_limit(self, documents: List[dict], spec: int) -> List[dict]:
+        return documents[:spec]
+
+    def _stage_lookup(self, documents: List[dict], spec: dict) -> List[dict]:
+        local, foreign = spec["localField"], spec["foreignField"]
+        keys = {
+            _id_key(_get_path(document, local)): _get_path(document, local)
+            for document in documents
+        }
+        joined: Dict[str, List[dict]] = {}
+        for document in self.database.get_collection(spec["from"]).find(
+            {foreign: {"$in": list(keys.values())}}
+        ):
+            key = _id_key(_get_path(document, foreign))
+            joined.setdefault(key, []).append(document)
+        for document in documents:
+            key = _id_key(_get_path(document, local))
+            document[spec["as"]] = joined.get(key, [])
+        return documents
+
+    def _stage_unwind(self, documents: List[dict], spec: str | dict) -> List[dict]:
+        if isinstance(spec, str):
+            spec = {"path": spec}
+        field = spec["path"].removeprefix("$")
+        preserve = spec.get("preserveNullAndEmptyArrays", False)
+        unwound = []
+        for document in documents:
+            values = _get_path(document, field)
+            if not isinstance(values, list):
+                values = [] if values is None else [values]
+            if not values:
+                if preserve:
+                    _unset_path(document, field)
+                    unwound.append(document)
+                continue
+            for value in values:
+                copy = dict(document)
+                _set_path(copy, field, value)
+                unwound.append(copy)
+        return unwound
+
+    def _stage_group(self, documents: List[dict], spec: dict) -> List[dict]:
+        def evaluate(expression: Any, document: dict) -> Any:
+            if isinstance(expression, str) and expression.startswith("$"):
+                return _get_path(document, expression[1:])
+            return expression
+
+        groups: Dict[str, dict] = {}
+        for document in documents:
+            group_id = evaluate(spec["_id"], document)
+            group = groups.setdefault(_id_key(group_id), {"_id": group_id})
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                ((operator, expression),) = accumulator.items()
+                if operator != "$sum":
+                    raise NotImplementedError(f"Unsupported accumulator {operator}")
+                value = evaluate(expression, document)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    group[field] = group.get(field, 0) + value
+                else:
+                    group.setdefault(field, 0)
+        return list(groups.values())
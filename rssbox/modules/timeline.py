@@ -0,0 +1,52 @@
+from datetime import timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from rssbox.enum import DownloadStage
+
+# (name, from stage, to stage) of every interval reported by `python -m rssbox stats`
+INTERVALS: List[Tuple[str, DownloadStage, DownloadStage]] = [
+    ("queued", DownloadStage.INGESTED, DownloadStage.CLAIMED),
+    ("add", DownloadStage.CLAIMED, DownloadStage.ADDED),
+    ("verify", DownloadStage.ADDED, DownloadStage.VERIFIED),
+    ("download", DownloadStage.VERIFIED, DownloadStage.COMPLETED),
+    ("upload", DownloadStage.COMPLETED, DownloadStage.UPLOADED),
+    ("total", DownloadStage.INGESTED, DownloadStage.UPLOADED),
+]
+PERCENTILES = (50, 95, 99)
+
+
+def interval_durations(timeline: dict) -> Dict[str, float]:
+    """Seconds spent in each interval, intervals with a missing stamp are skipped"""
+    durations = {}
+    for name, start, end in INTERVALS:
+        started_at = timeline.get(start.value)
+        ended_at = timeline.get(end.value)
+        if started_at and ended_at and ended_at >= started_at:
+            durations[name] = (ended_at - started_at).total_seconds()
+    return durations
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of already sorted `values`"""
+    rank = max(1, -(-len(values) * percent // 100))  # ceil without floats
+    return values[int(rank) - 1]
+
+
+def summarize(records: Iterable[dict]) -> Dict[str | None, Dict[str, List[float]]]:
+    """Groups interval durations of history records by feed, `None` holds all feeds"""
+    summary: Dict[str | None, Dict[str, List[float]]] = {None: {}}
+    for record in records:
+        durations = interval_durations(record.get("timeline") or {})
+        for feed in {None, record.get("feed")}:
+            feed_summary = summary.setdefault(feed, {})
+            for name, seconds in durations.items():
+                feed_summary.setdefault(name, []).append(seconds)
+
+    for feed_summary in summary.values():
+        for values in feed_summary.values():
+            values.sort()
+    return summary
+
+
+def format_seconds(seconds: float) -> str:
+    return str(timedelta(seconds=round(seconds)))
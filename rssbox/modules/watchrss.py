@@ -1,15 +1,25 @@
 import logging
 from datetime import datetime, timezone
-from time import mktime, struct_time
-from typing import Callable, List
+from time import mktime, perf_counter, struct_time
+from typing import Callable, Iterator, List, Tuple
 
-from feedparser import FeedParserDict, parse
+import requests
+from feedparser import USER_AGENT, FeedParserDict, parse
+from feedparser.http import ACCEPT_HEADER
 from pymongo.collection import Collection
 
+from rssbox.modules.errors import UnsupportedFeedError
+from rssbox.modules.feed_parser import StreamingFeedParser
+from rssbox.modules.metrics import stage_seconds
+from rssbox.modules.polling import poll_interval, update_mean_interval
+
 logger = logging.getLogger(__name__)
 
 
 class WatchRSS:
+    FETCH_TIMEOUT = 60
+    CHUNK_SIZE = 64 * 1024
+
     def __init__(
         self,
         url: str,
@@ -18,6 +28,7 @@ class WatchRSS:
         id: str = None,
         last_saved_on: datetime | None = None,
         check_confirmation: bool = False,
+        fast_parser: bool = True,
     ):
         """
         :param url: RSS feed url
@@ -25,13 +36,20 @@ class WatchRSS:
         :param id: id to use to save the last saved on timestamp (defaults to url)
         :param last_saved_on: last saved on timestamp (defaults to now if not provided and not saved in db)
         :param check_confirmation: whether to check for confirmation from the callback function (defaults to False)
+        :param fast_parser: parse RSS 2.0/torznab feeds with the streaming parser, falling back to feedparser (defaults to True)
         :param database_path: path to the database file (defaults to watchrss.data.json)
         """
         self.url = url
         self.id = id or url
         self.callback = callback
         self.check_confirmation = check_confirmation
+        self.fast_parser = fast_parser
         self.db = db
+        self.mean_interval: float | None = None
+        self.errors = 0
+        self.etag: str | None = None
+        self.modified: str | None = None
+        self.read_seconds = 0.0
         if last_saved_on:
             self.update_last_saved_on(last_saved_on)
         elif not self.db.find_one({"_id": self.id}):
@@ -53,8 +71,81 @@ class WatchRSS:
             )
             self.last_saved_on = new_last_saved_on
         else:
-            result = self.db.find_one({"_id": self.id})
-            self.last_saved_on = result["last_saved_on"] if result else datetime.now()
+            result = self.db.find_one({"_id": self.id}) or {}
+            last_saved_on = result.get("last_saved_on") or datetime.now(tz=timezone.utc)
+            # stored as UTC, read back without a timezone
+            self.last_saved_on = (
+                last_saved_on.replace(tzinfo=timezone.utc)
+                if last_saved_on.tzinfo is None
+                else last_saved_on
+            )
+            self.mean_interval = result.get("mean_interval")
+            self.errors = result.get("errors", 0)
+            self.etag = result.get("etag")
+            self.modified = result.get("modified")
+
+    def advance(self, entries: List[FeedParserDict], last_saved_on: datetime):
+        """
+        Moves the last saved on timestamp to `last_saved_on` and folds the publish
+        times of `entries` into the feed's mean interval between entries
+        """
+        published = sorted(
+            self.struct_to_datetime(entry.published_parsed)
+            for entry in entries
+            if entry.get("published_parsed")
+        )
+        self.mean_interval = update_mean_interval(
+            self.mean_interval, self.last_saved_on, published
+        )
+        self.db.update_one(
+            {"_id": self.id},
+            {
+                "$set": {
+                    "last_saved_on": last_saved_on,
+                    "mean_interval": self.mean_interval,
+                }
+            },
+            upsert=True,
+        )
+        self.last_saved_on = last_saved_on
+
+    def set_errors(self, errors: int):
+        if errors != self.errors:
+            self.db.update_one(
+                {"_id": self.id}, {"$set": {"errors": errors}}, upsert=True
+            )
+            self.errors = errors
+
+    def save_validators(self, response: requests.Response):
+        """
+        Saves the ETag and Last-Modified of a feed whose entries were all handled,
+        the next check only gets a body when the feed changed
+        """
+        etag = response.headers.get("ETag")
+        modified = response.headers.get("Last-Modified")
+        if (etag, modified) != (self.etag, self.modified):
+            self.db.update_one(
+                {"_id": self.id},
+                {"$set": {"etag": etag, "modified": modified}},
+                upsert=True,
+            )
+            self.etag, self.modified = etag, modified
+
+    @property
+    def request_headers(self) -> dict:
+        """feedparser's headers, conditional on the last handled response"""
+        headers = {"User-Agent": USER_AGENT, "Accept": ACCEPT_HEADER}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        return headers
+
+    @property
+    def poll_interval(self) -> int:
+        """Seconds until the feed should be checked again"""
+        quiet_for = (datetime.now(tz=timezone.utc) - self.last_saved_on).total_seconds()
+        return poll_interval(self.mean_interval, quiet_for, self.errors)
 
     def struct_to_datetime(self, struct: struct_time) -> datetime:
         """
@@ -69,35 +160,115 @@ class WatchRSS:
 
         self.update_last_saved_on()
 
-        parsed = parse(self.url)
+        try:
+            response = self.fetch()
+            with response:
+                if response.status_code == 304:
+                    logger.debug(f"{self.url} has not changed")
+                    entries, last_saved_on = [], None
+                else:
+                    entries, last_saved_on = self.timed_parse(response)
+        except Exception:
+            self.set_errors(self.errors + 1)
+            raise
+        finally:
+            # a streamed body is read while it's parsed
+            stage_seconds.observe(self.read_seconds, stage="feed_fetch")
+        self.set_errors(0)
 
-        if not parsed.entries:
+        if not last_saved_on:
+            if response.status_code != 304:
+                self.save_validators(response)
             return
 
-        entries = [
-            entry
-            for entry in parsed.entries
-            if self.struct_to_datetime(entry.published_parsed) > self.last_saved_on
-        ]
-
         logger.debug(f"There are {len(entries)} new entries for {self.url}")
-        last_saved_on = self.struct_to_datetime(parsed.entries[0].published_parsed)
 
         if not entries:
+            self.save_validators(response)
             return
 
         try:
             confirm = self.callback(entries)
             if self.check_confirmation:
                 if confirm:
-                    self.update_last_saved_on(last_saved_on)
+                    self.advance(entries, last_saved_on)
+                    self.save_validators(response)
                 else:
                     logger.warning(
                         "Callback returned False, not updating last_saved_on timestamp"
                     )
             else:
-                self.update_last_saved_on(last_saved_on)
+                self.advance(entries, last_saved_on)
+                self.save_validators(response)
         except Exception:
             logger.exception(
                 "Error while calling callback, not updating last_saved_on timestamp"
             )
+
+    def fetch(self) -> requests.Response:
+        """Requests the feed, `read_seconds` starts at the time until the headers arrived"""
+        started = perf_counter()
+        try:
+            response = requests.get(
+                self.url,
+                headers=self.request_headers,
+                timeout=self.FETCH_TIMEOUT,
+                stream=self.fast_parser,
+            )
+            response.raise_for_status()
+            return response
+        finally:
+            self.read_seconds = perf_counter() - started
+
+    def timed_parse(
+        self, response: requests.Response
+    ) -> Tuple[List[FeedParserDict], datetime | None]:
+        """`parse`, observing the time not spent waiting on a streamed body as `feed_parse`"""
+        started, waited = perf_counter(), self.read_seconds
+        try:
+            return self.parse(response)
+        finally:
+            waited = self.read_seconds - waited
+            stage_seconds.observe(perf_counter() - started - waited, stage="feed_parse")
+
+    def read(self, response: requests.Response) -> Iterator[bytes]:
+        """Chunks of the body, adds the time spent waiting on them to `read_seconds`"""
+        chunks = response.iter_content(chunk_size=self.CHUNK_SIZE)
+        while True:
+            started = perf_counter()
+            chunk = next(chunks, None)
+            self.read_seconds += perf_counter() - started
+            if chunk is None:
+                return
+            yield chunk
+
+    def parse(
+        self, response: requests.Response
+    ) -> Tuple[List[FeedParserDict], datetime | None]:
+        """
+        Parses the feed, returns entries newer than `last_saved_on` and the publish time of the newest entry
+        """
+        body = None
+        if self.fast_parser:
+            chunks = self.read(response)
+            parser = StreamingFeedParser(self.struct_to_datetime)
+            try:
+                entries = parser.parse(chunks, stop_at=self.last_saved_on)
+                return entries, parser.newest
+            except UnsupportedFeedError as error:
+                logger.debug(f"Falling back to feedparser for {self.url}: {error}")
+                body = parser.body + b"".join(chunks)
+
+        parsed = parse(
+            response.content if body is None else body,
+            response_headers=response.headers,
+        )
+        if not parsed.entries:
+            return [], None
+
+        entries = [
+            entry
+            for entry in parsed.entries
+            if self.struct_to_datetime(entry.published_parsed) > self.last_saved_on
+        ]
+        return entries, self.struct_to_datetime(parsed.entries[0].published_parsed)
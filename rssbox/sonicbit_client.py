@@ -1,27 +1,48 @@
 import logging
 from datetime import datetime, timedelta, timezone
-from time import sleep
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import Callable, Dict, List
 
 import nanoid
 from apscheduler.schedulers.background import BackgroundScheduler
 from pymongo import ReturnDocument
 from pymongo.collection import Collection
+from sonicbit.types import Torrent
+from sonicbit.types.torrent.torrent_file import TorrentFile
 
 from rssbox.config import Config
-from rssbox.enum import DownloadStatus, SonicBitStatus
+from rssbox.database import get_database
+from rssbox.enum import DownloadStage, DownloadStatus, SonicBitStatus
 from rssbox.handlers.file_handler import FileHandler
 from rssbox.handlers.worker_handler import WorkerHandler
+from rssbox.hooks.dispatcher import HookDispatcher
 from rssbox.hooks.hook import Hook
 from rssbox.modules.download import Download
+from rssbox.modules.errors import StaleStateError, StorageFullError
 from rssbox.modules.heartbeat import Heartbeat
+from rssbox.modules.load import PeerLoads, WorkerLoad
+from rssbox.modules.metrics import stage_seconds, upload_bytes, upload_throughput
+from rssbox.modules.progress import next_check_delay, reported_rate
+from rssbox.modules.rate_limiter import call_class
+from rssbox.modules.scheduling import FeedScheduler
 from rssbox.modules.sonicbit import SonicBit
+from rssbox.utils import md5hash
 
 logger = logging.getLogger(__name__)
 
+# a document no worker holds
+UNLOCKED = [
+    {"locked_by": {"$exists": False}},  # Not locked by any instance
+    {"locked_by": None},  # Explicitly not locked
+    {"locked_by": ""},  # Explicitly not locked
+]
+
 
 class SonicBitClient:
     id: str
     accounts: Collection
+    slots: Collection
     downloads: Collection
     workers: Collection
     scheduler: BackgroundScheduler
@@ -31,6 +52,7 @@ class SonicBitClient:
     def __init__(
         self,
         accounts: Collection,
+        slots: Collection,
         downloads: Collection,
         workers: Collection,
         scheduler: BackgroundScheduler,
@@ -40,26 +62,62 @@ class SonicBitClient:
     ):
         self.id = id or nanoid.generate(alphabet="1234567890abcdef")
         self.accounts = accounts
+        self.slots = slots
         self.downloads = downloads
         self.workers = workers
         self.scheduler = scheduler
         self.file_handler = file_handler
         self.hook = hook
+        self.status_counters = get_database().status_counters
+        self.hook_dispatcher = HookDispatcher(
+            Config.HOOK_WORKERS, Config.HOOK_QUEUE_SIZE, Config.HOOK_TIMEOUT
+        )
         self.HEARTBEAT_INTERVAL = 30
+        self.sonicbits: Dict[str, SonicBit] = {}
+        self.sonicbits_lock = Lock()
+        self.feed_scheduler = FeedScheduler(
+            {
+                md5hash(url): weight
+                for url, weight in zip(Config.RSS_URLS, Config.FEED_WEIGHTS)
+            }
+        )
+        # a busy worker leaves work to peers whose heartbeats report more free slots
+        self.load = WorkerLoad(
+            {
+                "add": Config.MAX_CONCURRENT_ADDS,
+                "check": Config.MAX_CONCURRENT_CHECKS,
+                "upload": Config.MAX_CONCURRENT_UPLOADS,
+            },
+            PeerLoads(
+                get_database().heartbeat.get_collection(self.workers.name),
+                self.id,
+                self.HEARTBEAT_INTERVAL * 2,
+            ),
+            max_defer=self.HEARTBEAT_INTERVAL,
+        )
 
         logger.info(f"Initializing {type(self).__name__} with ID: {self.id}")
 
         self.heartbeat = Heartbeat(
-            self.id, self.workers, self.scheduler, self.HEARTBEAT_INTERVAL
+            self.id,
+            get_database().heartbeat.get_collection(self.workers.name),
+            self.scheduler,
+            self.HEARTBEAT_INTERVAL,
+            load=lambda: self.load.dict,
         )
         self.worker_handler = WorkerHandler(
             self.workers,
             self.accounts,
+            self.slots,
             self.downloads,
             self.scheduler,
             self.HEARTBEAT_INTERVAL,
         )
 
+        if id:
+            # a fixed ID may be that of a crashed worker restarted by the supervisor,
+            # its heartbeat carries on so nothing else releases what it held
+            self.worker_handler.release_locks(self.id)
         self.worker_handler.clean_stale_sonicbit_and_workers()
 
     def start(
@@ -69,63 +127,211 @@ class SonicBitClient:
         process_only: bool = True,
     ):
         with self.heartbeat:
-            if download_only or process_only:
-                logger.debug("Starting download checks and scheduler")
-                self.start_downloads()  # First download
-                if not download_only:
-                    self.scheduler.add_job(
-                        self.start_downloads,
-                        "interval",
-                        minutes=3,
-                        id="start_downloads",
-                        max_instances=5,
-                    )
-
-            if upload_only or process_only:
-                logger.debug("Starting upload checks")
-                self.check_downloads()
+            try:
+                if download_only or process_only:
+                    logger.debug("Starting download checks and scheduler")
+                    self.start_downloads()  # First download
+                    if not download_only:
+                        self.scheduler.add_job(
+                            self.start_downloads,
+                            "interval",
+                            minutes=3,
+                            id="start_downloads",
+                            max_instances=5,
+                        )
+
+                if upload_only or process_only:
+                    logger.debug("Starting upload checks")
+                    self.check_downloads()
+                    self.upload_downloads()
+
+                if download_only or process_only:
+                    self.start_downloads()
+            finally:
+                self.worker_handler.release_locks(self.id)
+                self.hook_dispatcher.shutdown()
+
+    def run(
+        self,
+        stop: Event,
+        download_only: bool = True,
+        upload_only: bool = True,
+        process_only: bool = True,
+    ):
+        """Dispatches and checks downloads continuously until `stop` is set"""
+        loops = []
+        if download_only or process_only:
+            loops += [
+                Thread(
+                    target=self.__loop,
+                    args=(self.start_downloads, Config.DISPATCH_INTERVAL, stop),
+                    name=f"dispatch-{index}",
+                    daemon=True,
+                )
+                for index in range(self.load.capacity["add"])
+            ]
+        if upload_only or process_only:
+            loops += [
+                Thread(
+                    target=self.__loop,
+                    args=(self.check_downloads, Config.CHECK_INTERVAL, stop),
+                    name=f"check-{index}",
+                    daemon=True,
+                )
+                for index in range(self.load.capacity["check"])
+            ]
+            loops += [
+                Thread(
+                    target=self.__loop,
+                    args=(self.upload_downloads, Config.UPLOAD_INTERVAL, stop),
+                    name=f"upload-{index}",
+                    daemon=True,
+                )
+                for index in range(self.load.capacity["upload"])
+            ]
 
-            if download_only or process_only:
-                self.start_downloads()
+        with self.heartbeat:
+            self.worker_handler.start()
+            for loop in loops:
+                loop.start()
+            logger.info(f"Running {', '.join(loop.name for loop in loops)} loops")
 
-    def get_sonicbit(self, account: dict) -> SonicBit:
-        return SonicBit(client=self.accounts, account=account)
+            try:
+                while not stop.wait(1):
+                    pass
+
+                logger.info("Stopping, waiting for in-flight downloads and uploads")
+                deadline = perf_counter() + Config.SHUTDOWN_TIMEOUT
+                for loop in loops:
+                    loop.join(max(deadline - perf_counter(), 0))
+                if running := [loop.name for loop in loops if loop.is_alive()]:
+                    # abandoned with the process, their accounts and downloads are released below
+                    logger.warning(
+                        f"Shutdown timeout, aborting {', '.join(running)} loops"
+                    )
+            finally:
+                # release before the heartbeat is removed so other workers can
+                # pick up the accounts and downloads right away
+                self.worker_handler.release_locks(self.id)
+                self.hook_dispatcher.shutdown()
+
+    def __loop(self, work: Callable[[Event], int], interval: int, stop: Event):
+        while not stop.is_set():
+            try:
+                processed = work(stop)
+            except Exception as error:
+                logger.exception(f"Error in {work.__name__}: {error}")
+                processed = 0
+
+            if not processed:
+                stop.wait(interval)
+
+    def get_sonicbit(self, slot: dict) -> SonicBit | None:
+        """SonicBit client of a claimed slot, `None` when its account was removed"""
+        with self.sonicbits_lock:
+            sonicbit = self.sonicbits.get(slot["_id"])
+        if sonicbit:
+            # the token may have been refreshed by another worker
+            account = self.accounts.find_one({"_id": sonicbit.email}, {"token": 1})
+            sonicbit.load(slot, token=account and account.get("token"))
+            return sonicbit
+
+        account = self.accounts.find_one({"_id": slot["account"]})
+        if not account:
+            # claimed by this worker, its download is put back to pending by `WorkerHandler`
+            logger.warning(f"Account of SonicBit slot {slot['_id']} was removed")
+            if self.slots.delete_one({"_id": slot["_id"]}).deleted_count:
+                self.status_counters.move("slots", slot["status"], None)
+            return None
+        sonicbit = SonicBit(client=self.accounts, account=account, slot=slot)
+        with self.sonicbits_lock:
+            self.sonicbits[sonicbit.id] = sonicbit
+        return sonicbit
 
     def get_free_sonicbit(self) -> SonicBit:
-        result = self.accounts.find_one_and_update(
+        now = datetime.now(tz=timezone.utc)
+        claimed = {
+            "status": SonicBitStatus.PROCESSING.value,
+            "locked_by": self.id,
+            "last_used_at": now,
+        }
+        # the slot as it was, its status is what the counters move from
+        before = self.slots.find_one_and_update(
             {
-                "$or": [
-                    {"status": SonicBitStatus.IDLE.value},
-                    {"status": {"$exists": False}},
-                    {"status": ""},
+                "$and": [
+                    {
+                        "$or": [
+                            {"status": SonicBitStatus.IDLE.value},
+                            {"status": {"$exists": False}},
+                            {"status": ""},
+                        ]
+                    },
+                    {
+                        "$or": [
+                            {"available_at": None},  # Never full
+                            {"available_at": {"$lte": now}},  # Full storage freed up
+                        ]
+                    },
                 ],
             },
-            {
-                "$set": {
-                    "status": SonicBitStatus.PROCESSING.value,
-                    "locked_by": self.id,
-                    "last_used_at": datetime.now(tz=timezone.utc),
-                }
-            },
+            {"$set": claimed, "$inc": {"version": 1}},
             sort=[("priority", -1), ("last_used_at", 1)],
-            return_document=ReturnDocument.AFTER,
+            return_document=ReturnDocument.BEFORE,
         )
-        if not result:
+        if not before:
             return None
+        # slots without a status are counted as idle
+        self.status_counters.move(
+            "slots",
+            before.get("status") or SonicBitStatus.IDLE,
+            SonicBitStatus.PROCESSING,
+        )
 
-        return self.get_sonicbit(result)
+        return self.get_sonicbit(
+            {**before, **claimed, "version": (before.get("version") or 0) + 1}
+        )
+
+    def has_pending_download(self) -> bool:
+        """Whether a download is waiting to be claimed, one indexed read"""
+        return (
+            self.downloads.find_one(
+                {"status": DownloadStatus.PENDING.value, "$or": UNLOCKED}, {"_id": 1}
+            )
+            is not None
+        )
 
     def get_pending_download(self) -> Download | None:
+        feeds = self.feed_scheduler.order(
+            lambda: self.downloads.distinct(
+                "feed", {"status": DownloadStatus.PENDING.value}
+            )
+        )
+        for feed in feeds:
+            if download := self.claim_pending_download({"feed": feed}):
+                self.feed_scheduler.claimed(feed)
+                return download
+            self.feed_scheduler.exhausted(feed)
+
+        # feeds that got pending downloads since the list was cached
+        return self.claim_pending_download({})
+
+    def claim_pending_download(self, filter: dict) -> Download | None:
         raw_download = self.downloads.find_one_and_update(
             {
                 "status": DownloadStatus.PENDING.value,
-                "$or": [
-                    {"locked_by": {"$exists": False}},  # Not locked by any instance
-                    {"locked_by": None},  # Explicitly not locked
-                    {"locked_by": ""},  # Explicitly not locked
-                ],
+                **filter,
+                "$or": UNLOCKED,
             },
-            {"$set": {"locked_by": self.id}},
+            {
+                "$set": {
+                    "locked_by": self.id,
+                    f"timeline.{DownloadStage.CLAIMED.value}": datetime.now(
+                        tz=timezone.utc
+                    ),
+                },
+                "$inc": {"version": 1},
+            },
+            sort=[("rank", 1)],
             return_document=ReturnDocument.AFTER,
         )
 
@@ -135,47 +341,77 @@ class SonicBitClient:
         return Download(self.downloads, raw_download)
 
     def get_download_to_check(self) -> SonicBit | None:
-        locked_account = self.accounts.find_one_and_update(
+        now = datetime.now(tz=timezone.utc)
+        locked_slot = self.slots.find_one_and_update(
             {
                 "status": SonicBitStatus.DOWNLOADING.value,
-                "$or": [
-                    {"locked_by": {"$exists": False}},  # Not locked by any instance
-                    {"locked_by": None},  # Explicitly not locked
-                    {"locked_by": ""},  # Explicitly not locked
+                "$and": [
+                    {
+                        "$or": [
+                            {
+                                "locked_by": {"$exists": False}
+                            },  # Not locked by any instance
+                            {"locked_by": None},  # Explicitly not locked
+                            {"locked_by": ""},  # Explicitly not locked
+                        ]
+                    },
+                    {
+                        "$or": [
+                            {"next_check_at": None},  # Never checked
+                            {"next_check_at": {"$lte": now}},  # Due
+                        ]
+                    },
                 ],
             },  # Ensure it's still unlocked
             {
                 "$set": {
                     "status": SonicBitStatus.LOCKED.value,
                     "locked_by": self.id,
-                    "last_checked_at": datetime.now(tz=timezone.utc),
-                }
+                    "last_checked_at": now,
+                },
+                "$inc": {"version": 1},
             },
-            sort=[("last_checked_at", 1)],
+            sort=[("next_check_at", 1), ("last_checked_at", 1)],
             return_document=ReturnDocument.AFTER,
         )
 
-        if locked_account:
-            return self.get_sonicbit(locked_account)
+        if locked_slot:
+            self.status_counters.move(
+                "slots", SonicBitStatus.DOWNLOADING, SonicBitStatus.LOCKED
+            )
+            return self.get_sonicbit(locked_slot)
         else:
             return None
 
-    def check_downloads(self):
+    def check_downloads(self, stop: Event | None = None) -> int:
         now = datetime.now(tz=timezone.utc)
-        while True:
+        checked = 0
+        while not (stop and stop.is_set()):
             if datetime.now(tz=timezone.utc) - now > timedelta(
                 seconds=Config.DOWNLOAD_CHECK_TIMEOUT
             ):
                 break
 
-            sonicbit = self.get_download_to_check()
-            if not sonicbit:
-                break
+            with self.load.slot("check") as reserved:
+                if not reserved:
+                    break
 
-            try:
-                self.__check_download(sonicbit=sonicbit)
-            except Exception as error:
-                logger.exception(f"Error while checking downloads: {error}")
+                sonicbit = self.get_download_to_check()
+                if not sonicbit:
+                    break
+                reserved.claimed()
+
+                checked += 1
+                try:
+                    with stage_seconds.time(stage="check_iteration"):
+                        self.__check_download(sonicbit=sonicbit)
+                except StaleStateError as error:
+                    logger.warning(f"Skipped a check: {error}")
+                    self.release(sonicbit, SonicBitStatus.DOWNLOADING)
+                except Exception as error:
+                    logger.exception(f"Error while checking downloads: {error}")
+
+        return checked
 
     def __check_download(self, sonicbit: SonicBit):
         download = sonicbit.download
@@ -186,6 +422,16 @@ class SonicBitClient:
             )
             sonicbit.mark_as_idle()
             return
+        if download.status != DownloadStatus.PROCESSING or download.account not in (
+            None,
+            sonicbit.id,
+        ):
+            # the account was not released after its download moved on
+            logger.warning(
+                f"SonicBit downloading but {download.name} is {download.status.value} ({sonicbit.id})"
+            )
+            sonicbit.mark_as_idle()
+            return
         if not download.hash:
             logger.warning(
                 f"SonicBit downloading but no download's hash found for {sonicbit.download_id} ({sonicbit.id})"
@@ -205,64 +451,277 @@ class SonicBitClient:
 
         if torrent.progress == 100:
             logger.info(f"Downloaded {download.name} by {sonicbit.id}")
-            try:
-                sonicbit.mark_as_uploading(self.id)
-                files_uploaded = self.file_handler.upload(download, torrent)
-                if files_uploaded:
-                    sonicbit.mark_as_completed()
-                    self.hook.on_upload_complete(
-                        sonicbit, download.dict, files_uploaded
-                    )
-                else:
-                    logger.warning(
-                        f"No files uploaded for {download.name} by {sonicbit.id}"
+            download.stage(DownloadStage.COMPLETED)
+            sonicbit.mark_as_queued()
+        elif sonicbit.download_timeout():
+            logger.warning(f"Download timed out for {download.name} by {sonicbit.id}")
+            self.hook_dispatcher.dispatch(self.hook.on_download_timeout, download)
+        else:
+            download.record_progress(torrent.progress, reported_rate(torrent))
+            left = 1
+            if (
+                Config.EARLY_UPLOAD
+                and torrent.is_multi_file
+                and self.file_handler.uploads_files
+            ):
+                files = self.__pending_files(download, torrent)
+                if any(file.progress == 100 for file in files):
+                    logger.info(
+                        f"Files of {download.name} finished by {sonicbit.id} ({torrent.progress}%)"
                     )
-                    sonicbit.unlock(SonicBitStatus.DOWNLOADING)
-                    sleep(5)
+                    sonicbit.mark_as_queued()
+                    return
+                left = len(files)
+
+            check_in = next_check_delay(
+                download.progress, download.progress_rate, parts=left
+            )
+            logger.debug(
+                f"Download in progress for {download.name} by {sonicbit.id} ({torrent.progress}%) ({sonicbit.time_taken_str}), next check in {check_in}s"
+            )
+            sonicbit.unlock(SonicBitStatus.DOWNLOADING, check_in=check_in)
+
+    def get_download_to_upload(self) -> SonicBit | None:
+        """Claims the slot that has waited longest for its finished files to be uploaded"""
+        locked_slot = self.slots.find_one_and_update(
+            {
+                "status": SonicBitStatus.COMPLETED.value,
+                "$or": [
+                    {"locked_by": {"$exists": False}},  # Not locked by any instance
+                    {"locked_by": None},  # Explicitly not locked
+                    {"locked_by": ""},  # Explicitly not locked
+                ],
+            },
+            {
+                "$set": {
+                    "status": SonicBitStatus.UPLOADING.value,
+                    "locked_by": self.id,
+                },
+                "$inc": {"version": 1},
+            },
+            sort=[("queued_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if locked_slot:
+            self.status_counters.move(
+                "slots", SonicBitStatus.COMPLETED, SonicBitStatus.UPLOADING
+            )
+            return self.get_sonicbit(locked_slot)
+        else:
+            return None
+
+    def upload_downloads(self, stop: Event | None = None) -> int:
+        now = datetime.now(tz=timezone.utc)
+        uploaded = 0
+        while not (stop and stop.is_set()):
+            if datetime.now(tz=timezone.utc) - now > timedelta(
+                seconds=Config.DOWNLOAD_CHECK_TIMEOUT
+            ):
+                break
+
+            with self.load.slot("upload") as reserved:
+                if not reserved:
+                    break
+
+                sonicbit = self.get_download_to_upload()
+                if not sonicbit:
+                    break
+                reserved.claimed()
+
+                uploaded += 1
+                try:
+                    with call_class("upload"):
+                        self.__upload_download(sonicbit=sonicbit)
+                except StaleStateError as error:
+                    logger.warning(f"Skipped an upload: {error}")
+                    self.release(sonicbit, SonicBitStatus.COMPLETED)
+                except Exception as error:
+                    logger.exception(f"Error while uploading downloads: {error}")
+
+        return uploaded
+
+    def __upload_download(self, sonicbit: SonicBit):
+        download = sonicbit.download
+
+        if not download:
+            logger.warning(
+                f"SonicBit uploading but no download found for {sonicbit.download_id} ({sonicbit.id})"
+            )
+            sonicbit.mark_as_idle()
+            return
+        if download.status != DownloadStatus.PROCESSING or download.account not in (
+            None,
+            sonicbit.id,
+        ):
+            logger.warning(
+                f"SonicBit uploading but {download.name} is {download.status.value} ({sonicbit.id})"
+            )
+            sonicbit.mark_as_idle()
+            return
+
+        torrent = sonicbit.list_torrents().torrents.get(download.hash)
+        if not torrent:
+            logger.warning(
+                f"Torrent not found for {download.name} by {sonicbit.id} after {sonicbit.time_taken_str}"
+            )
+            if self.hook.on_sonicbit_download_not_found(sonicbit, download):
+                sonicbit.reset()
+            return
+
+        if torrent.progress < 100:
+            # files that finished early, the rest is checked again when due
+            try:
+                left = self.__upload_finished_files(download, torrent)
+            except StaleStateError:
+                raise
             except Exception as error:
                 logger.exception(
-                    f"Failed to upload {download.name} to {sonicbit.id}: {error}"
+                    f"Failed to upload finished files of {download.name} from {sonicbit.id}: {error}"
                 )
-                soft = self.hook.on_before_upload_error(sonicbit, download, error)
-                sonicbit.mark_as_failed(soft=soft)
-                self.hook.on_after_upload_error(sonicbit, download, error)
-        else:
-            if sonicbit.download_timeout():
-                logger.warning(
-                    f"Download timed out for {download.name} by {sonicbit.id}"
+                left = 1
+            sonicbit.unlock(
+                SonicBitStatus.DOWNLOADING,
+                check_in=next_check_delay(
+                    download.progress or 0, download.progress_rate, parts=left
+                ),
+            )
+            return
+
+        try:
+            upload_started = perf_counter()
+            if self.file_handler.uploads_files:
+                # files uploaded while the torrent downloaded are skipped
+                left = self.__upload_finished_files(download, torrent)
+                files_uploaded = 0 if left else len(download.uploaded_files)
+            else:
+                files_uploaded = self.file_handler.upload(download, torrent)
+                upload_time = perf_counter() - upload_started
+                if files_uploaded:
+                    upload_bytes.inc(torrent.size)
+                    if upload_time > 0:
+                        upload_throughput.observe(torrent.size / upload_time)
+            stage_seconds.observe(perf_counter() - upload_started, stage="upload")
+            if files_uploaded:
+                sonicbit.mark_as_completed()
+                self.hook_dispatcher.dispatch(
+                    self.hook.on_upload_complete,
+                    sonicbit.snapshot(),
+                    download.dict,
+                    files_uploaded,
                 )
-                self.hook.on_download_timeout(download)
             else:
-                logger.debug(
-                    f"Download in progress for {download.name} by {sonicbit.id} ({torrent.progress}%) ({sonicbit.time_taken_str})"
+                logger.warning(
+                    f"No files uploaded for {download.name} by {sonicbit.id}"
+                )
+                sonicbit.unlock(
+                    SonicBitStatus.DOWNLOADING, check_in=Config.CHECK_MIN_DELAY
                 )
-                sonicbit.unlock(SonicBitStatus.DOWNLOADING)
-                sleep(5)
+        except StaleStateError:
+            raise
+        except Exception as error:
+            logger.exception(
+                f"Failed to upload {download.name} to {sonicbit.id}: {error}"
+            )
+            soft = self.hook.on_before_upload_error(sonicbit, download, error)
+            sonicbit.mark_as_failed(soft=soft)
+            self.hook_dispatcher.dispatch(
+                self.hook.on_after_upload_error, sonicbit.snapshot(), download, error
+            )
+
+    def __pending_files(
+        self, download: Download, torrent: Torrent
+    ) -> List[TorrentFile]:
+        """Files of `torrent` the file handler takes that are not uploaded yet"""
+        return [
+            file
+            for file in torrent.files
+            if self.file_handler.check_extension((file.extension or "").lstrip("."))
+            and file.torrent_path not in download.uploaded_files
+        ]
+
+    def __upload_finished_files(self, download: Download, torrent: Torrent) -> int:
+        """Uploads the finished files of `torrent` not uploaded yet, returns how many are left"""
+        left = 0
+        for file in self.__pending_files(download, torrent):
+            if file.progress < 100:
+                left += 1
+                continue
+
+            upload_started = perf_counter()
+            uploaded = self.file_handler.upload_file(download, torrent, file)
+            upload_time = perf_counter() - upload_started
+            if not uploaded:
+                logger.warning(f"File {file.name} of {download.name} was not uploaded")
+                left += 1
+                continue
+
+            logger.info(f"Uploaded {file.name} of {download.name}")
+            upload_bytes.inc(file.size)
+            if upload_time > 0:
+                upload_throughput.observe(file.size / upload_time)
+            download.mark_file_uploaded(file.torrent_path)
+        return left
+
+    def release(self, sonicbit: SonicBit, status: SonicBitStatus):
+        """Unlocks a slot after a stale write, unless another worker already changed it"""
+        try:
+            if status == SonicBitStatus.IDLE:
+                sonicbit.mark_as_idle()
+            else:
+                sonicbit.unlock(status)
+        except StaleStateError:
+            logger.debug(f"SonicBit {sonicbit.id} is owned by another worker")
 
-    def start_downloads(self):
+    def start_downloads(self, stop: Event | None = None) -> int:
         now = datetime.now(tz=timezone.utc)
+        started = 0
 
-        while True:
+        while not (stop and stop.is_set()):
             if datetime.now(tz=timezone.utc) - now > timedelta(
                 seconds=Config.DOWNLOAD_START_TIMEOUT
             ):
                 break
 
-            download = self.get_pending_download()
-            if not download:
-                break
+            with self.load.slot("add") as reserved:
+                if not reserved:
+                    break
 
-            sonicbit = self.get_free_sonicbit()
-            if not sonicbit:
-                download.unlock()
-                logger.debug("No sonicbit accounts available for downloading")
-                break
+                # an empty queue costs a read, not a slot claim and its release
+                if not self.has_pending_download():
+                    logger.debug("No pending downloads")
+                    break
 
-            try:
-                sonicbit.add_download_with_retries(download=download)
-                logger.info(f"Torrent {download.name} added to {sonicbit.id}")
-            except Exception as error:
-                logger.error(f"Failed to add {download.name} to {sonicbit.id}: {error}")
-                if self.hook.on_add_download_error(sonicbit, download, error):
-                    download.unlock()
+                # accounts are the scarce resource, nothing is claimed while all are busy
+                sonicbit = self.get_free_sonicbit()
+                if not sonicbit:
+                    logger.debug("No sonicbit accounts available for downloading")
+                    break
+
+                download = self.get_pending_download()
+                if not download:
                     sonicbit.mark_as_idle()
+                    break
+                reserved.claimed()
+
+                try:
+                    sonicbit.add_download_with_retries(download=download)
+                    logger.info(f"Torrent {download.name} added to {sonicbit.id}")
+                    started += 1
+                except StaleStateError as error:
+                    # another worker moved the download, it owns it now
+                    logger.warning(f"Skipped {download.name}: {error}")
+                    self.release(sonicbit, SonicBitStatus.IDLE)
+                except StorageFullError as error:
+                    logger.warning(f"Not adding {download.name}: {error}")
+                    download.unlock()
+                    sonicbit.mark_as_full()
+                except Exception as error:
+                    logger.error(
+                        f"Failed to add {download.name} to {sonicbit.id}: {error}"
+                    )
+                    if self.hook.on_add_download_error(sonicbit, download, error):
+                        download.unlock()
+                        sonicbit.mark_as_idle()
+
+        return started
@@ -0,0 +1,119 @@
+import logging
+import multiprocessing
+import signal
+from threading import Event
+from time import monotonic
+from typing import Callable, List
+
+from rssbox.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """Forks worker processes running `target(index)` and restarts them when they crash"""
+
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 60
+    # a worker that ran this long before crashing restarts without backoff
+    HEALTHY_RUNTIME = 60
+    # seconds on top of the workers' own shutdown timeout before they are killed
+    KILL_GRACE = 15
+
+    def __init__(
+        self,
+        target: Callable[[int], None],
+        count: int,
+        shutdown_timeout: int = Config.SHUTDOWN_TIMEOUT,
+    ):
+        """
+        :param target: called with the worker index (0 to count - 1) in each child
+        :param count: number of worker processes
+        :param shutdown_timeout: seconds workers get to drain after SIGTERM
+        """
+        self.target = target
+        self.count = count
+        self.shutdown_timeout = shutdown_timeout
+        self.context = multiprocessing.get_context("fork")
+
+        self.processes: List[multiprocessing.Process | None] = [None] * count
+        self.started_at = [0.0] * count
+        self.backoff = [0] * count
+        self.restart_at = [0.0] * count
+        self.finished = [False] * count
+
+    def run(self, stop: Event):
+        logger.info(f"Starting {self.count} workers")
+        for index in range(self.count):
+            self.start_worker(index)
+
+        while not stop.wait(1):
+            for index in range(self.count):
+                self.watch_worker(index)
+            if all(self.finished):
+                logger.info("All workers finished")
+                return
+
+        self.stop_workers()
+
+    def start_worker(self, index: int):
+        process = self.context.Process(
+            target=self._run_worker, args=(index,), name=f"worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = monotonic()
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def watch_worker(self, index: int):
+        process = self.processes[index]
+        if self.finished[index]:
+            return
+
+        if process is None:
+            if monotonic() >= self.restart_at[index]:
+                self.start_worker(index)
+            return
+
+        if process.is_alive():
+            return
+
+        self.processes[index] = None
+        if process.exitcode == 0:
+            logger.info(f"Worker {index} finished")
+            self.finished[index] = True
+            return
+
+        if monotonic() - self.started_at[index] >= self.HEALTHY_RUNTIME:
+            self.backoff[index] = 0
+        self.backoff[index] = min(
+            max(self.backoff[index] * 2, self.MIN_BACKOFF), self.MAX_BACKOFF
+        )
+        self.restart_at[index] = monotonic() + self.backoff[index]
+        logger.warning(
+            f"Worker {index} exited with code {process.exitcode}, restarting in {self.backoff[index]}s"
+        )
+
+    def stop_workers(self):
+        running = [
+            process for process in self.processes if process and process.is_alive()
+        ]
+        logger.info(f"Stopping {len(running)} workers")
+        for process in running:
+            process.terminate()  # SIGTERM, drained by the worker
+
+        deadline = monotonic() + self.shutdown_timeout + self.KILL_GRACE
+        for process in running:
+            process.join(max(deadline - monotonic(), 0))
+
+        for process in running:
+            if process.is_alive():
+                logger.warning(f"Killing {process.name} (pid {process.pid})")
+                process.kill()
+                process.join()
+
+    def _run_worker(self, index: int):
+        # the supervisor's handlers were inherited, the worker installs its own
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        self.target(index)
@@ -1,7 +1,9 @@
+import base64
 import hashlib
 import os
 import re
 import shutil
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import bencodepy
 import requests
@@ -24,6 +26,52 @@ def md5hash(name: str) -> str:
     return h.hexdigest()
 
 
+def url_key(url: str) -> str:
+    """
+    Fixed size key of `url`, shared by every link to the same torrent
+
+    A magnet link is keyed by its info hashes alone, so the same torrent with
+    other trackers or another name is a duplicate. Other URLs are keyed with a
+    lowercase scheme and host, sorted query and no fragment.
+    """
+    parts = urlsplit(url.strip())
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if parts.scheme.lower() == "magnet":
+        topics = sorted(
+            {_normalize_topic(value) for name, value in query if name == "xt"}
+        )
+        if topics:
+            return md5hash("magnet:?" + urlencode([("xt", xt) for xt in topics]))
+    return md5hash(
+        urlunsplit(
+            (
+                parts.scheme.lower(),
+                parts.netloc.lower(),
+                parts.path,
+                urlencode(sorted(query)),
+                "",
+            )
+        )
+    )
+
+
+def _normalize_topic(topic: str) -> str:
+    """Lowercase hex of a `urn:btih` info hash, whether hex or base32 encoded"""
+    prefix, _, value = topic.rpartition(":")
+    if prefix.lower() == "urn:btih" and len(value) == 32:
+        try:
+            value = base64.b32decode(value.upper()).hex()
+        except ValueError:
+            pass
+    return f"{prefix.lower()}:{value.lower()}"
+
+
+def redact_url(url: str) -> str:
+    """Drops credentials and query string (indexer api keys) from `url` for display"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.hostname or ''}{parts.path}"
+
+
 def clean_empty_dirs(path):
     for root, dirs, files in os.walk(path, topdown=False):
         for name in dirs:
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# `rssbox.config` reads these when imported, tests point them at scratch locations
+_scratch = tempfile.mkdtemp(prefix="rssbox-tests-")
+os.environ.setdefault("RSS_URL", "http://127.0.0.1:1/rss")
+os.environ.setdefault("MONGO_URL", f"sqlite:///{_scratch}/rssbox.db")
+os.environ.setdefault("DOWNLOAD_PATH", os.path.join(_scratch, "downloads"))
+os.environ.setdefault("LOG_FILE", os.path.join(_scratch, "rssbox.log"))
@@ -0,0 +1,51 @@
+import unittest
+
+import mongomock
+from feedparser import FeedParserDict
+
+from rssbox.modules.entry_filter import ALL_FEEDS, EntryFilters
+
+
+class EntryFiltersTest(unittest.TestCase):
+    def setUp(self):
+        database = mongomock.MongoClient().db
+        self.rules = database.entry_filters
+        self.filters = EntryFilters(
+            self.rules,
+            database.downloads,
+            database.download_history,
+            reload_interval=3600,
+        )
+
+    def titles(self, *titles: str) -> list:
+        entries = [FeedParserDict(title=title) for title in titles]
+        return [entry.title for entry in self.filters.apply("feed", entries)]
+
+    def test_inline_flags_are_combined(self):
+        self.rules.insert_one(
+            {"_id": ALL_FEEDS, "exclude": ["(?i)cam", "(?x) t s", "[broken"]}
+        )
+        with self.assertLogs("rssbox.modules.entry_filter", "WARNING"):
+            titles = self.titles("Show CAM", "Show TS", "Show 1080p")
+        self.assertEqual(titles, ["Show 1080p"])
+
+    def test_rules_that_fail_to_compile_keep_the_last(self):
+        self.rules.insert_one({"_id": "feed", "exclude": ["cam"]})
+        self.assertEqual(self.titles("Show CAM", "Show 1080p"), ["Show 1080p"])
+
+        # valid on their own, not in one alternation
+        self.rules.replace_one(
+            {"_id": "feed"}, {"exclude": ["(?P<tag>ts)", "(?P<tag>cam)"]}
+        )
+        with self.assertLogs("rssbox.modules.entry_filter", "WARNING"):
+            self.filters.reload(force=True)
+        self.assertEqual(self.titles("Show CAM", "Show TS"), ["Show TS"])
+
+        self.rules.insert_one({"_id": ALL_FEEDS, "exclude": ["(?P<a>x)", "(?P<a>y)"]})
+        with self.assertLogs("rssbox.modules.entry_filter", "WARNING"):
+            self.filters.reload(force=True)
+        self.assertNotIn(ALL_FEEDS, self.filters.compiled)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import mongomock
+
+from rssbox.modules.load import PeerLoads, WorkerLoad
+
+
+class WorkerLoadTest(unittest.TestCase):
+    def test_empty_polls_record_no_latency(self):
+        load = WorkerLoad({"check": 2})
+        with load.slot("check") as reserved:
+            self.assertTrue(reserved)
+        with load.slot("check") as reserved:
+            reserved.claimed()
+        self.assertEqual(len(load.latencies["check"]), 1)
+        self.assertEqual(load.in_flight["check"], 0)
+
+    def test_full_worker_reserves_nothing(self):
+        load = WorkerLoad({"add": 1})
+        with load.slot("add") as first, load.slot("add") as second:
+            self.assertTrue(first)
+            self.assertFalse(second)
+
+
+class PeerLoadsTest(unittest.TestCase):
+    def setUp(self):
+        self.workers = mongomock.MongoClient().db.workers
+        now = datetime.now(timezone.utc)
+        self.workers.insert_many(
+            [
+                {"_id": "idle", "last_heartbeat": now, "load": {"free": {"add": 4}}},
+                {
+                    "_id": "stale",
+                    "last_heartbeat": now - timedelta(minutes=5),
+                    "load": {"free": {"add": 8}},
+                },
+                {"_id": "self", "last_heartbeat": now, "load": {"free": {"add": 9}}},
+            ]
+        )
+        self.peers = PeerLoads(self.workers, "self", stale_after=60)
+
+    def test_reads_live_peers_only(self):
+        self.assertEqual(self.peers.most_free("add"), 4)
+        self.assertEqual(self.peers.most_free("upload"), 0)
+
+    def test_busy_worker_defers_to_freer_peer(self):
+        load = WorkerLoad({"add": 4}, self.peers, max_defer=30)
+        with load.slot("add") as first:
+            # idle, it claims even though a peer has as many free slots
+            self.assertTrue(first)
+            with load.slot("add") as second:
+                self.assertFalse(second)
+
+    def test_deferral_ends_after_max_defer(self):
+        load = WorkerLoad({"add": 4}, self.peers, max_defer=30)
+        with mock.patch("rssbox.modules.load.monotonic") as monotonic:
+            monotonic.return_value = 1000.0
+            with load.slot("add"):
+                with load.slot("add") as deferred:
+                    self.assertFalse(deferred)
+                monotonic.return_value = 1031.0
+                with load.slot("add") as claimed:
+                    self.assertTrue(claimed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest import mock
+
+import mongomock
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from rssbox.enum import DownloadStatus, SonicBitStatus
+from rssbox.handlers.metrics_handler import MetricsHandler
+from rssbox.modules.counters import StatusCounters
+from rssbox.modules.metrics import accounts_by_status, downloads_by_status
+
+
+class MetricsHandlerTest(unittest.TestCase):
+    def test_status_gauges_read_the_counters(self):
+        # a refresh must not recount the collections
+        collections = {
+            "downloads": mock.Mock(**{"aggregate.side_effect": AssertionError}),
+            "slots": mock.Mock(**{"aggregate.side_effect": AssertionError}),
+        }
+        counters = StatusCounters(mongomock.MongoClient().db.counters, collections)
+        counters.move("downloads", None, DownloadStatus.PENDING, amount=3)
+        counters.move("downloads", DownloadStatus.PENDING, DownloadStatus.PROCESSING)
+        counters.move("slots", None, SonicBitStatus.DOWNLOADING)
+
+        handler = MetricsHandler(counters, BackgroundScheduler(), "127.0.0.1", 0, 60)
+        self.addCleanup(handler.server.server.server_close)
+        handler.refresh_status_gauges()
+
+        self.assertEqual(downloads_by_status.get(status="PENDING"), 2)
+        self.assertEqual(downloads_by_status.get(status="PROCESSING"), 1)
+        self.assertEqual(downloads_by_status.get(status="COMPLETED"), 0)
+        self.assertEqual(accounts_by_status.get(status="DOWNLOADING"), 1)
+        for collection in collections.values():
+            collection.aggregate.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import itertools
+import unittest
+from unittest import mock
+
+import mongomock
+
+from rssbox.modules.rate_limiter import RateLimiter, call_class
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.rate_limits
+
+    def acquire(self, limiter: RateLimiter, name: str):
+        # a call that would wait fails instead of retrying forever
+        with call_class(name), mock.patch(
+            "rssbox.modules.rate_limiter.sleep", side_effect=AssertionError("waited")
+        ):
+            limiter.acquire("account")
+
+    def test_burst_of_one_serves_every_call_class(self):
+        limiter = RateLimiter(self.collection, 10, 1, 10, 1)
+        # a second between calls refills both buckets
+        with mock.patch(
+            "rssbox.modules.rate_limiter.time", side_effect=itertools.count(1000.0)
+        ):
+            for name in ("check", "upload", "add", "purge"):
+                with self.subTest(name=name):
+                    self.acquire(limiter, name)
+
+    def test_reserve_holds_back_lower_classes(self):
+        limiter = RateLimiter(self.collection, 0.001, 4, 0, 0)
+        with mock.patch("rssbox.modules.rate_limiter.time", return_value=1000.0):
+            self.acquire(limiter, "check")
+            self.acquire(limiter, "check")
+            # 2 of 4 tokens left, a purge keeps half the bucket back
+            with self.assertRaises(AssertionError):
+                self.acquire(limiter, "purge")
+            self.acquire(limiter, "add")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from rssbox.database import get_database
+from rssbox.enum import DownloadStage, DownloadStatus, SonicBitStatus
+from rssbox.modules.download import Download
+from rssbox.modules.sonicbit import SonicBit
+
+ACCOUNT = {"_id": "user@example.com", "password": "secret", "token": "token"}
+
+
+class SonicBitTest(unittest.TestCase):
+    def setUp(self):
+        self.database = get_database()
+        self.download_id = Download.create(
+            self.database.downloads,
+            "name",
+            "magnet:?xt=urn:btih:test",
+            status=DownloadStatus.PROCESSING,
+        )
+        self.slot_id = f"{ACCOUNT['_id']}:0"
+        self.database.slots.insert_one(
+            {
+                "_id": self.slot_id,
+                "account": ACCOUNT["_id"],
+                "status": SonicBitStatus.DOWNLOADING.value,
+                "download_id": self.download_id,
+                "version": 0,
+            }
+        )
+
+    def tearDown(self):
+        self.database.slots.delete_many({})
+        self.database.downloads.delete_many({})
+        self.database.download_history.delete_many({})
+
+    def sonicbit(self) -> SonicBit:
+        """Slot read from the database, as each loop claims it"""
+        slot = self.database.slots.find_one({"_id": self.slot_id})
+        return SonicBit(self.database.accounts, ACCOUNT, slot)
+
+    def test_queued_download_keeps_its_completed_stamp(self):
+        downloading = self.sonicbit()
+        downloading.download.stage(DownloadStage.COMPLETED)
+        downloading.mark_as_queued()
+
+        uploading = self.sonicbit()
+        uploading.mark_as_uploading("worker")
+        uploading.mark_as_completed()
+
+        history = self.database.download_history.find_one({"_id": self.download_id})
+        self.assertIn(DownloadStage.COMPLETED.value, history["timeline"])
+        self.assertIn(DownloadStage.UPLOADED.value, history["timeline"])
+        self.assertIsNone(self.database.downloads.find_one({"_id": self.download_id}))
+
+
+if __name__ == "__main__":
+    unittest.main()
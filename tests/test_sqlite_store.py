@@ -0,0 +1,216 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+from rssbox.modules.sqlite_store import SQLiteClient
+
+
+class SQLiteStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "state.db")
+        self.client = SQLiteClient(self.path)
+        self.database = self.client.get_database("rssbox")
+        self.collection = self.database.get_collection("things")
+
+    def tearDown(self):
+        self.client.close()
+
+    def ids(self, filter: dict) -> set:
+        return {document["_id"] for document in self.collection.find(filter)}
+
+    def test_scalar_queries(self):
+        self.collection.insert_one({"_id": 1, "status": "PENDING", "size": 5})
+        self.collection.insert_one({"_id": 2, "status": "DONE", "size": None})
+        self.collection.insert_one({"_id": 3, "size": 20})
+
+        self.assertEqual(self.ids({"status": "PENDING"}), {1})
+        self.assertEqual(self.ids({"status": None}), {3})
+        self.assertEqual(self.ids({"status": {"$ne": "PENDING"}}), {2, 3})
+        self.assertEqual(self.ids({"status": {"$in": ["DONE", None]}}), {2, 3})
+        self.assertEqual(self.ids({"status": {"$nin": ["DONE"]}}), {1, 3})
+        self.assertEqual(self.ids({"size": {"$exists": True}}), {1, 2, 3})
+        self.assertEqual(self.ids({"status": {"$exists": False}}), {3})
+        self.assertEqual(self.ids({"size": {"$gte": 5, "$lt": 20}}), {1})
+        self.assertEqual(
+            self.ids({"$or": [{"status": "DONE"}, {"size": {"$gt": 10}}]}), {2, 3}
+        )
+        self.assertEqual(self.collection.count_documents({"size": {"$lte": 20}}), 2)
+
+    def test_array_fields_match_their_elements(self):
+        self.collection.insert_one({"_id": 1, "tags": ["a", "b"]})
+        self.collection.insert_one({"_id": 2, "tags": "a"})
+        self.collection.insert_one({"_id": 3, "tags": ["c"]})
+
+        self.assertEqual(self.ids({"tags": "a"}), {1, 2})
+        self.assertEqual(self.ids({"tags": {"$ne": "a"}}), {3})
+        self.assertEqual(self.ids({"tags": {"$in": ["b", "c"]}}), {1, 3})
+        self.assertEqual(self.ids({"tags": {"$nin": ["a"]}}), {3})
+        self.assertEqual(self.ids({"tags": ["a", "b"]}), {1})
+        self.assertEqual(self.collection.count_documents({"tags": "a"}), 2)
+
+    def test_arrays_written_by_another_process_are_seen(self):
+        self.collection.insert_one({"_id": 1, "tags": "a"})
+        self.assertEqual(self.ids({"tags": "a"}), {1})
+
+        other = SQLiteClient(self.path)
+        try:
+            other.get_database("rssbox").get_collection("things").insert_one(
+                {"_id": 2, "tags": ["a"]}
+            )
+        finally:
+            other.close()
+        self.assertEqual(self.ids({"tags": "a"}), {1, 2})
+
+    def test_documents_round_trip(self):
+        now = datetime.now(timezone.utc).replace(microsecond=123456)
+        document_id = self.collection.insert_one(
+            {"at": now, "nested": {"count": 1}}
+        ).inserted_id
+
+        self.assertIsInstance(document_id, ObjectId)
+        document = self.collection.find_one({"_id": document_id})
+        self.assertEqual(document["at"], now)
+        self.assertEqual(document["at"].tzinfo, timezone.utc)
+        self.assertEqual(self.ids({"at": {"$lte": now}}), {document_id})
+        self.assertEqual(self.ids({"at": {"$gt": now}}), set())
+        self.assertEqual(self.ids({"nested.count": 1}), {document_id})
+        self.assertEqual(self.collection.find_one({}, {"_id": 1}), {"_id": document_id})
+        self.assertEqual(
+            self.collection.find_one({}, {"nested": 1, "_id": 0}),
+            {"nested": {"count": 1}},
+        )
+
+    def test_find_one_and_update_claims_in_sort_order(self):
+        for rank in (3, 1, 2):
+            self.collection.insert_one(
+                {"_id": rank, "status": "PENDING", "rank": rank, "version": 0}
+            )
+        self.collection.create_index([("status", 1), ("rank", 1)])
+
+        claimed = [
+            self.collection.find_one_and_update(
+                {"status": "PENDING"},
+                {"$set": {"status": "PROCESSING"}, "$inc": {"version": 1}},
+                sort=[("status", 1), ("rank", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            for _ in range(4)
+        ]
+        self.assertEqual([document["_id"] for document in claimed[:3]], [1, 2, 3])
+        self.assertEqual(claimed[0]["version"], 1)
+        self.assertIsNone(claimed[3])
+
+        before = self.collection.find_one_and_update(
+            {"_id": 1}, {"$set": {"status": "DONE"}}
+        )
+        self.assertEqual(before["status"], "PROCESSING")
+
+    def test_updates(self):
+        result = self.collection.update_one(
+            {"_id": "downloads"}, {"$inc": {"counts.PENDING": 2}}, upsert=True
+        )
+        self.assertEqual(result.upserted_id, "downloads")
+        self.collection.update_one(
+            {"_id": "downloads"}, {"$inc": {"counts.PENDING": -1, "counts.DONE": 1}}
+        )
+        self.assertEqual(
+            self.collection.find_one({"_id": "downloads"})["counts"],
+            {"PENDING": 1, "DONE": 1},
+        )
+
+        result = self.collection.update_many({}, {"$set": {"counts.DONE": 1}})
+        self.assertEqual((result.matched_count, result.modified_count), (1, 0))
+        self.assertEqual(self.collection.delete_many({}).deleted_count, 1)
+
+    def test_partial_unique_index(self):
+        self.collection.create_index(
+            [("key", 1)],
+            unique=True,
+            partialFilterExpression={"key": {"$type": "string"}},
+        )
+        self.collection.insert_one({"key": "a"})
+        self.collection.insert_one({"name": "unkeyed"})
+        self.collection.insert_one({"name": "unkeyed"})
+        with self.assertRaises(DuplicateKeyError):
+            self.collection.insert_one({"key": "a"})
+        self.assertIn("key_1", self.collection.index_information())
+
+        self.collection.drop_index("key_1")
+        self.collection.insert_one({"key": "a"})
+
+    def test_ttl_index_expires_documents(self):
+        self.collection.create_index([("expire_at", 1)], expireAfterSeconds=0)
+        now = datetime.now(timezone.utc)
+        self.collection.insert_one({"_id": 1, "expire_at": now - timedelta(seconds=1)})
+        self.collection.insert_one({"_id": 2, "expire_at": now + timedelta(hours=1)})
+        self.collection.insert_one({"_id": 3, "expire_at": 0})
+
+        self.client.expired_at = 0
+        self.client.expire()
+        self.assertEqual(self.ids({}), {2, 3})
+
+    def test_capped_collection_keeps_last_documents(self):
+        history = self.database.create_collection("history", capped=True, max=3)
+        for index in range(5):
+            history.insert_one({"index": index})
+        with self.assertRaises(CollectionInvalid):
+            self.database.create_collection("history", capped=True, max=3)
+
+        newest = history.find({}, sort=[("$natural", -1)])
+        self.assertEqual([document["index"] for document in newest], [4, 3, 2])
+
+    def test_transaction_rolls_back(self):
+        with self.client.start_session() as session:
+            with self.assertRaises(RuntimeError):
+                with session.start_transaction():
+                    self.collection.insert_one({"_id": 1}, session=session)
+                    raise RuntimeError
+            with session.start_transaction():
+                self.collection.insert_one({"_id": 2}, session=session)
+        self.assertEqual(self.ids({}), {2})
+
+    def test_aggregate(self):
+        workers = self.database.get_collection("workers")
+        workers.insert_one({"_id": "live", "last_heartbeat": 10})
+        self.collection.insert_many(
+            [
+                {"_id": 1, "status": "PROCESSING", "locked_by": "live"},
+                {"_id": 2, "status": "PROCESSING", "locked_by": "gone"},
+                {"_id": 3, "status": "IDLE", "locked_by": None},
+            ]
+        )
+
+        orphaned = self.collection.aggregate(
+            [
+                {"$match": {"status": "PROCESSING"}},
+                {
+                    "$lookup": {
+                        "from": "workers",
+                        "localField": "locked_by",
+                        "foreignField": "_id",
+                        "as": "worker",
+                    }
+                },
+                {"$unwind": {"path": "$worker", "preserveNullAndEmptyArrays": True}},
+                {"$match": {"worker": {"$exists": False}}},
+                {"$project": {"_id": 1}},
+            ]
+        )
+        self.assertEqual(list(orphaned), [{"_id": 2}])
+
+        groups = self.collection.aggregate(
+            [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        )
+        self.assertEqual(
+            {group["_id"]: group["count"] for group in groups},
+            {"PROCESSING": 2, "IDLE": 1},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
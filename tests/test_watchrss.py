@@ -0,0 +1,69 @@
+import io
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import mongomock
+import requests
+
+from rssbox.modules.watchrss import WatchRSS
+
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>new</title><link>http://example.com/new</link>
+<pubDate>Mon, 02 Jan 2023 00:00:00 GMT</pubDate></item>
+</channel></rss>
+"""
+
+
+def response(status: int, body: bytes = b"", **headers) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers)
+    response.raw = io.BytesIO(body)
+    return response
+
+
+class WatchRSSTest(unittest.TestCase):
+    def setUp(self):
+        self.callback = mock.Mock(return_value=True)
+        self.watch = WatchRSS(
+            "http://example.com/rss",
+            mongomock.MongoClient().db.watchrss,
+            self.callback,
+            last_saved_on=datetime(2023, 1, 1, tzinfo=timezone.utc),
+            check_confirmation=True,
+        )
+
+    def check(self, response: requests.Response) -> dict:
+        with mock.patch(
+            "rssbox.modules.watchrss.requests.get", return_value=response
+        ) as get:
+            self.watch.check()
+        return get.call_args.kwargs["headers"]
+
+    def test_conditional_get(self):
+        headers = self.check(
+            response(200, FEED, ETag='"v1"', **{"Last-Modified": "yesterday"})
+        )
+        self.assertIn("feedparser", headers["User-Agent"])
+        self.assertNotIn("If-None-Match", headers)
+        self.assertEqual(len(self.callback.call_args.args[0]), 1)
+
+        headers = self.check(response(304, ETag='"v1"'))
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertEqual(headers["If-Modified-Since"], "yesterday")
+        self.assertEqual(self.callback.call_count, 1)
+        self.assertEqual(self.watch.errors, 0)
+
+    def test_unconfirmed_entries_are_fetched_again(self):
+        self.callback.return_value = False
+        with self.assertLogs("rssbox.modules.watchrss", "WARNING"):
+            self.check(response(200, FEED, ETag='"v1"'))
+            headers = self.check(response(200, FEED, ETag='"v1"'))
+        self.assertNotIn("If-None-Match", headers)
+        self.assertEqual(self.callback.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()